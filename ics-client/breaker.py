@@ -0,0 +1,124 @@
+"""
+Circuit breaker for calls to another service.
+While a dependency keeps failing, the breaker opens and calls fail fast
+instead of each one waiting for its timeout. After `reset_timeout` seconds
+a few trial calls are let through (half-open) and their outcome closes or
+reopens the circuit. Copy of the web app's module, used here for Gemini.
+"""
+
+import threading
+import time
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+STATES = (CLOSED, OPEN, HALF_OPEN)
+
+
+class CircuitBreaker:
+    """
+    Class tracking consecutive failures of one dependency.
+    Callers ask allow() before each call and report the outcome with
+    record_success() or record_failure().
+    """
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30, half_open_max_calls=1):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = None
+        self._half_open_at = None
+        self._trial_calls = 0
+        self.failures_total = 0
+        self.rejected_total = 0
+        self.opened_total = 0
+
+    @property
+    def state(self):
+        """
+        Returns the current state, moving an expired open circuit to half-open.
+        """
+        with self._lock:
+            self._refresh()
+            return self._state
+
+    def _refresh(self):
+        now = time.monotonic()
+        if self._state == OPEN and now - self._opened_at >= self.reset_timeout:
+            self._state = HALF_OPEN
+            self._half_open_at = now
+            self._trial_calls = 0
+        elif self._state == HALF_OPEN and now - self._half_open_at >= self.reset_timeout:
+            # A trial call whose outcome was never reported must not block the circuit forever
+            self._half_open_at = now
+            self._trial_calls = 0
+
+    def _open(self):
+        self._state = OPEN
+        self._opened_at = time.monotonic()
+        self.opened_total += 1
+
+    def allow(self):
+        """
+        Returns True if a call may go ahead. Rejected calls are counted.
+        """
+        with self._lock:
+            self._refresh()
+            if self._state == CLOSED:
+                return True
+            if self._state == HALF_OPEN and self._trial_calls < self.half_open_max_calls:
+                self._trial_calls += 1
+                return True
+            self.rejected_total += 1
+            return False
+
+    def record_success(self):
+        """
+        Report a successful call. A successful trial call closes the circuit.
+        """
+        with self._lock:
+            self._consecutive_failures = 0
+            if self._state == HALF_OPEN:
+                self._state = CLOSED
+
+    def record_failure(self):
+        """
+        Report a failed call. Opens the circuit after `failure_threshold`
+        consecutive failures, or straight away if a trial call failed.
+        """
+        with self._lock:
+            self.failures_total += 1
+            self._consecutive_failures += 1
+            if self._state == HALF_OPEN or (
+                self._state == CLOSED and self._consecutive_failures >= self.failure_threshold
+            ):
+                self._open()
+
+
+def render_metrics(breakers):
+    """
+    Returns the state and counters of the breakers in the Prometheus text format.
+    """
+    families = (
+        ("circuit_breaker_state", "gauge", "Current state of the circuit breaker, 1 for the current state."),
+        ("circuit_breaker_failures_total", "counter", "Failed calls through the circuit breaker."),
+        ("circuit_breaker_rejected_total", "counter", "Calls rejected while the circuit was open."),
+        ("circuit_breaker_opened_total", "counter", "Times the circuit opened."),
+    )
+    lines = []
+    for metric, kind, help_text in families:
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} {kind}")
+        for breaker in breakers:
+            if metric == "circuit_breaker_state":
+                current = breaker.state
+                for state in STATES:
+                    lines.append(f'{metric}{{breaker="{breaker.name}",state="{state}"}} {int(state == current)}')
+            else:
+                value = getattr(breaker, metric[len("circuit_breaker_"):])
+                lines.append(f'{metric}{{breaker="{breaker.name}"}} {value}')
+    return "\n".join(lines) + "\n"
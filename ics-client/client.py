@@ -4,30 +4,118 @@ Module is responsible for parsing user input,
 generating the ICS event and storing it in the MongoDB.
 """
 
-from datetime import date, datetime
+from datetime import date, datetime, time, timedelta, timezone
+from functools import cache
 from zoneinfo import ZoneInfo
-from pathlib import Path
+import atexit
 import os
+import time as timer
 import uuid
 import json
 import re
-from icalendar import Calendar, Event
-from pymongo import MongoClient
+from icalendar import Alarm, Calendar, Event
+from pymongo import ASCENDING, DeleteMany, InsertOne, MongoClient, ReturnDocument, UpdateMany, UpdateOne
+from bson.errors import InvalidId
 from bson.objectid import ObjectId
 from dotenv import load_dotenv
 from google import genai
-from flask import Flask, request, jsonify
+from google.genai import types
+from flask import Flask, Response, request, jsonify
+from breaker import CircuitBreaker, render_metrics
+from profiling import init_profiling
+from conflicts import ConflictIndex, conflicts_json
+from reminders import ReminderDispatcher, make_sink
+from storage import EventFileStore, FileReconciler
+from usage import UsageRecorder
+from speculative import SpeculativeExtractor
+from generation import GenerationJobs
+from streaming import EventStreamParser, format_sse
 
 load_dotenv()
-mongo_uri = os.getenv("MONGO_URI")
-db_name = os.getenv("MONGO_DBNAME")
-client = MongoClient(mongo_uri)
-db = client[db_name]
-events_collection = db["events"]
 
-# Configure Gemini model
-key = os.getenv("GOOGLE_API_KEY")
-genai_client = genai.Client(api_key=key)
+EVENT_TIMEZONE = "America/New_York"
+RECURRENCE_FREQUENCIES = ("DAILY", "WEEKLY", "MONTHLY", "YEARLY")
+WEEKDAYS = ("MO", "TU", "WE", "TH", "FR", "SA", "SU")
+# Reminders per event, and how long before an event they can be, in minutes
+MAX_REMINDERS = 5
+MAX_REMINDER_MINUTES = 4 * 7 * 24 * 60
+# Event document fields only some generations set, unset when a regeneration leaves them out
+OPTIONAL_EVENT_FIELDS = ("series", "conflicts")
+# Words indexed for search, must match the web app's tokenizer (web-app/search.py)
+TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+# Seconds the web app waits for /run-client, set to the web app's ICS_CLIENT_TIMEOUT
+ICS_CLIENT_TIMEOUT = float(os.getenv("ICS_CLIENT_TIMEOUT", "30"))
+# Milliseconds a Gemini request may take before it counts as failed. Defaults to 40% of
+# the web app's timeout, so Gemini fails first even when a wait for a speculative
+# extraction came before the request
+GEMINI_TIMEOUT_MS = int(os.getenv("GEMINI_TIMEOUT_MS", str(int(ICS_CLIENT_TIMEOUT * 400))))
+# Seconds create_event waits for a speculative extraction that is still running. That
+# extraction is a Gemini request itself, so by default it is waited for as long as one may take
+SPECULATIVE_WAIT = float(os.getenv("SPECULATIVE_WAIT", str(GEMINI_TIMEOUT_MS / 1000)))
+GEMINI_UNAVAILABLE = {"error": "Event extraction is temporarily unavailable.", "error_code": 422}
+GEMINI_MODEL = "gemini-2.0-flash"
+QUOTA_EXCEEDED = {"error": "Daily event generation limit reached.", "error_code": 429}
+SOURCE_ENTRY_DELETED = {"error": "The entry this event was split off was deleted.", "error_code": 421}
+
+
+@cache
+def get_mongo_client():
+    """
+    Returns the MongoClient for this process, created on first use.
+    """
+    return MongoClient(os.getenv("MONGO_URI"))
+
+
+def get_database():
+    """
+    Returns the MongoDB database configured by MONGO_DBNAME.
+    """
+    return get_mongo_client()[os.getenv("MONGO_DBNAME")]
+
+
+def get_events_collection():
+    """
+    Returns the events collection.
+    """
+    return get_database()["events"]
+
+
+def get_usage_collection():
+    """
+    Returns the collection of LLM usage counters.
+    """
+    return get_database()["llm_usage"]
+
+
+@cache
+def get_genai_client():
+    """
+    Returns the Gemini client for this process, created on first use.
+    """
+    return genai.Client(
+        api_key=os.getenv("GOOGLE_API_KEY"),
+        http_options=types.HttpOptions(timeout=GEMINI_TIMEOUT_MS),
+    )
+
+
+def reset_clients():
+    """
+    Forget the cached clients so the next access creates new ones.
+    Runs in forked children, which must not reuse the parent's connections.
+    """
+    get_mongo_client.cache_clear()
+    get_genai_client.cache_clear()
+
+
+os.register_at_fork(after_in_child=reset_clients)
+
+
+def warmup():
+    """
+    Create the clients and open the MongoDB connection ahead of the first request.
+    """
+    get_mongo_client().admin.command("ping")
+    get_genai_client()
 
 
 class ICSClient:
@@ -35,8 +123,42 @@ class ICSClient:
     Class for the ICS generation client.
     """
 
-    def __init__(self):
-        pass
+    def __init__(self, events_collection=None, genai_client=None, file_store=None, gemini_breaker=None):
+        # Clients can be injected, otherwise the lazily created module clients are used
+        self._events_collection = events_collection
+        self._genai_client = genai_client
+        self.file_store = file_store or EventFileStore()
+        self.gemini_breaker = gemini_breaker or CircuitBreaker(
+            "gemini",
+            failure_threshold=int(os.getenv("GEMINI_BREAKER_THRESHOLD", "5")),
+            reset_timeout=float(os.getenv("GEMINI_BREAKER_RESET", "30")),
+        )
+        # Set up by the app to reuse extractions started while the user was typing
+        self.speculative = None
+        # Set up by the app to count tokens and latency per user and enforce quotas
+        self.usage = None
+        # Set up by the app to find the existing events a new one overlaps
+        self.conflicts = None
+        # Set up by the app to send the reminders asked for with events
+        self.reminders = None
+
+    @property
+    def events_collection(self):
+        """
+        The collection events are read from and stored in.
+        """
+        if self._events_collection is not None:
+            return self._events_collection
+        return get_events_collection()
+
+    @property
+    def genai_client(self):
+        """
+        The Gemini client used to extract event data.
+        """
+        if self._genai_client is not None:
+            return self._genai_client
+        return get_genai_client()
 
     def create_dt_object(self, date_str, time_str):
         """
@@ -62,44 +184,172 @@ class ICSClient:
         
         return date(year=year, month=month, day=day)
 
-    def parse_text_to_event_data(self, text: str) -> dict:
+    def parse_text_to_event_data(self, text: str, user_id=None) -> dict:
         """
         parse_text_to_event_data parses input and generates data for creating the ICS file.
-        Returns event data, or error.
+        Returns the data of the first event described, or error.
+        """
+        events = self.parse_text_to_events(text, user_id)
+        if isinstance(events, dict):
+            return events
+        return events[0]
+
+    def build_prompt(self, text: str) -> str:
+        """
+        build_prompt returns the extraction prompt for the user's text.
         """
         eastern_now = datetime.now(ZoneInfo("America/New_York"))
         today_str = eastern_now.strftime("%Y-%m-%d")
         app.logger.debug("*** Today's date: %s", today_str)
 
-        prompt = f"""
-        Extract event title, date (calculate calendar date from {today_str}, treat the word "next" or "nxt" as 
-        "next week", treat the word "tmr" as "tomorrow"), time, location, and implied description from: {text}
+        return f"""
+        Extract every event described in the text. For each event extract the event title, date (calculate
+        calendar date from {today_str}, treat the word "next" or "nxt" as "next week", treat the word "tmr" as
+        "tomorrow"), time, location, and implied description from: {text}
 
-        Respond only in JSON format using the following schema.
+        Respond only in JSON format using the following schema, with one entry in "events" per event.
 
         Schema:
         {{
-        "name": "string (event title, null if event title is not provided)",
-        "date": "string (null if date time is not provided, format: YYYY-MM-DD)",
-        "start_time": "string (null if start time is not provided, format: HH:MM in 24-hour time)",
-        "end_time": "string (null if end time is not provided, format: HH:MM in 24-hour time)",
-        "location": "string (null if location is not provided)",
-        "description": "string (null if description cannot be inferred)"
+        "events": [
+            {{
+            "name": "string (event title, null if event title is not provided)",
+            "date": "string (null if date time is not provided, format: YYYY-MM-DD)",
+            "start_time": "string (null if start time is not provided, format: HH:MM in 24-hour time)",
+            "end_time": "string (null if end time is not provided, format: HH:MM in 24-hour time)",
+            "location": "string (null if location is not provided)",
+            "description": "string (null if description cannot be inferred)",
+            "recurrence": {{
+                "frequency": "string (DAILY, WEEKLY, MONTHLY or YEARLY)",
+                "interval": "integer (repeat every N periods, default 1)",
+                "by_day": "list of strings (weekdays for WEEKLY repeats as MO, TU, WE, TH, FR, SA, SU, e.g. every weekday is [MO, TU, WE, TH, FR], null otherwise)",
+                "count": "integer (number of occurrences, null if not provided)",
+                "until": "string (last date of the series, format: YYYY-MM-DD, null if not provided)"
+            }} (null if the event does not repeat; "date" is then the date of the first occurrence),
+            "reminders": "list of integers (minutes before the start to remind the user, e.g. [30] for \"remind me 30 min before\", [1440] for \"a day before\", [] if no reminder is asked for)"
+            }}
+        ]
         }}
         """
+
+    def check_quota(self, user_id):
+        """
+        check_quota returns an error dict if the user has used up their daily quota, else None.
+        """
+        if self.usage is not None and not self.usage.allow(user_id):
+            app.logger.info("*** User %s is over their daily LLM quota", user_id)
+            return QUOTA_EXCEEDED
+        return None
+
+    def record_usage(self, user_id, usage_metadata, started):
+        """
+        record_usage counts the tokens and latency of a Gemini call started at `started`.
+        """
+        if self.usage is None:
+            return
+        latency_ms = (timer.monotonic() - started) * 1000
+        self.usage.record(
+            user_id,
+            GEMINI_MODEL,
+            int(getattr(usage_metadata, "prompt_token_count", None) or 0),
+            int(getattr(usage_metadata, "candidates_token_count", None) or 0),
+            latency_ms,
+        )
+
+    def parse_text_to_events(self, text: str, user_id=None):
+        """
+        parse_text_to_events extracts all the events described in the input with a single model call.
+        Returns a list of event data dicts, or an error dict.
+        """
+        quota_error = self.check_quota(user_id)
+        if quota_error:
+            return quota_error
+        prompt = self.build_prompt(text)
         app.logger.debug("**** Prompt: %s", prompt)
-        response = genai_client.models.generate_content(model="gemini-2.0-flash", contents=prompt)
+        if not self.gemini_breaker.allow():
+            return GEMINI_UNAVAILABLE
+        started = timer.monotonic()
+        try:
+            response = self.genai_client.models.generate_content(model=GEMINI_MODEL, contents=prompt)
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            self.gemini_breaker.record_failure()
+            app.logger.error("**** Gemini request failed: %s", e)
+            return GEMINI_UNAVAILABLE
+        self.gemini_breaker.record_success()
+        self.record_usage(user_id, response.usage_metadata, started)
         app.logger.debug("**** Input Text: %s", text)
         app.logger.debug("**** Gemini Response Type: %s", type(response.text))
         app.logger.debug("**** Gemini Response: %s", response.text)
-        match = re.search(r"\{.*\}", response.text, re.DOTALL)
+        return self.parse_response_text(response.text)
+
+    def stream_text_to_events(self, text: str, user_id=None):
+        """
+        stream_text_to_events extracts the events like parse_text_to_events, but with the
+        streaming API. Yields the EventStreamParser updates as the answer arrives, then
+        ("result", events) with the same list of event data dicts or error dict.
+        """
+        quota_error = self.check_quota(user_id)
+        if quota_error:
+            yield ("result", quota_error)
+            return
+        prompt = self.build_prompt(text)
+        parser = EventStreamParser()
+        if not self.gemini_breaker.allow():
+            yield ("result", GEMINI_UNAVAILABLE)
+            return
+        started = timer.monotonic()
+        usage_metadata = None
+        try:
+            for chunk in self.genai_client.models.generate_content_stream(model=GEMINI_MODEL, contents=prompt):
+                # The final chunk carries the token counts of the whole answer
+                usage_metadata = getattr(chunk, "usage_metadata", None) or usage_metadata
+                yield from parser.feed(chunk.text)
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            self.gemini_breaker.record_failure()
+            app.logger.error("**** Gemini stream failed: %s", e)
+            yield ("result", GEMINI_UNAVAILABLE)
+            return
+        self.gemini_breaker.record_success()
+        self.record_usage(user_id, usage_metadata, started)
+        app.logger.debug("**** Gemini Streamed Response: %s", parser.buffer)
+        yield ("result", self.parse_response_text(parser.buffer))
+
+    def parse_response_text(self, response_text: str):
+        """
+        parse_response_text parses the model's JSON answer.
+        Accepts {"events": [...]} as well as a single event object.
+        Returns a list of event data dicts, or an error dict.
+        """
+        match = re.search(r"\{.*\}", response_text, re.DOTALL)
         if not match:
             print("No JSON detected in response.")
             return {"error": "No valid event extracted", "error_code": 401}
 
         try:
-            event_data = json.loads(match.group(0))
-            app.logger.debug("***Parsed event data: %s", json.dumps(event_data, indent=2))
+            parsed = json.loads(match.group(0))
+            app.logger.debug("***Parsed event data: %s", json.dumps(parsed, indent=2))
+            items = parsed["events"] if "events" in parsed else [parsed]
+        except (json.JSONDecodeError, TypeError) as e:
+            print("Failed to parse event JSON:", e)
+            return {"error": "Invalid event format", "error_code": 403}
+
+        if not items:
+            return {"error": "No valid event extracted", "error_code": 401}
+
+        events = []
+        for item in items:
+            event_data = self.parse_event_item(item)
+            if "error" in event_data:
+                return event_data
+            events.append(event_data)
+        return events
+
+    def parse_event_item(self, event_data: dict) -> dict:
+        """
+        parse_event_item converts one extracted event into event data for the ICS file.
+        Returns event data, or error.
+        """
+        try:
             date = event_data["date"]
             start_time = event_data.get("start_time")
             app.logger.debug("**** date= %s, start_time= %s", date, start_time)
@@ -120,73 +370,362 @@ class ICSClient:
                 "end": end_dt,
                 "location": event_data.get("location"),
                 "description": event_data.get("description"),
+                "recurrence": self.parse_recurrence(event_data.get("recurrence")),
+                "reminders": self.parse_reminders(event_data.get("reminders")),
             }
             app.logger.debug("***Result dict: %s", result)
             return result
 
-        except (json.JSONDecodeError, KeyError, TypeError, ValueError) as e:
+        except (KeyError, TypeError, ValueError, AttributeError) as e:
             print("Failed to parse event JSON:", e)
             return {"error": "Invalid event format", "error_code": 403}
 
+    def parse_recurrence(self, recurrence):
+        """
+        parse_recurrence validates the recurrence extracted by the model.
+        Returns a normalized rule dict (freq, interval, byday, count, until), or None.
+        Raises ValueError if the rule is malformed.
+        """
+        if not recurrence:
+            return None
+
+        freq = str(recurrence.get("frequency") or "").upper()
+        if freq not in RECURRENCE_FREQUENCIES:
+            raise ValueError(f"Unknown recurrence frequency: {freq}")
+
+        interval = int(recurrence.get("interval") or 1)
+        if interval < 1:
+            raise ValueError("Recurrence interval must be positive")
+
+        byday = [day.upper() for day in recurrence.get("by_day") or []]
+        if any(day not in WEEKDAYS for day in byday):
+            raise ValueError(f"Unknown recurrence weekdays: {byday}")
+
+        count = recurrence.get("count")
+        count = int(count) if count not in ("None", "null", "", None) else None
+
+        until = recurrence.get("until")
+        until = date.fromisoformat(until).isoformat() if until not in ("None", "null", "", None) else None
+
+        return {
+            "freq": freq,
+            "interval": interval,
+            "byday": sorted(byday, key=WEEKDAYS.index) if freq == "WEEKLY" else [],
+            "count": count,
+            "until": until,
+        }
+
+    def parse_reminders(self, reminders):
+        """
+        parse_reminders validates the reminders extracted by the model.
+        Returns the distinct minutes before the start to remind at, in ascending order.
+        Raises ValueError if they are malformed.
+        """
+        if not reminders:
+            return []
+        minutes = sorted({int(value) for value in reminders})
+        if minutes[0] < 0 or minutes[-1] > MAX_REMINDER_MINUTES:
+            raise ValueError(f"Reminders out of range: {minutes}")
+        if len(minutes) > MAX_REMINDERS:
+            raise ValueError(f"Too many reminders: {minutes}")
+        return minutes
+
+    def until_datetime(self, recurrence, start):
+        """
+        Returns the UNTIL of a rule as a value matching the type of the event start:
+        a date for all-day events, otherwise the end of that day in UTC.
+        """
+        if not recurrence or not recurrence.get("until"):
+            return None
+        until = date.fromisoformat(recurrence["until"])
+        if not isinstance(start, datetime):
+            return until
+        local_end = datetime.combine(until, time(23, 59, 59), tzinfo=start.tzinfo or ZoneInfo(EVENT_TIMEZONE))
+        return local_end.astimezone(timezone.utc)
+
+    def build_rrule(self, recurrence, start):
+        """
+        Returns the RRULE value for a normalized recurrence dict.
+        """
+        rrule = {"freq": recurrence["freq"]}
+        if recurrence["interval"] > 1:
+            rrule["interval"] = recurrence["interval"]
+        if recurrence["byday"]:
+            rrule["byday"] = recurrence["byday"]
+        if recurrence["count"]:
+            rrule["count"] = recurrence["count"]
+        elif recurrence["until"]:
+            rrule["until"] = self.until_datetime(recurrence, start)
+        return rrule
+
+    def series_fields(self, event_data):
+        """
+        Returns the machine-readable description of a recurring event used to expand
+        its occurrences: the rule, first start and until in UTC, and duration in seconds.
+        """
+        recurrence = event_data["recurrence"]
+        start = event_data["start"]
+        end = event_data.get("end")
+        all_day = not isinstance(start, datetime)
+
+        if all_day:
+            dtstart = self.local_midnight(start)
+            duration = 24 * 60 * 60
+        else:
+            dtstart = start.astimezone(timezone.utc).replace(tzinfo=None)
+            duration = int((end - start).total_seconds()) if isinstance(end, datetime) else 0
+
+        until = self.until_datetime(recurrence, start)
+        if isinstance(until, datetime):
+            until = until.replace(tzinfo=None)
+        elif until is not None:
+            # The last second of the UNTIL day, which is included like the RRULE's UNTIL
+            until = self.local_midnight(until + timedelta(days=1)) - timedelta(seconds=1)
+
+        return {
+            "rule": recurrence,
+            "dtstart": dtstart,
+            "until": until,
+            "duration": duration,
+            "all_day": all_day,
+            "timezone": EVENT_TIMEZONE,
+        }
+
+    def search_terms(self, event_data):
+        """
+        search_terms returns the lowercased words of the event name, description
+        and location, and those of the name alone, for the web app's search.
+        """
+        def words(value):
+            return TOKEN_PATTERN.findall(str(value).lower()) if value else []
+
+        name_terms = sorted(set(words(event_data.get("name"))))
+        terms = set(name_terms)
+        for field in ("description", "location"):
+            terms.update(words(event_data.get(field)))
+        return sorted(terms), name_terms
+
+    def local_midnight(self, day):
+        """
+        Returns the start of a day in the event timezone, as naive UTC.
+        """
+        midnight = datetime.combine(day, time(), tzinfo=ZoneInfo(EVENT_TIMEZONE))
+        return midnight.astimezone(timezone.utc).replace(tzinfo=None)
+
     def format_event_data(self, data):
         """
-        Formats each value in the event data dictionary as a string for database storage.
+        Converts event data for database storage, so events can be sorted and
+        filtered by when they happen. Datetimes are stored as naive UTC, dates
+        as the UTC time of their local midnight with all_day set, so all-day and
+        timed events compare correctly, and timezone names the zone the event
+        was extracted in. The web app formats them at render time.
         """
-        str_event_data = {}
+        stored_event_data = {}
         for key, value in data.items():
             if isinstance(value, datetime):
-                str_event_data[key] = value.strftime("%b %d, %Y %l:%M%p")
+                if value.tzinfo is None:
+                    value = value.replace(tzinfo=ZoneInfo(EVENT_TIMEZONE))
+                stored_event_data[key] = value.astimezone(timezone.utc).replace(tzinfo=None)
             elif isinstance(value, date):
-                str_event_data[key] = value.strftime("%b %d, %Y")
+                stored_event_data[key] = self.local_midnight(value)
             else:
-                str_event_data[key] = value
+                stored_event_data[key] = value
+
+        if isinstance(data.get("start"), date) and not isinstance(data.get("start"), datetime):
+            stored_event_data["all_day"] = True
+        stored_event_data["timezone"] = EVENT_TIMEZONE
 
         # Default event name to "New Event" if none is provided
-        if not str_event_data.get("name"):
-            str_event_data["name"] = "New Event"
+        if not stored_event_data.get("name"):
+            stored_event_data["name"] = "New Event"
+
+        return stored_event_data
+
+    def event_fields(self, event_data, ics_content, ics_file_path, conflicts=None):
+        """
+        event_fields returns the fields stored on an event document.
+        conflicts lists the existing events it overlaps, if they were checked.
+        """
+        formatted = self.format_event_data(event_data)
+        search_terms, name_terms = self.search_terms(formatted)
+        fields = {
+            "event_data": formatted,
+            "search_terms": search_terms,
+            "name_terms": name_terms,
+            "ics_file": ics_content,
+            "ics_file_path": str(ics_file_path),
+            "updated_at": datetime.now(timezone.utc),
+        }
+        if event_data.get("recurrence"):
+            fields["series"] = self.series_fields(event_data)
+        if conflicts is not None:
+            fields["conflicts"] = conflicts
+        return fields
+
+    def event_update(self, fields):
+        """
+        event_update returns the update storing fields on an existing event document.
+        The optional fields they leave out are unset, so an event regenerated without
+        a recurrence or conflicts does not keep the old ones.
+        """
+        update = {"$set": fields}
+        unset = {key: "" for key in OPTIONAL_EVENT_FIELDS if key not in fields}
+        if unset:
+            update["$unset"] = unset
+        return update
+
+    def bump_feed_version(self, user_id):
+        """
+        bump_feed_version marks the user's subscription feed as changed.
+        Returns the new feed_version, or None without a user.
+        """
+        if user_id is None:
+            return None
+        user = self.events_collection.database["users"].find_one_and_update(
+            {"_id": user_id},
+            {"$inc": {"feed_version": 1}},
+            projection={"feed_version": 1},
+            return_document=ReturnDocument.AFTER,
+        )
+        return (user or {}).get("feed_version")
+
+    def find_conflicts(self, entry_id, user_id, events):
+        """
+        find_conflicts returns, for each extracted event, the user's existing events it overlaps,
+        or None if conflicts are not checked.
+        """
+        if self.conflicts is None:
+            return None
+        stored = [self.format_event_data(event_data) for event_data in events]
+        return self.conflicts.find(user_id, stored, ObjectId(entry_id))
+
+    def index_events(self, entry_id, user_id, version, stored, removed_ids=()):
+        """
+        index_events adds events this process just stored to the cached conflict index.
+        stored is a list of (event id, stored event data), removed_ids the events the write deleted.
+        """
+        if self.conflicts is not None and user_id is not None:
+            self.conflicts.record(user_id, version, stored, ObjectId(entry_id), removed_ids)
 
-        return str_event_data
+    def split_off_ids(self, entry_id):
+        """
+        split_off_ids returns the ids of the event documents split off an entry, oldest first.
+        """
+        docs = self.events_collection.find({"source_entry_id": ObjectId(entry_id)}, {"_id": 1})
+        return [doc["_id"] for doc in docs.sort("_id", ASCENDING)]
 
-    def store_event(self, entry_id, event_data, ics_file_path):
+    def removal_operations(self, user_id, event_ids):
+        """
+        removal_operations returns the bulk write operations deleting split-off events
+        an entry no longer has, and dropping them from the conflicts of the user's other events.
+        """
+        event_ids = list(event_ids)
+        return [
+            DeleteMany({"_id": {"$in": event_ids}}),
+            UpdateMany({"user_id": user_id, "conflicts.id": {"$in": event_ids}},
+                       {"$pull": {"conflicts": {"id": {"$in": event_ids}}}}),
+        ]
+
+    def schedule_reminders(self, user_id, stored):
+        """
+        schedule_reminders hands the reminders of events this process just stored to the dispatcher.
+        stored is a list of (event id, stored fields). Reminders of an event stored again
+        without them are cancelled when they come due.
         """
-        store_event method stores the event object in the MongoDB.
+        if self.reminders is None or not any(fields["event_data"].get("reminders") for _, fields in stored):
+            return
+        self.reminders.schedule(
+            user_id, [(event_id, fields["event_data"], fields.get("series")) for event_id, fields in stored]
+        )
+
+    def store_event(self, entry_id, event_data, ics_file_path, user_id=None, conflicts=None, split_off_ids=()):
+        """
+        store_event method stores the event object in the MongoDB,
+        and marks the owner's subscription feed as changed.
+        split_off_ids are the events split off the entry by an earlier generation, which are deleted.
         Method does not return.
         """
 
         with open(ics_file_path, "rb") as ics_file:
             ics_content = ics_file.read()
-            events_collection.update_one(
+            fields = self.event_fields(event_data, ics_content, ics_file_path, conflicts)
+            # The updated entry gives the owner when the caller did not pass it, without another read
+            entry = self.events_collection.find_one_and_update(
                 {"_id": ObjectId(entry_id)},
-                {
-                    "$set": {
-                        "event_data": self.format_event_data(event_data),
-                        "ics_file": ics_content,
-                        "ics_file_path": str(ics_file_path),
-                    }
-                }
+                self.event_update(fields),
+                projection={"user_id": 1},
+                return_document=ReturnDocument.AFTER,
             )
+        if entry is None:
+            app.logger.info("*** store_event(): entry %s was deleted during generation", entry_id)
+            return
+        if user_id is None:
+            user_id = entry.get("user_id")
+        if split_off_ids:
+            self.events_collection.bulk_write(self.removal_operations(user_id, split_off_ids), ordered=False)
+        version = self.bump_feed_version(user_id)
+        self.index_events(entry_id, user_id, version, [(ObjectId(entry_id), fields["event_data"])], split_off_ids)
+        self.schedule_reminders(user_id, [(ObjectId(entry_id), fields)])
         print(f".ICS stored in MongoDB with ID: {entry_id}")
 
-    def create_event(self, entry_id: str) -> bool:
+    def store_events(self, entry_id, events, ics_file_path, user_id=None, text=None, conflicts=None,
+                     split_off_ids=()):
         """
-        create_event method creates the event object from an entry in the database.
-        Returns:
-            tuple: (bool, error dict)
-            bool is True if the .ics file was created and stored successfully, False if the entry has no text.
+        store_events stores several events extracted from one entry in a single bulk write.
+        The entry document gets the first event, each other one goes to a document split off
+        the entry: one of split_off_ids, left by an earlier generation, or else a new one.
+        Split-off documents left over are deleted.
+        events is a list of (event data, ics file content) tuples, conflicts the list of
+        existing events each one overlaps, if they were checked.
+        Returns the ids of the event documents, entry first.
         """
-        doc = events_collection.find_one({"_id": ObjectId(entry_id)}, {"text": 1})
-        text = doc.get("text")
+        entry_id = ObjectId(entry_id)
+        created_at = datetime.now()
+        ids = [entry_id]
+        stored = []
+        operations = []
+        reused = list(split_off_ids[:len(events) - 1])
+        removed = list(split_off_ids[len(events) - 1:])
+        for index, (event_data, ics_content) in enumerate(events):
+            fields = self.event_fields(
+                event_data, ics_content, ics_file_path, conflicts[index] if conflicts is not None else None
+            )
+            if index == 0:
+                stored.append((entry_id, fields))
+                operations.append(UpdateOne({"_id": entry_id}, self.event_update(fields)))
+                continue
+            if index <= len(reused):
+                ids.append(reused[index - 1])
+                stored.append((reused[index - 1], fields))
+                operations.append(UpdateOne({"_id": reused[index - 1]}, self.event_update(fields)))
+                continue
+            doc = {
+                "_id": ObjectId(),
+                "user_id": user_id,
+                "text": text,
+                "created_at": created_at,
+                "source_entry_id": entry_id,
+                **fields,
+            }
+            ids.append(doc["_id"])
+            stored.append((doc["_id"], fields))
+            operations.append(InsertOne(doc))
 
-        if not text:
-            return (False, {"error": "No text found in the entry.", "error_code": 421})
-        
-        app.logger.debug("*** create_event(): Found entry_text: %s", text)
-        event_data = self.parse_text_to_event_data(text)
+        if removed:
+            operations.extend(self.removal_operations(user_id, removed))
 
-        if "error" in event_data:
-            return (False, event_data)
+        self.events_collection.bulk_write(operations, ordered=False)
+        version = self.bump_feed_version(user_id)
+        self.index_events(entry_id, user_id, version,
+                          [(event_id, fields["event_data"]) for event_id, fields in stored], removed)
+        self.schedule_reminders(user_id, stored)
+        print(f".ICS stored in MongoDB with IDs: {ids}")
+        return ids
 
-        cal = Calendar()
+    def build_vevent(self, event_data) -> Event:
+        """
+        build_vevent creates the VEVENT component for one event.
+        """
         event = Event()
 
         summary = event_data["name"]
@@ -206,34 +745,202 @@ class ICSClient:
         loc = event_data["location"]
         if loc is not None:
             event.add("location", loc)
+        recurrence = event_data.get("recurrence")
+        if recurrence:
+            event.add("rrule", self.build_rrule(recurrence, start))
+        for minutes in event_data.get("reminders") or []:
+            alarm = Alarm()
+            alarm.add("action", "DISPLAY")
+            alarm.add("description", summary or "New Event")
+            alarm.add("trigger", timedelta(minutes=-minutes))
+            event.add_component(alarm)
         event.add("uid", str(uuid.uuid4()))
         event.add("dtstamp", datetime.now(ZoneInfo("America/New_York")))
+        return event
+
+    def load_entry(self, entry_id, text=None, user_id=None):
+        """
+        load_entry returns the entry's text and owner. The web app sends them along
+        with the request, the entry is only read from the database when it did not.
+        An event split off another entry holds that entry's whole text, so its
+        source entry is returned instead, to be regenerated with all its events.
+        If the source entry was deleted, the split-off event is returned.
+        """
+        if text:
+            return {"_id": ObjectId(entry_id), "text": text, "user_id": user_id}
+        projection = {"text": 1, "user_id": 1, "source_entry_id": 1, "ics_file_path": 1}
+        doc = self.events_collection.find_one({"_id": ObjectId(entry_id)}, projection)
+        if doc and doc.get("source_entry_id"):
+            return self.events_collection.find_one({"_id": doc["source_entry_id"]}, projection) or doc
+        return doc
+
+    def create_event(self, entry_id: str, text=None, user_id=None) -> tuple:
+        """
+        create_event method creates the event objects from an entry in the database.
+        All events described in the entry go into one calendar file, and each is stored
+        as its own event document. text and user_id save reading the entry if given.
+        An event split off an entry is regenerated by regenerating that entry.
+        Returns:
+            tuple: (bool, dict)
+            bool is True if the .ics file was created and stored successfully, False otherwise.
+            dict is the error on failure, or lists the stored entry_ids if the entry held several events.
+        """
+        doc = self.load_entry(entry_id, text, user_id) or {}
+        text = doc.get("text")
+
+        if not text:
+            return (False, {"error": "No text found in the entry.", "error_code": 421})
+        if doc.get("source_entry_id"):
+            return (False, SOURCE_ENTRY_DELETED)
+        source_id = str(doc.get("_id", entry_id))
+        
+        app.logger.debug("*** create_event(): Found entry_text: %s", text)
+        events = self.take_speculative(doc, text)
+        if events is None:
+            events = self.parse_text_to_events(text, doc.get("user_id"))
 
-        cal.add_component(event)
+        if isinstance(events, dict):
+            return (False, events)
+        result = self.save_events(source_id, doc, events)
+        if source_id != str(entry_id):
+            # The entry the event was split off was regenerated instead
+            result = {"entry_ids": [source_id], **(result or {})}
+        return (True, result)
+
+    def create_event_stream(self, entry_id: str, text=None, user_id=None):
+        """
+        create_event_stream does the same as create_event, but streams the model's answer.
+        Yields (event, data) progress messages:
+            ("status", ...) when extraction starts,
+            ("field", ...) and ("event", ...) as fields and events are extracted,
+            then ("done", {"entry_ids": [...]}) or ("error", {"error": ..., "error_code": ...}).
+        """
+        doc = self.load_entry(entry_id, text, user_id) or {}
+        text = doc.get("text")
+
+        if not text:
+            yield ("error", {"error": "No text found in the entry.", "error_code": 421})
+            return
+        if doc.get("source_entry_id"):
+            yield ("error", SOURCE_ENTRY_DELETED)
+            return
+        entry_id = str(doc.get("_id", entry_id))
 
-        ics_path = Path(f"./events/{entry_id}.ics")
-        app.logger.debug("*** create_event(): ics_path=%s", ics_path)
+        yield ("status", {"status": "extracting"})
+        events = self.take_speculative(doc, text)
+        if events is None:
+            for update in self.stream_text_to_events(text, doc.get("user_id")):
+                if update[0] == "field":
+                    yield ("field", {"index": update[1], "field": update[2], "value": update[3]})
+                elif update[0] == "event":
+                    yield ("event", {"index": update[1], "event": update[2]})
+                else:
+                    events = update[1]
 
-        # Check if /events folder is created. If not, create one
-        ics_path.parent.mkdir(parents=True, exist_ok=True)
-        app.logger.debug("Current working directory: %s", os.getcwd())
-        with open(ics_path, "wb") as f:
-            f.write(cal.to_ical())
-            app.logger.debug("*** create_event(): event saved to file")
+        if isinstance(events, dict):
+            yield ("error", events)
+            return
 
-        self.store_event(entry_id, event_data, ics_path)
-        return (True, None)
+        yield ("status", {"status": "saving"})
+        result = self.save_events(entry_id, doc, events) or {}
+        yield ("done", {"entry_ids": result.get("entry_ids", [entry_id]), "conflicts": result.get("conflicts", {})})
+
+    def take_speculative(self, doc, text):
+        """
+        take_speculative returns the speculative extraction of the entry's text, or None.
+        """
+        if self.speculative is None:
+            return None
+        events = self.speculative.take(doc.get("user_id"), text, timeout=SPECULATIVE_WAIT)
+        app.logger.debug("*** create_event(): speculative result used: %s", events is not None)
+        return events
+
+    def save_events(self, entry_id, doc, events):
+        """
+        save_events writes the calendar file of the extracted events and stores them.
+        Returns None for a single event without conflicts, otherwise a dict listing the
+        stored entry_ids if there were several, and the conflicts of each event if any.
+        """
+        # Checked before storing, against the events as they were before this entry
+        conflicts = self.find_conflicts(entry_id, doc.get("user_id"), events)
+        # A regenerated entry may have events split off it already, which are replaced
+        split_off_ids = self.split_off_ids(entry_id) if doc.get("ics_file_path") else []
+
+        cal = Calendar()
+        vevents = [self.build_vevent(event_data) for event_data in events]
+        for vevent in vevents:
+            cal.add_component(vevent)
+
+        # Write to the entry's shard under ./events, creating it if needed
+        ics_path = self.file_store.write(entry_id, cal.to_ical())
+        app.logger.debug("*** create_event(): %s event(s) saved to file %s", len(events), ics_path)
+
+        if len(events) == 1:
+            self.store_event(entry_id, events[0], ics_path, doc.get("user_id"),
+                             conflicts[0] if conflicts is not None else None, split_off_ids)
+            return {"conflicts": conflicts_json([entry_id], conflicts)} if any(conflicts or ()) else None
+
+        # Each document keeps a calendar with just its own event, for downloads and feeds
+        per_event = []
+        for event_data, vevent in zip(events, vevents):
+            single = Calendar()
+            single.add_component(vevent)
+            per_event.append((event_data, single.to_ical()))
+        ids = self.store_events(entry_id, per_event, ics_path, doc.get("user_id"), text=doc.get("text"),
+                                conflicts=conflicts, split_off_ids=split_off_ids)
+        result = {"entry_ids": [str(event_id) for event_id in ids]}
+        if any(conflicts or ()):
+            result["conflicts"] = conflicts_json(result["entry_ids"], conflicts)
+        return result
 
 app = Flask(__name__)
+# Sampling profiles of requests, including create_event, only if PROFILE_TOKEN or PROFILE_SAMPLE_RATE is set
+init_profiling(app)
 ics_client = ICSClient()
+ics_client.speculative = SpeculativeExtractor(
+    ics_client.parse_text_to_events,
+    max_workers=int(os.getenv("SPECULATIVE_WORKERS", "2")),
+    ttl=int(os.getenv("SPECULATIVE_TTL", "60")),
+    rate=float(os.getenv("SPECULATIVE_RATE", "0.5")),
+    burst=int(os.getenv("SPECULATIVE_BURST", "3")),
+)
+ics_client.usage = UsageRecorder(
+    get_usage_collection,
+    flush_interval=float(os.getenv("LLM_USAGE_FLUSH_INTERVAL", "10")),
+    daily_token_quota=int(os.getenv("LLM_DAILY_TOKEN_QUOTA", "0")),
+    daily_call_quota=int(os.getenv("LLM_DAILY_CALL_QUOTA", "0")),
+)
+ics_client.reminders = ReminderDispatcher(
+    get_database,
+    sink=make_sink(),
+    horizon=int(os.getenv("REMINDER_HORIZON", "3600")),
+)
+ics_client.conflicts = ConflictIndex(
+    get_events_collection,
+    max_users=int(os.getenv("CONFLICT_INDEX_USERS", "1000")),
+)
+# Generations run apart from the streams following them, so a closed stream does not stop one
+generation_jobs = GenerationJobs(
+    ics_client.create_event_stream,
+    max_workers=int(os.getenv("GENERATION_WORKERS", "8")),
+    ttl=int(os.getenv("GENERATION_JOB_TTL", "300")),
+)
+
+def parse_user_id(user_id):
+    """
+    Returns the ObjectId of a user id sent by the web app, or None if it sent none.
+    Raises InvalidId if it is malformed.
+    """
+    return ObjectId(user_id) if user_id else None
 
 @app.route("/run-client", methods=["POST"])
 def process_request():
     """
     Handle POST requests to generate an ICS event based on saved user input. 
+    The request may carry the entry's `text` and `user_id`, which saves reading the entry.
     Returns:
         JSON response with a status message and the updated entry_id.
-        Returns HTTP 400 if `entry_id` is missing.
+        Returns HTTP 420 if `entry_id` is missing or `user_id` is invalid.
     """
 
     data = request.get_json()
@@ -241,12 +948,145 @@ def process_request():
 
     if not entry_id:
         return jsonify({"error": "entry_id is required"}), 420
+    try:
+        user_id = parse_user_id(data.get("user_id"))
+    except InvalidId:
+        return jsonify({"error": "user_id is invalid"}), 420
     
-    result = ics_client.create_event(entry_id)
+    result = ics_client.create_event(entry_id, data.get("text"), user_id)
     if result[0]:
-        return jsonify({"status": "updated", "entry_id": entry_id})
+        entry_ids = (result[1] or {}).get("entry_ids", [entry_id])
+        conflicts = (result[1] or {}).get("conflicts", {})
+        return jsonify({"status": "updated", "entry_id": entry_id, "entry_ids": entry_ids, "conflicts": conflicts})
     err_code = result[1]["error_code"]
     return jsonify({"status": "error", "error_msg": result[1]["error"], "error_code": err_code}), err_code
 
+def start_generation_job():
+    """
+    Start the generation job of the entry in the request's JSON body, or join the one running.
+    Returns:
+        tuple: (job, None), or (None, error response) if `entry_id` is missing or `user_id` is invalid.
+    """
+    data = request.get_json(silent=True) or {}
+    entry_id = data.get("entry_id")
+
+    if not entry_id:
+        return None, (jsonify({"error": "entry_id is required"}), 420)
+    try:
+        user_id = parse_user_id(data.get("user_id"))
+    except InvalidId:
+        return None, (jsonify({"error": "user_id is invalid"}), 420)
+    return generation_jobs.start(entry_id, data.get("text"), user_id), None
+
+@app.route("/run-client/start", methods=["POST"])
+def process_request_start():
+    """
+    Handle POST requests to generate an ICS event in the background.
+    Its progress can then be followed with /run-client/stream.
+    Returns:
+        JSON response with the status "started", with HTTP 202.
+        Returns HTTP 420 if `entry_id` is missing or `user_id` is invalid.
+    """
+    _, error = start_generation_job()
+    if error:
+        return error
+    return jsonify({"status": "started"}), 202
+
+@app.route("/run-client/stream", methods=["POST"])
+def process_request_stream():
+    """
+    Handle POST requests to generate an ICS event, streaming progress as Server-Sent Events.
+    Follows the entry's generation job, started here unless /run-client/start did already.
+    Returns:
+        text/event-stream response of status, field, event, then done or error messages.
+        Returns HTTP 420 if `entry_id` is missing or `user_id` is invalid.
+    """
+    job, error = start_generation_job()
+    if error:
+        return error
+
+    def generate():
+        for event, payload in job.follow():
+            yield format_sse(event, payload)
+
+    return Response(generate(), mimetype="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@app.route("/prefetch", methods=["POST"])
+def prefetch():
+    """
+    Handle POST requests to start extracting a description speculatively,
+    before the user submits it.
+    Returns:
+        JSON response with the status: started, cached or rate_limited.
+        Returns HTTP 420 if `user_id` or `text` is missing, 429 if rate limited.
+    """
+    data = request.get_json(silent=True) or {}
+    user_id = data.get("user_id")
+    text = data.get("text")
+
+    if not user_id or not text:
+        return jsonify({"error": "user_id and text are required"}), 420
+
+    status = ics_client.speculative.submit(user_id, text)
+    return jsonify({"status": status}), 429 if status == "rate_limited" else 202
+
+@app.route("/metrics")
+def metrics():
+    """
+    Expose the circuit breaker of the Gemini hop in the Prometheus text format.
+    """
+    return Response(render_metrics([ics_client.gemini_breaker]),
+                    content_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.route("/remove-files", methods=["POST"])
+def remove_files():
+    """
+    Handle POST requests to remove the .ics files of deleted events.
+    Returns:
+        JSON response with the number of files removed.
+        Returns HTTP 420 if `entry_ids` is missing or holds an invalid id.
+    """
+    data = request.get_json(silent=True) or {}
+    entry_ids = data.get("entry_ids")
+
+    if not isinstance(entry_ids, list):
+        return jsonify({"error": "entry_ids is required"}), 420
+    if not all(isinstance(entry_id, str) and ObjectId.is_valid(entry_id) for entry_id in entry_ids):
+        return jsonify({"error": "entry_ids is invalid"}), 420
+
+    removed = sum(ics_client.file_store.remove(entry_id) for entry_id in entry_ids)
+    return jsonify({"status": "removed", "removed": removed})
+
+
+def start_file_reconciler():
+    """
+    Start the background garbage collection of .ics files, configured from the environment.
+    Returns the reconciler, or None if ICS_RECONCILE_INTERVAL is 0.
+    """
+    interval = int(os.getenv("ICS_RECONCILE_INTERVAL", "3600"))
+    if interval <= 0:
+        return None
+    reconciler = FileReconciler(
+        ics_client.file_store,
+        get_events_collection,
+        interval=interval,
+        batch_size=int(os.getenv("ICS_RECONCILE_BATCH_SIZE", "500")),
+        max_age=int(os.getenv("ICS_FILE_MAX_AGE_DAYS", "0")) * 24 * 60 * 60,
+        max_bytes=int(os.getenv("ICS_FILE_MAX_MB", "0")) * 1024 * 1024,
+    )
+    reconciler.start()
+    return reconciler
+
+
 if __name__ == "__main__":
+    if os.getenv("ICS_CLIENT_WARMUP", "1") == "1":
+        warmup()
+    # The debug reloader runs this block twice, only the serving child starts background jobs
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        start_file_reconciler()
+        ics_client.usage.start()
+        atexit.register(ics_client.usage.stop)
+        # Reminders lost with the previous process are loaded back from MongoDB at the first tick
+        ics_client.reminders.start()
+        atexit.register(ics_client.reminders.stop)
     app.run(host="0.0.0.0", port=5001, debug=True)
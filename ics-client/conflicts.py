@@ -0,0 +1,235 @@
+"""
+Conflict detection.
+A user's events are kept in a static interval tree: the events sorted by
+start, with each node of the implicit balanced tree over that array holding
+the latest end in its subtree, so the events overlapping a time range are
+found in O(log n + k). Trees are cached per user under the user's
+feed_version, which every write to their events bumps. A tree is rebuilt
+from one scan of the (user_id, event_data.start) index when the version
+moved on, except after this process's own writes, which are applied to the
+cached tree directly.
+"""
+
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from pymongo import ASCENDING
+from pymongo.errors import PyMongoError
+
+logger = logging.getLogger(__name__)
+
+# Length given to events without an end, so they still overlap events covering their start
+INSTANT = timedelta(seconds=1)
+ALL_DAY = timedelta(days=1)
+
+
+def event_interval(event_data):
+    """
+    Returns the [start, end) interval of stored event data, or None if it has no start.
+    """
+    start = (event_data or {}).get("start")
+    if not isinstance(start, datetime):
+        return None
+    end = event_data.get("end")
+    if not isinstance(end, datetime) or end <= start:
+        end = start + (ALL_DAY if event_data.get("all_day") else INSTANT)
+    return start, end
+
+
+def conflict_summary(event_id, event_data):
+    """
+    Returns what is kept about a conflicting event, enough to name it and show when it is.
+    """
+    return {
+        "id": event_id,
+        "name": event_data.get("name"),
+        "start": event_data.get("start"),
+        "all_day": bool(event_data.get("all_day")),
+        "timezone": event_data.get("timezone"),
+    }
+
+
+def conflicts_json(event_ids, conflicts):
+    """
+    Returns the conflicts of newly stored events for a JSON response: the summaries
+    of the events each one overlaps, by its id, with times in ISO 8601 UTC.
+    Events without conflicts are left out.
+    """
+    return {
+        str(event_id): [
+            {
+                **summary,
+                "id": str(summary["id"]),
+                "start": summary["start"].isoformat() + "Z" if summary.get("start") else None,
+            }
+            for summary in event_conflicts
+        ]
+        for event_id, event_conflicts in zip(event_ids, conflicts)
+        if event_conflicts
+    }
+
+
+class IntervalTree:
+    """
+    Class answering overlap queries over a fixed set of intervals.
+    items is a list of (start, end, item) tuples.
+    """
+
+    def __init__(self, items=()):
+        self._items = sorted(items, key=lambda entry: entry[:2])
+        self._max_end = [end for _, end, _ in self._items]
+        self._augment(0, len(self._items))
+
+    def __len__(self):
+        return len(self._items)
+
+    def _augment(self, lo, hi):
+        """
+        Sets the latest end of the subtree over items[lo:hi], rooted at its middle, and returns it.
+        """
+        if lo >= hi:
+            return None
+        mid = (lo + hi) // 2
+        for child in (self._augment(lo, mid), self._augment(mid + 1, hi)):
+            if child is not None and child > self._max_end[mid]:
+                self._max_end[mid] = child
+        return self._max_end[mid]
+
+    def overlapping(self, start, end):
+        """
+        Returns the items whose interval overlaps [start, end), in start order.
+        """
+        found = []
+        stack = [(0, len(self._items))]
+        while stack:
+            lo, hi = stack.pop()
+            if lo >= hi:
+                continue
+            mid = (lo + hi) // 2
+            if self._max_end[mid] <= start:
+                # Nothing in this subtree ends after the range starts
+                continue
+            stack.append((lo, mid))
+            item_start, item_end, item = self._items[mid]
+            if item_start < end:
+                if item_end > start:
+                    found.append((item_start, item_end, item))
+                stack.append((mid + 1, hi))
+        found.sort(key=lambda entry: entry[:2])
+        return [item for _, _, item in found]
+
+    def replaced(self, items, removed_ids=()):
+        """
+        Returns a new tree with the items of removed_ids and of the new items' ids replaced by the new items.
+        """
+        removed = set(removed_ids) | {item["id"] for _, _, item in items}
+        kept = [entry for entry in self._items if entry[2]["id"] not in removed]
+        return IntervalTree(kept + list(items))
+
+
+class ConflictIndex:
+    """
+    Class caching an interval tree of each user's events, for finding the events a new one overlaps.
+    Recurring series are left out: their stored start is only the first occurrence.
+    At most max_users trees are kept, least recently used first out.
+    """
+
+    def __init__(self, get_collection, max_users=1000):
+        self.get_collection = get_collection
+        self.max_users = max_users
+        self._lock = threading.Lock()
+        self._trees = OrderedDict()  # user_id -> (feed_version, IntervalTree)
+
+    def _feed_version(self, collection, user_id):
+        user = collection.database["users"].find_one({"_id": user_id}, {"feed_version": 1})
+        return (user or {}).get("feed_version", 0)
+
+    def _build(self, collection, user_id):
+        docs = collection.find(
+            {"user_id": user_id, "event_data.start": {"$ne": None}, "series": {"$exists": False}},
+            {"event_data": 1, "source_entry_id": 1},
+        ).sort("event_data.start", ASCENDING)
+        items = []
+        for doc in docs:
+            interval = event_interval(doc.get("event_data"))
+            if interval is not None:
+                item = conflict_summary(doc["_id"], doc["event_data"])
+                item["source_entry_id"] = doc.get("source_entry_id")
+                items.append((*interval, item))
+        return IntervalTree(items)
+
+    def _store(self, user_id, version, tree):
+        # Callers hold the lock
+        self._trees[user_id] = (version, tree)
+        self._trees.move_to_end(user_id)
+        while len(self._trees) > self.max_users:
+            self._trees.popitem(last=False)
+
+    def tree(self, user_id):
+        """
+        Returns the user's interval tree, rebuilt if their events changed since it was cached.
+        """
+        collection = self.get_collection()
+        version = self._feed_version(collection, user_id)
+        with self._lock:
+            cached = self._trees.get(user_id)
+            if cached is not None and cached[0] == version:
+                self._trees.move_to_end(user_id)
+                return cached[1]
+        # Read after the version, so a write in between only makes the next lookup rebuild again
+        tree = self._build(collection, user_id)
+        with self._lock:
+            self._store(user_id, version, tree)
+        return tree
+
+    def find(self, user_id, events, entry_id=None):
+        """
+        Returns, for each stored event data in events, the summaries of the user's events it overlaps.
+        The entry being (re)generated and the events split off it are not counted.
+        Conflicts are advisory, so a database error only means none are reported.
+        """
+        if user_id is None:
+            return [[] for _ in events]
+        try:
+            tree = self.tree(user_id)
+        except PyMongoError as e:
+            logger.warning("Could not check conflicts for user %s: %s", user_id, e)
+            return [[] for _ in events]
+
+        results = []
+        for event_data in events:
+            interval = event_interval(event_data)
+            matches = tree.overlapping(*interval) if interval is not None else []
+            results.append([
+                {key: value for key, value in item.items() if key != "source_entry_id"}
+                for item in matches
+                if entry_id is None or entry_id not in (item["id"], item["source_entry_id"])
+            ])
+        return results
+
+    def record(self, user_id, version, events, source_entry_id=None, removed_ids=()):
+        """
+        Apply this process's own write to the cached tree. version is the user's feed_version
+        after the write, events a list of (event id, stored event data) and removed_ids the events
+        it deleted; ids already in the tree are replaced. If other writes happened since the tree
+        was cached, it is dropped.
+        """
+        items = []
+        for event_id, event_data in events:
+            interval = event_interval(event_data)
+            if interval is not None and not event_data.get("recurrence"):
+                item = conflict_summary(event_id, event_data)
+                item["source_entry_id"] = None if event_id == source_entry_id else source_entry_id
+                items.append((*interval, item))
+
+        with self._lock:
+            cached = self._trees.get(user_id)
+            if cached is None:
+                return
+            if version is None or cached[0] != version - 1:
+                self._trees.pop(user_id, None)
+                return
+            self._store(user_id, version, cached[1].replaced(
+                items, [event_id for event_id, _ in events] + list(removed_ids)))
@@ -0,0 +1,102 @@
+"""
+Background generation module.
+Generating an entry runs as a job on its own thread, independently of whoever
+asked for it. Streams only follow the job's progress messages, so an entry is
+still extracted and saved if the browser never opens its stream, or leaves
+halfway through. Finished jobs are kept briefly for streams that connect late.
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+JOB_FAILED = {"error": "Error creating ICS file", "error_code": 500}
+
+
+class GenerationJob:
+    """
+    Class collecting the (event, data) progress messages of one entry's generation.
+    """
+
+    def __init__(self):
+        self.messages = []
+        self.done = False
+        self.finished_at = None
+        self._condition = threading.Condition()
+
+    def add(self, message):
+        """
+        Append a progress message and wake up the streams following the job.
+        """
+        with self._condition:
+            self.messages.append(message)
+            self._condition.notify_all()
+
+    def finish(self):
+        """
+        Mark the job as done, after its last message.
+        """
+        with self._condition:
+            self.done = True
+            self.finished_at = time.monotonic()
+            self._condition.notify_all()
+
+    def follow(self):
+        """
+        Yields every message of the job from the first one, waiting for new ones until it is done.
+        """
+        index = 0
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self.done or index < len(self.messages))
+                pending = self.messages[index:]
+                done = self.done
+            yield from pending
+            index += len(pending)
+            if done and index == len(self.messages):
+                return
+
+
+class GenerationJobs:
+    """
+    Class running one generation job per entry. generate is called with the
+    entry id, text and user id, and yields the job's (event, data) messages.
+    """
+
+    def __init__(self, generate, max_workers=8, ttl=300):
+        self.generate = generate
+        self.ttl = ttl
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="generation")
+        self._lock = threading.Lock()
+        self._jobs = {}  # entry_id -> GenerationJob
+
+    def _purge(self, now):
+        for entry_id in [entry_id for entry_id, job in self._jobs.items()
+                         if job.done and job.finished_at + self.ttl <= now]:
+            del self._jobs[entry_id]
+
+    def start(self, entry_id, text=None, user_id=None):
+        """
+        Start generating an entry, unless it is already running or finished recently.
+        Returns the entry's job.
+        """
+        with self._lock:
+            self._purge(time.monotonic())
+            job = self._jobs.get(entry_id)
+            if job is None:
+                job = self._jobs[entry_id] = GenerationJob()
+                self._executor.submit(self._run, job, entry_id, text, user_id)
+        return job
+
+    def _run(self, job, entry_id, text, user_id):
+        try:
+            for message in self.generate(entry_id, text, user_id):
+                job.add(message)
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            logger.error("Generating entry %s failed: %s", entry_id, e)
+            job.add(("error", JOB_FAILED))
+        finally:
+            job.finish()
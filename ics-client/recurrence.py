@@ -0,0 +1,123 @@
+"""
+Occurrence expansion for recurring events.
+Occurrences are generated lazily and only inside the queried window:
+the expansion jumps straight to the first period that can overlap the
+window instead of walking the series from its first instance.
+Only expand() and its helpers are copied from the web app's module, to schedule
+reminders of series here; tests/test_shared_modules.py checks they still match.
+"""
+
+from datetime import timedelta, timezone
+from zoneinfo import ZoneInfo
+
+WEEKDAYS = ("MO", "TU", "WE", "TH", "FR", "SA", "SU")
+
+
+def _ceil_div(a, b):
+    return -(-a // b)
+
+
+def _add_months(dt, months):
+    """
+    Returns dt moved by a number of months, or None if that day does not exist in the target month.
+    """
+    month_index = dt.month - 1 + months
+    year, month = dt.year + month_index // 12, month_index % 12 + 1
+    try:
+        return dt.replace(year=year, month=month)
+    except ValueError:
+        return None
+
+
+def _daily(dtstart, rule, lower):
+    """
+    Yields (index, start) from the first occurrence that can reach `lower`.
+    """
+    step = timedelta(days=rule["interval"])
+    k = max(0, _ceil_div((lower - dtstart) // timedelta(seconds=1), step // timedelta(seconds=1)))
+    while True:
+        yield k, dtstart + k * step
+        k += 1
+
+
+def _weekly(dtstart, rule, lower):
+    """
+    Yields (index, start) for a weekly rule, one period (week) at a time.
+    Days before dtstart in its first week are not occurrences.
+    """
+    days = sorted(WEEKDAYS.index(day) for day in rule["byday"]) or [dtstart.weekday()]
+    week0 = dtstart - timedelta(days=dtstart.weekday())
+    step = timedelta(weeks=rule["interval"])
+    first_period = [day for day in days if day >= dtstart.weekday()]
+
+    period = max(0, (lower - week0) // step)
+    while True:
+        week = week0 + period * step
+        if period == 0:
+            index, period_days = 0, first_period
+        else:
+            index, period_days = len(first_period) + (period - 1) * len(days), days
+        for offset, day in enumerate(period_days):
+            yield index + offset, week + timedelta(days=day)
+        period += 1
+
+
+def _monthly(dtstart, rule, lower, months_per_period):
+    """
+    Yields (index, start) for monthly and yearly rules.
+    Periods whose day does not exist (e.g. Feb 30) are skipped and not counted.
+    While the day exists in every month the first period is computed directly,
+    otherwise the skipped periods have to be walked to keep COUNT right.
+    """
+    step = rule["interval"] * months_per_period
+    period = 0
+    if dtstart.day <= 28 and not (months_per_period == 12 and dtstart.month == 2 and dtstart.day == 29):
+        months = (lower.year - dtstart.year) * 12 + lower.month - dtstart.month
+        period = max(0, months // step - 1)
+    index = period
+    while True:
+        start = _add_months(dtstart, period * step)
+        if start is not None:
+            yield index, start
+            index += 1
+        period += 1
+
+
+def expand(series, window_start, window_end):
+    """
+    Lazily yields (start, end) for each occurrence of a series overlapping
+    [window_start, window_end). Arguments and results are naive UTC datetimes,
+    but the rule is applied in the series' local time so occurrences keep
+    their wall-clock time across daylight saving changes.
+    """
+    rule = series["rule"]
+    duration = timedelta(seconds=series.get("duration") or 0)
+    tz = ZoneInfo(series.get("timezone") or "UTC")
+
+    def to_local(dt):
+        return dt.replace(tzinfo=timezone.utc).astimezone(tz).replace(tzinfo=None)
+
+    def to_utc(dt):
+        return dt.replace(tzinfo=tz).astimezone(timezone.utc).replace(tzinfo=None)
+
+    dtstart = to_local(series["dtstart"])
+    lower = to_local(window_start) - duration
+    upper = to_local(window_end)
+    until = to_local(series["until"]) if series.get("until") else None
+    count = rule.get("count")
+
+    if rule["freq"] == "DAILY":
+        candidates = _daily(dtstart, rule, lower)
+    elif rule["freq"] == "WEEKLY":
+        candidates = _weekly(dtstart, rule, lower)
+    else:
+        candidates = _monthly(dtstart, rule, lower, 1 if rule["freq"] == "MONTHLY" else 12)
+
+    for index, start in candidates:
+        if start >= upper or (count and index >= count) or (until and start > until):
+            return
+        start_utc = to_utc(start)
+        end_utc = start_utc + duration
+        if start_utc >= window_start or end_utc > window_start:
+            yield start_utc, end_utc
+
@@ -0,0 +1,435 @@
+"""
+Event reminders.
+Each reminder asked for when an event was described ("remind me 30 min
+before") is a document in the reminders collection, found by the
+(status, fire_at) index. Only reminders due within the next `horizon`
+seconds are held in memory, in a hierarchical timing wheel, so adding,
+cancelling and firing one is O(1) however many are pending further out.
+The wheel is refilled from MongoDB every horizon / 2 seconds. Those
+refills also pick up reminders lost with a crashed process, whose sends
+are retried after a lease. Notifications go to a pluggable sink: logging,
+or email through SMTP.
+"""
+
+import logging
+import os
+import smtplib
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from email.message import EmailMessage
+from zoneinfo import ZoneInfo
+
+from bson.objectid import ObjectId
+from pymongo import ASCENDING, DeleteMany, InsertOne, ReturnDocument
+
+from recurrence import expand
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+SENDING = "sending"
+SENT = "sent"
+MISSED = "missed"
+CANCELLED = "cancelled"
+FAILED = "failed"
+
+# How far ahead a series is searched for its next occurrence
+SERIES_LOOKAHEAD = timedelta(days=400)
+
+
+def utc_now():
+    """
+    Returns the current time as a naive UTC datetime, like the stored times.
+    """
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def to_timestamp(value):
+    """
+    Returns the POSIX timestamp of a naive UTC datetime.
+    """
+    return value.replace(tzinfo=timezone.utc).timestamp()
+
+
+class TimingWheel:
+    """
+    Class holding timers in a hierarchical timing wheel.
+    Level 0 has slots[0] slots of `tick` seconds, each higher level has slots
+    spanning a whole turn of the level below; timers move down a level when
+    the slot they are in comes up. Timers past the top level wait in an
+    overflow list until they come within range.
+    Keys can be re-added to move a timer, or removed; stale entries are skipped when they come up.
+    """
+
+    def __init__(self, tick=1.0, slots=(60, 60, 24), now=None):
+        self.tick = tick
+        self.slots = slots
+        self._units = [1]
+        for size in slots[:-1]:
+            self._units.append(self._units[-1] * size)
+        self._span = self._units[-1] * slots[-1]
+        self._wheels = [[[] for _ in range(size)] for size in slots]
+        self._overflow = []
+        self._deadlines = {}  # key -> tick it fires at
+        self._current = self._to_tick(time.time() if now is None else now)
+
+    def __len__(self):
+        return len(self._deadlines)
+
+    def __contains__(self, key):
+        return key in self._deadlines
+
+    def _to_tick(self, timestamp):
+        return int(timestamp // self.tick)
+
+    def _place(self, key, due):
+        delta = due - self._current
+        for level, size in enumerate(self.slots):
+            if delta < self._units[level] * size:
+                self._wheels[level][(due // self._units[level]) % size].append((due, key))
+                return
+        self._overflow.append((due, key))
+
+    def add(self, key, deadline):
+        """
+        Schedule key to fire at the POSIX timestamp deadline. Timers already due fire at the next advance.
+        """
+        due = max(self._to_tick(deadline), self._current + 1)
+        self._deadlines[key] = due
+        self._place(key, due)
+
+    def remove(self, key):
+        """
+        Cancel the timer of key, if any.
+        """
+        self._deadlines.pop(key, None)
+
+    def advance(self, now):
+        """
+        Move the wheel to the POSIX timestamp now. Returns the keys that came due, in deadline order.
+        """
+        target = self._to_tick(now)
+        fired = []
+        while self._current < target:
+            self._current += 1
+            # Slots of higher levels coming up move their timers down
+            for level in range(len(self.slots) - 1, 0, -1):
+                if self._current % self._units[level] == 0:
+                    if level == len(self.slots) - 1 and self._current % self._span == 0:
+                        overflow, self._overflow = self._overflow, []
+                        for due, key in overflow:
+                            self._place(key, due)
+                    slot = self._wheels[level][(self._current // self._units[level]) % self.slots[level]]
+                    entries, slot[:] = list(slot), []
+                    for due, key in entries:
+                        self._place(key, due)
+            slot = self._wheels[0][self._current % self.slots[0]]
+            entries, slot[:] = list(slot), []
+            for due, key in entries:
+                if self._deadlines.get(key) == due:
+                    del self._deadlines[key]
+                    fired.append(key)
+        return fired
+
+
+class LogSink:
+    """
+    Sink writing reminders to the log, for development and tests.
+    """
+
+    def send(self, reminder, user):
+        """
+        Log the reminder.
+        """
+        logger.info("Reminder for %s: %s", (user or {}).get("username"), reminder_text(reminder))
+
+
+class SmtpSink:
+    """
+    Sink emailing reminders through an SMTP server, e.g. a local relay or a test mail catcher.
+    Users are emailed at their email, or their username if it is an address.
+    """
+
+    def __init__(self, host="localhost", port=25, sender="reminders@localhost", timeout=10):
+        self.host = host
+        self.port = port
+        self.sender = sender
+        self.timeout = timeout
+
+    def send(self, reminder, user):
+        """
+        Email the reminder. Raises OSError or smtplib.SMTPException if it could not be sent.
+        """
+        user = user or {}
+        address = user.get("email") or (user.get("username") if "@" in (user.get("username") or "") else None)
+        if not address:
+            logger.warning("No email address for user %s, reminder %s not sent", user.get("_id"), reminder["_id"])
+            return
+        message = EmailMessage()
+        message["From"] = self.sender
+        message["To"] = address
+        message["Subject"] = f"Reminder: {reminder.get('name') or 'New Event'}"
+        message.set_content(reminder_text(reminder))
+        with smtplib.SMTP(self.host, self.port, timeout=self.timeout) as smtp:
+            smtp.send_message(message)
+
+
+def make_sink(kind=None):
+    """
+    Returns the sink configured by REMINDER_SINK (log or smtp) and the REMINDER_SMTP_* variables.
+    """
+    kind = kind or os.getenv("REMINDER_SINK", "log")
+    if kind == "smtp":
+        return SmtpSink(
+            host=os.getenv("REMINDER_SMTP_HOST", "localhost"),
+            port=int(os.getenv("REMINDER_SMTP_PORT", "25")),
+            sender=os.getenv("REMINDER_SMTP_FROM", "reminders@localhost"),
+        )
+    if kind == "log":
+        return LogSink()
+    raise ValueError(f"Unknown reminder sink: {kind}")
+
+
+def reminder_text(reminder):
+    """
+    Returns the text of a reminder, with the start in the event's timezone.
+    """
+    tz = ZoneInfo(reminder.get("timezone") or "UTC")
+    start = reminder["occurrence_start"].replace(tzinfo=timezone.utc).astimezone(tz)
+    when = start.strftime("%b %d, %Y" if reminder.get("all_day") else "%b %d, %Y %l:%M%p")
+    text = f"{reminder.get('name') or 'New Event'} starts {when}"
+    if reminder.get("location"):
+        text += f" at {reminder['location']}"
+    return text
+
+
+def next_occurrence(event_data, series, minutes, now):
+    """
+    Returns the start (naive UTC) of the next occurrence whose reminder is still ahead, or None.
+    """
+    earliest = now + timedelta(minutes=minutes)
+    if not series:
+        start = event_data.get("start")
+        return start if isinstance(start, datetime) and start >= earliest else None
+    for start, _ in expand(series, earliest, earliest + SERIES_LOOKAHEAD):
+        if start >= earliest:
+            return start
+    return None
+
+
+class ReminderDispatcher:
+    """
+    Class scheduling reminders in MongoDB and firing them through a sink from a daemon thread.
+    get_database returns the database holding the reminders, events and users collections.
+    A reminder is claimed before it is sent, so several processes can run a dispatcher;
+    a claim not settled within `lease` seconds (the process died) is retried.
+    """
+
+    def __init__(self, get_database, sink=None, tick=1.0, horizon=3600, lease=300,
+                 max_attempts=5, retry_delay=60):
+        self.get_database = get_database
+        self.sink = sink or LogSink()
+        self.tick = tick
+        self.horizon = horizon
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self._lock = threading.Lock()
+        self._wheel = TimingWheel(tick)
+        self._loaded_until = None  # fire_at up to which pending reminders are in the wheel
+        self._next_refill = 0
+        self._indexed = False
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def collection(self):
+        """
+        The reminders collection.
+        """
+        collection = self.get_database()["reminders"]
+        if not self._indexed:
+            # Pending reminders by when they fire, and the reminders of an event
+            collection.create_index([("status", ASCENDING), ("fire_at", ASCENDING)])
+            collection.create_index("event_id")
+            self._indexed = True
+        return collection
+
+    def _hold(self, reminder_id, fire_at):
+        """
+        Put a reminder in the wheel if it fires before the loaded horizon, where the next refill cannot see it.
+        """
+        with self._lock:
+            if self._loaded_until is not None and fire_at < self._loaded_until:
+                self._wheel.add(reminder_id, to_timestamp(fire_at))
+
+    def reminder_doc(self, event_id, user_id, event_data, series, minutes, now):
+        """
+        Returns the pending reminder of an event for its next occurrence, or None if none is ahead.
+        """
+        start = next_occurrence(event_data, series, minutes, now)
+        if start is None:
+            return None
+        return {
+            "_id": ObjectId(),
+            "event_id": event_id,
+            "user_id": user_id,
+            "minutes": minutes,
+            "occurrence_start": start,
+            "event_start": event_data.get("start"),
+            "fire_at": start - timedelta(minutes=minutes),
+            "status": PENDING,
+            "attempts": 0,
+            "name": event_data.get("name"),
+            "location": event_data.get("location"),
+            "all_day": bool(event_data.get("all_day")),
+            "timezone": event_data.get("timezone"),
+            "series": series,
+        }
+
+    def schedule(self, user_id, events):
+        """
+        Replace the pending reminders of stored events with their current ones, in one bulk write.
+        events is a list of (event id, stored event data, series fields or None).
+        """
+        now = utc_now()
+        operations = [DeleteMany({"event_id": {"$in": [event_id for event_id, _, _ in events]}, "status": PENDING})]
+        docs = []
+        for event_id, event_data, series in events:
+            for minutes in event_data.get("reminders") or []:
+                doc = self.reminder_doc(event_id, user_id, event_data, series, minutes, now)
+                if doc is not None:
+                    docs.append(doc)
+                    operations.append(InsertOne(doc))
+        self.collection.bulk_write(operations, ordered=True)
+        for doc in docs:
+            self._hold(doc["_id"], doc["fire_at"])
+        return docs
+
+    def refill(self):
+        """
+        Load the pending reminders due within the horizon into the wheel, overdue ones included,
+        after returning reminders whose claim expired to pending. Returns how many were added.
+        """
+        now = utc_now()
+        collection = self.collection
+        collection.update_many(
+            {"status": SENDING, "claimed_at": {"$lt": now - timedelta(seconds=self.lease)}},
+            {"$set": {"status": PENDING}},
+        )
+        loaded_until = now + timedelta(seconds=self.horizon)
+        with self._lock:
+            # Moved first, so reminders scheduled while the query runs go to the wheel directly
+            self._loaded_until = max(loaded_until, self._loaded_until or loaded_until)
+        due = collection.find(
+            {"status": PENDING, "fire_at": {"$lt": loaded_until}}, {"fire_at": 1}
+        ).sort("fire_at", ASCENDING)
+        added = 0
+        with self._lock:
+            for doc in due:
+                if doc["_id"] not in self._wheel:
+                    self._wheel.add(doc["_id"], to_timestamp(doc["fire_at"]))
+                    added += 1
+        return added
+
+    def fire(self, reminder_id):
+        """
+        Claim a due reminder and send it, unless its event is gone, changed or already started.
+        Failed sends are retried after retry_delay, up to max_attempts.
+        Returns the reminder's new status, or None if another process had claimed it.
+        """
+        now = utc_now()
+        database = self.get_database()
+        collection = self.collection
+        reminder = collection.find_one_and_update(
+            {"_id": reminder_id, "status": PENDING},
+            {"$set": {"status": SENDING, "claimed_at": now}, "$inc": {"attempts": 1}},
+            return_document=ReturnDocument.AFTER,
+        )
+        if reminder is None:
+            return None
+
+        event = database["events"].find_one(
+            {"_id": reminder["event_id"]}, {"event_data.start": 1, "event_data.reminders": 1}
+        )
+        event_data = (event or {}).get("event_data") or {}
+        if event is None or event_data.get("start") != reminder.get("event_start") \
+                or reminder["minutes"] not in (event_data.get("reminders") or []):
+            status = CANCELLED
+        elif reminder["occurrence_start"] <= now:
+            status = MISSED
+        else:
+            user = database["users"].find_one({"_id": reminder["user_id"]}, {"username": 1, "email": 1})
+            try:
+                self.sink.send(reminder, user)
+                status = SENT
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                logger.warning("Could not send reminder %s: %s", reminder_id, e)
+                status = FAILED if reminder["attempts"] >= self.max_attempts else PENDING
+
+        update = {"status": status, "settled_at": now}
+        if status == PENDING:
+            update["fire_at"] = now + timedelta(seconds=self.retry_delay)
+        collection.update_one({"_id": reminder_id}, {"$set": update})
+        if status == PENDING:
+            self._hold(reminder_id, update["fire_at"])
+        elif reminder.get("series") and status in (SENT, MISSED):
+            self._schedule_next(reminder, now)
+        return status
+
+    def _schedule_next(self, reminder, now):
+        """
+        Schedule the reminder of the next occurrence of a series.
+        """
+        event_data = {key: reminder.get(key) for key in ("name", "location", "all_day", "timezone")}
+        event_data["start"] = reminder["event_start"]
+        doc = self.reminder_doc(reminder["event_id"], reminder["user_id"], event_data, reminder["series"],
+                                reminder["minutes"], max(now, reminder["occurrence_start"] + timedelta(seconds=1)))
+        if doc is not None:
+            self.collection.insert_one(doc)
+            self._hold(doc["_id"], doc["fire_at"])
+
+    def run_once(self, now=None):
+        """
+        Refill the wheel if it is time to, then fire the reminders that came due.
+        Returns the ids of the reminders fired.
+        """
+        now = time.time() if now is None else now
+        if now >= self._next_refill:
+            self.refill()
+            self._next_refill = now + self.horizon / 2
+        with self._lock:
+            due = self._wheel.advance(now)
+        for reminder_id in due:
+            try:
+                self.fire(reminder_id)
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                # Left as claimed, retried after the lease
+                logger.warning("Could not fire reminder %s: %s", reminder_id, e)
+        return due
+
+    def _run(self):
+        while not self._stop.wait(self.tick):
+            try:
+                self.run_once()
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                logger.warning("Reminder dispatcher failed, retrying: %s", e)
+
+    def start(self):
+        """
+        Start dispatching in a daemon thread, ticking every `tick` seconds.
+        """
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="reminder-dispatcher", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        """
+        Stop the dispatcher thread.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
@@ -0,0 +1,131 @@
+"""
+Speculative extraction module.
+While the user is still typing, the web app sends the description here and
+extraction starts in the background. If the form is then submitted with the
+same text, create_event picks up the ready (or in-flight) result instead of
+calling the model again.
+"""
+
+import hashlib
+import logging
+import threading
+import time
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_text(text):
+    """
+    Collapse whitespace so trailing spaces or double spaces do not miss the cache.
+    """
+    return " ".join(str(text).split())
+
+
+class _TokenBucket:
+    """
+    Token bucket allowing `burst` requests at once and `rate` requests per second after that.
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class SpeculativeExtractor:
+    """
+    Class running speculative extractions and caching their results briefly,
+    keyed by user and text. A user has at most one speculation at a time:
+    starting a new one cancels the previous one. extract is called with the
+    text and the user id.
+    """
+
+    def __init__(self, extract, max_workers=2, ttl=60, rate=0.5, burst=3):
+        self.extract = extract
+        self.ttl = ttl
+        self.rate = rate
+        self.burst = burst
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="speculative")
+        self._lock = threading.Lock()
+        self._entries = {}  # key -> (future, expires_at)
+        self._latest = {}  # user_id -> key of the user's current speculation
+        self._buckets = {}
+
+    def key(self, user_id, text):
+        """
+        Returns the cache key for a user's text.
+        """
+        digest = hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+        return (str(user_id), digest)
+
+    def _purge(self, now):
+        for key in [key for key, (_, expires_at) in self._entries.items() if expires_at <= now]:
+            future, _ = self._entries.pop(key)
+            future.cancel()
+            if self._latest.get(key[0]) == key:
+                del self._latest[key[0]]
+
+    def submit(self, user_id, text):
+        """
+        Start extracting text for a user, superseding their previous speculation.
+        Returns "cached", "started" or "rate_limited".
+        """
+        key = self.key(user_id, text)
+        now = time.monotonic()
+        with self._lock:
+            self._purge(now)
+            if key in self._entries:
+                return "cached"
+
+            bucket = self._buckets.setdefault(key[0], _TokenBucket(self.rate, self.burst))
+            if not bucket.take():
+                return "rate_limited"
+
+            previous = self._latest.get(key[0])
+            if previous in self._entries:
+                # A queued extraction never runs, a running one finishes but its result is dropped
+                future, _ = self._entries.pop(previous)
+                future.cancel()
+
+            self._entries[key] = (self._executor.submit(self.extract, text, user_id), now + self.ttl)
+            self._latest[key[0]] = key
+        return "started"
+
+    def take(self, user_id, text, timeout=None):
+        """
+        Claim the speculative result for a user's text, waiting for it if it is still running.
+        Returns the extraction result, or None if there is no usable speculation.
+        """
+        key = self.key(user_id, text)
+        with self._lock:
+            self._purge(time.monotonic())
+            entry = self._entries.pop(key, None)
+            if self._latest.get(key[0]) == key:
+                del self._latest[key[0]]
+        if entry is None:
+            return None
+
+        try:
+            result = entry[0].result(timeout=timeout)
+        except (CancelledError, FutureTimeoutError):
+            return None
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            logger.warning("Speculative extraction failed: %s", e)
+            return None
+
+        # Errors may be transient, only successful extractions are reused
+        if isinstance(result, dict) and "error" in result:
+            return None
+        return result
@@ -0,0 +1,198 @@
+"""
+Storage module for the generated .ics files.
+Files are spread over sharded subdirectories, removed when their event
+is deleted, and garbage-collected by a background reconciler.
+"""
+
+import hashlib
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from bson.objectid import ObjectId
+from bson.errors import InvalidId
+
+logger = logging.getLogger(__name__)
+
+EVENTS_DIR = os.getenv("ICS_EVENTS_DIR", "./events")
+
+
+class EventFileStore:
+    """
+    Class mapping event entry ids to .ics files on disk.
+    Files live in two levels of shard directories, e.g. ./events/3f/a2/<entry_id>.ics,
+    so no single directory grows without bound.
+    """
+
+    def __init__(self, root=EVENTS_DIR):
+        self.root = Path(root)
+
+    def path_for(self, entry_id) -> Path:
+        """
+        Returns the sharded path of the .ics file for an entry.
+        The shard comes from a hash of the id, since the leading bytes of an
+        ObjectId are a timestamp and would put a whole period in one directory.
+        """
+        entry_id = str(entry_id)
+        digest = hashlib.md5(entry_id.encode("utf-8")).hexdigest()
+        return self.root / digest[:2] / digest[2:4] / f"{entry_id}.ics"
+
+    def write(self, entry_id, content: bytes) -> Path:
+        """
+        Write the .ics content for an entry, creating its shard directory if needed.
+        Returns the path written.
+        """
+        path = self.path_for(entry_id)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(content)
+        return path
+
+    def remove(self, entry_id) -> bool:
+        """
+        Remove the .ics file for an entry, from its shard or the legacy flat layout.
+        Returns True if a file was removed.
+        Raises InvalidId if entry_id is not an ObjectId, so it cannot name a path outside the store.
+        """
+        entry_id = str(ObjectId(entry_id))
+        removed = False
+        for path in (self.path_for(entry_id), self.root / f"{entry_id}.ics"):
+            try:
+                path.unlink()
+                removed = True
+            except FileNotFoundError:
+                pass
+        return removed
+
+    def iter_files(self):
+        """
+        Yields (entry_id, path, stat) for every .ics file in the store.
+        """
+        if not self.root.is_dir():
+            return
+        stack = [self.root]
+        while stack:
+            with os.scandir(stack.pop()) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(Path(entry.path))
+                    elif entry.name.endswith(".ics"):
+                        yield entry.name[: -len(".ics")], Path(entry.path), entry.stat()
+
+
+class FileReconciler:
+    """
+    Class for the background job that garbage-collects .ics files.
+    Removes files whose event no longer exists in MongoDB (checked in batches),
+    files older than max_age seconds, and the oldest files beyond max_bytes.
+    Files in the legacy flat layout are moved into their shard.
+    """
+
+    def __init__(self, store, get_collection, interval=3600, batch_size=500,
+                 max_age=0, max_bytes=0, grace_period=600):
+        self.store = store
+        self.get_collection = get_collection
+        self.interval = interval
+        self.batch_size = batch_size
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        # Files younger than this are left alone, their event may still be being stored
+        self.grace_period = grace_period
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _existing_ids(self, entry_ids):
+        """
+        Returns the subset of entry_ids that still have a document in MongoDB.
+        """
+        object_ids = []
+        for entry_id in entry_ids:
+            try:
+                object_ids.append(ObjectId(entry_id))
+            except InvalidId:
+                continue
+        docs = self.get_collection().find({"_id": {"$in": object_ids}}, {"_id": 1})
+        return {str(doc["_id"]) for doc in docs}
+
+    def _remove(self, path):
+        try:
+            path.unlink()
+            return True
+        except FileNotFoundError:
+            return False
+
+    def run_once(self, now=None):
+        """
+        Run one reconciliation pass.
+        Returns a dict with the number of files checked, migrated and removed.
+        """
+        now = time.time() if now is None else now
+        stats = {"checked": 0, "migrated": 0, "orphaned": 0, "expired": 0, "evicted": 0}
+        kept = []
+        batch = []
+
+        def flush(batch):
+            existing = self._existing_ids([entry_id for entry_id, _, _ in batch])
+            for entry_id, path, stat in batch:
+                if entry_id not in existing:
+                    stats["orphaned"] += self._remove(path)
+                else:
+                    kept.append((stat.st_mtime, stat.st_size, path))
+
+        for entry_id, path, stat in self.store.iter_files():
+            stats["checked"] += 1
+            if path.parent == self.store.root:
+                target = self.store.path_for(entry_id)
+                target.parent.mkdir(parents=True, exist_ok=True)
+                os.replace(path, target)
+                path = target
+                stats["migrated"] += 1
+
+            if self.max_age and now - stat.st_mtime > self.max_age:
+                stats["expired"] += self._remove(path)
+                continue
+            if now - stat.st_mtime < self.grace_period:
+                kept.append((stat.st_mtime, stat.st_size, path))
+                continue
+
+            batch.append((entry_id, path, stat))
+            if len(batch) >= self.batch_size:
+                flush(batch)
+                batch = []
+        if batch:
+            flush(batch)
+
+        if self.max_bytes:
+            total = sum(size for _, size, _ in kept)
+            # MongoDB keeps the ics bytes, so the oldest local copies can go first
+            for _, size, path in sorted(kept, key=lambda item: item[0]):
+                if total <= self.max_bytes:
+                    break
+                if self._remove(path):
+                    stats["evicted"] += 1
+                    total -= size
+
+        logger.info("ICS file reconciliation: %s", stats)
+        return stats
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                logger.error("ICS file reconciliation failed: %s", e)
+
+    def start(self):
+        """
+        Start reconciling every `interval` seconds in a daemon thread.
+        """
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="ics-file-reconciler", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """
+        Stop the background thread.
+        """
+        self._stop.set()
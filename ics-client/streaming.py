@@ -0,0 +1,106 @@
+"""
+Incremental parsing of the model's streamed JSON answer.
+The answer has the shape {"events": [{...}, ...]} (see ICSClient.build_prompt)
+and arrives in arbitrary chunks. The parser reports each top-level field of an
+event as soon as its value is complete, and each event once its object closes,
+so progress can be shown long before the whole answer is in.
+"""
+
+import json
+import re
+
+# Fields reported individually while an event is still streaming
+STREAMED_FIELDS = ("name", "date", "start_time", "end_time", "location", "description")
+
+_FIELD_PATTERN = re.compile(
+    r'"(' + "|".join(STREAMED_FIELDS) + r')"\s*:\s*("(?:[^"\\]|\\.)*"|null)'
+)
+
+
+def format_sse(event, data):
+    """
+    Returns one Server-Sent Events message.
+    """
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+class EventStreamParser:
+    """
+    Class scanning streamed JSON text for the events array.
+    feed() returns the updates found in each chunk:
+        ("field", index, name, value) when a field of event `index` is complete
+        ("event", index, item) when event `index` is complete
+    Text outside the outer JSON object (e.g. markdown fences) is ignored.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._in_events = False
+        self._event_start = None
+        self._index = 0
+        self._reported = set()
+
+    def feed(self, chunk):
+        """
+        Add a chunk of the answer. Returns the list of updates it completed.
+        """
+        if not chunk:
+            return []
+        self.buffer += chunk
+        updates = []
+
+        for pos in range(self._pos, len(self.buffer)):
+            char = self.buffer[pos]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+
+            if char == '"':
+                self._in_string = True
+            elif char in "{[":
+                self._depth += 1
+                if char == "[" and self._depth == 2:
+                    self._in_events = True
+                elif char == "{" and self._depth == 3 and self._in_events:
+                    self._event_start = pos
+            elif char in "}]":
+                if char == "}" and self._depth == 3 and self._event_start is not None:
+                    updates.extend(self._fields(self.buffer[self._event_start:pos + 1]))
+                    updates.append(self._complete(self.buffer[self._event_start:pos + 1]))
+                elif char == "]" and self._depth == 2:
+                    self._in_events = False
+                self._depth -= 1
+        self._pos = len(self.buffer)
+
+        if self._event_start is not None:
+            updates.extend(self._fields(self.buffer[self._event_start:]))
+        return updates
+
+    def _fields(self, partial):
+        updates = []
+        for match in _FIELD_PATTERN.finditer(partial):
+            key = (self._index, match.group(1))
+            if key in self._reported:
+                continue
+            self._reported.add(key)
+            updates.append(("field", self._index, match.group(1), json.loads(match.group(2))))
+        return updates
+
+    def _complete(self, text):
+        index = self._index
+        self._event_start = None
+        self._index += 1
+        try:
+            item = json.loads(text)
+        except json.JSONDecodeError:
+            item = None
+        return ("event", index, item)
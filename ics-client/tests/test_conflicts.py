@@ -0,0 +1,163 @@
+"""
+Module is responsible for testing conflict detection.
+"""
+
+import random
+import unittest
+from datetime import datetime, timedelta
+from unittest.mock import MagicMock
+
+from bson import ObjectId
+
+from conflicts import ConflictIndex, IntervalTree, conflicts_json, event_interval
+
+
+def stored_event(name, start, hours=1, **extra):
+    """
+    Returns stored event data starting at start and lasting hours.
+    """
+    end = start + timedelta(hours=hours) if hours else None
+    return {"name": name, "start": start, "end": end, "timezone": "America/New_York", **extra}
+
+
+class TestIntervalTree(unittest.TestCase):
+    """
+    Test suite for IntervalTree.
+    """
+
+    def test_overlapping_matches_brute_force(self):
+        """
+        Tests overlap queries against checking every interval.
+        """
+        rng = random.Random(42)
+        base = datetime(2025, 5, 1)
+        intervals = []
+        for index in range(300):
+            start = base + timedelta(minutes=rng.randrange(0, 60 * 24 * 30))
+            intervals.append((start, start + timedelta(minutes=rng.randrange(1, 600)), {"id": index}))
+        tree = IntervalTree(intervals)
+
+        for _ in range(200):
+            start = base + timedelta(minutes=rng.randrange(0, 60 * 24 * 30))
+            end = start + timedelta(minutes=rng.randrange(1, 600))
+            expected = sorted((s, e, item["id"]) for s, e, item in intervals if s < end and e > start)
+            found = [item["id"] for item in tree.overlapping(start, end)]
+            self.assertEqual(found, [item_id for _, _, item_id in expected])
+
+    def test_touching_intervals_do_not_overlap(self):
+        """
+        Tests that an event ending when another starts is not a conflict.
+        """
+        tree = IntervalTree([(datetime(2025, 5, 1, 9), datetime(2025, 5, 1, 10), {"id": 1})])
+        self.assertEqual(tree.overlapping(datetime(2025, 5, 1, 10), datetime(2025, 5, 1, 11)), [])
+        self.assertEqual(len(tree.overlapping(datetime(2025, 5, 1, 9, 30), datetime(2025, 5, 1, 11))), 1)
+
+    def test_all_day_next_to_evening_events(self):
+        """
+        Tests that an all-day event, stored from its local midnight, only overlaps the evening
+        events of its own day.
+        """
+        holiday = stored_event("Holiday", datetime(2025, 1, 5, 5), hours=None, all_day=True)
+        party = stored_event("Party", datetime(2025, 1, 5, 2), hours=2)  # Jan 4, 9pm to 11pm EST
+        dinner = stored_event("Dinner", datetime(2025, 1, 6, 1))  # Jan 5, 8pm EST
+        tree = IntervalTree([(*event_interval(holiday), {"id": "holiday"})])
+
+        self.assertEqual(tree.overlapping(*event_interval(party)), [])
+        self.assertEqual(tree.overlapping(*event_interval(dinner)), [{"id": "holiday"}])
+
+    def test_replaced(self):
+        """
+        Tests replacing an item of a tree by id.
+        """
+        tree = IntervalTree([(datetime(2025, 5, 1, 9), datetime(2025, 5, 1, 10), {"id": 1})])
+        tree = tree.replaced([(datetime(2025, 5, 2, 9), datetime(2025, 5, 2, 10), {"id": 1})])
+        self.assertEqual(len(tree), 1)
+        self.assertEqual(tree.overlapping(datetime(2025, 5, 1), datetime(2025, 5, 2)), [])
+
+
+class TestConflictIndex(unittest.TestCase):
+    """
+    Test suite for ConflictIndex.
+    """
+
+    def setUp(self):
+        self.user_id = ObjectId()
+        self.lunch_id = ObjectId()
+        self.collection = MagicMock()
+        self.collection.database["users"].find_one.return_value = {"feed_version": 3}
+        self.collection.find.return_value.sort.return_value = [
+            {"_id": self.lunch_id, "event_data": stored_event("Lunch", datetime(2025, 5, 1, 16))},
+            {"_id": ObjectId(), "event_data": stored_event("Dinner", datetime(2025, 5, 1, 23))},
+        ]
+        self.index = ConflictIndex(lambda: self.collection)
+
+    def test_find(self):
+        """
+        Tests finding the events new ones overlap, and that the tree is cached under the feed version.
+        """
+        conflicts = self.index.find(self.user_id, [
+            stored_event("Call", datetime(2025, 5, 1, 16, 30)),
+            stored_event("Gym", datetime(2025, 5, 1, 20)),
+        ])
+
+        self.assertEqual([[summary["name"] for summary in found] for found in conflicts], [["Lunch"], []])
+        self.index.find(self.user_id, [stored_event("Call", datetime(2025, 5, 1, 16, 30))])
+        self.collection.find.assert_called_once()
+
+        self.collection.database["users"].find_one.return_value = {"feed_version": 4}
+        self.index.find(self.user_id, [stored_event("Call", datetime(2025, 5, 1, 16, 30))])
+        self.assertEqual(self.collection.find.call_count, 2)
+
+    def test_find_excludes_entry(self):
+        """
+        Tests that an entry being regenerated does not conflict with itself.
+        """
+        conflicts = self.index.find(self.user_id, [stored_event("Lunch", datetime(2025, 5, 1, 16))], self.lunch_id)
+        self.assertEqual(conflicts, [[]])
+
+    def test_record_own_write(self):
+        """
+        Tests that this process's own write updates the cached tree without a rebuild,
+        and that a write from elsewhere drops it.
+        """
+        self.index.find(self.user_id, [])
+        call_id = ObjectId()
+        self.index.record(self.user_id, 4, [(call_id, stored_event("Call", datetime(2025, 5, 2, 9)))], call_id)
+        self.collection.database["users"].find_one.return_value = {"feed_version": 4}
+
+        conflicts = self.index.find(self.user_id, [stored_event("Standup", datetime(2025, 5, 2, 9, 15))])
+        self.assertEqual(conflicts[0][0]["id"], call_id)
+        self.collection.find.assert_called_once()
+
+        self.index.record(self.user_id, 6, [(ObjectId(), stored_event("Gym", datetime(2025, 5, 3, 9)))])
+        self.collection.database["users"].find_one.return_value = {"feed_version": 6}
+        self.index.find(self.user_id, [])
+        self.assertEqual(self.collection.find.call_count, 2)
+
+    def test_record_removed(self):
+        """
+        Tests that events a write deleted are dropped from the cached tree.
+        """
+        self.index.find(self.user_id, [])
+        self.index.record(self.user_id, 4, [], removed_ids=[self.lunch_id])
+        self.collection.database["users"].find_one.return_value = {"feed_version": 4}
+
+        conflicts = self.index.find(self.user_id, [stored_event("Call", datetime(2025, 5, 1, 16, 30))])
+        self.assertEqual(conflicts, [[]])
+        self.collection.find.assert_called_once()
+
+    def test_conflicts_json(self):
+        """
+        Tests converting conflicts for a JSON response.
+        """
+        self.assertEqual(event_interval({"start": datetime(2025, 5, 1), "end": None, "all_day": True}),
+                         (datetime(2025, 5, 1), datetime(2025, 5, 2)))
+        conflicts = self.index.find(self.user_id, [stored_event("Call", datetime(2025, 5, 1, 16, 30)),
+                                                   stored_event("Gym", datetime(2025, 5, 1, 20))])
+        self.assertEqual(conflicts_json(["a", "b"], conflicts), {"a": [{
+            "id": str(self.lunch_id),
+            "name": "Lunch",
+            "start": "2025-05-01T16:00:00Z",
+            "all_day": False,
+            "timezone": "America/New_York",
+        }]})
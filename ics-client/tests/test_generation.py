@@ -0,0 +1,88 @@
+"""
+Module is responsible for testing background generation jobs.
+"""
+
+import threading
+import unittest
+
+from generation import JOB_FAILED, GenerationJobs
+
+
+class TestGenerationJobs(unittest.TestCase):
+    """
+    Test suite for GenerationJobs.
+    """
+
+    def test_job_finishes_without_followers(self):
+        """
+        Tests that a job runs to its end when its stream is closed early, and that a
+        stream connecting later gets every message.
+        """
+        saved = threading.Event()
+
+        def generate(entry_id, text, user_id):
+            yield ("status", {"status": "extracting"})
+            yield ("status", {"status": "saving"})
+            saved.set()
+            yield ("done", {"entry_ids": [entry_id]})
+
+        jobs = GenerationJobs(generate)
+        stream = jobs.start("abc123", "Lunch tomorrow", None).follow()
+        self.assertEqual(next(stream), ("status", {"status": "extracting"}))
+        stream.close()
+
+        self.assertTrue(saved.wait(5))
+        self.assertEqual(list(jobs.start("abc123").follow())[-1], ("done", {"entry_ids": ["abc123"]}))
+
+    def test_running_job_is_joined(self):
+        """
+        Tests that starting an entry's generation while it runs follows the same job.
+        """
+        release = threading.Event()
+        calls = []
+
+        def generate(entry_id, text, user_id):
+            calls.append(entry_id)
+            yield ("status", {"status": "extracting"})
+            release.wait(5)
+            yield ("done", {"entry_ids": [entry_id]})
+
+        jobs = GenerationJobs(generate)
+        first = jobs.start("abc123")
+        second = jobs.start("abc123")
+        release.set()
+
+        self.assertIs(first, second)
+        self.assertEqual(list(first.follow()), list(second.follow()))
+        self.assertEqual(calls, ["abc123"])
+
+    def test_failed_job_ends_with_error(self):
+        """
+        Tests that an exception while generating ends the job with an error message.
+        """
+        def generate(entry_id, text, user_id):
+            yield ("status", {"status": "extracting"})
+            raise RuntimeError("boom")
+
+        jobs = GenerationJobs(generate)
+        self.assertEqual(list(jobs.start("abc123").follow()),
+                         [("status", {"status": "extracting"}), ("error", JOB_FAILED)])
+
+    def test_finished_jobs_expire(self):
+        """
+        Tests that a finished job is run again once its ttl passed.
+        """
+        calls = []
+
+        def generate(entry_id, text, user_id):
+            calls.append(entry_id)
+            yield ("done", {"entry_ids": [entry_id]})
+
+        jobs = GenerationJobs(generate, ttl=0)
+        list(jobs.start("abc123").follow())
+        list(jobs.start("abc123").follow())
+        self.assertEqual(calls, ["abc123", "abc123"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,218 @@
+"""
+Module is responsible for testing reminders.
+"""
+
+import random
+import unittest
+from datetime import datetime, timedelta
+from unittest.mock import MagicMock, patch
+
+from bson import ObjectId
+
+from reminders import (
+    CANCELLED, MISSED, PENDING, SENT, ReminderDispatcher, SmtpSink, TimingWheel,
+    next_occurrence, reminder_text, to_timestamp, utc_now,
+)
+
+
+class TestTimingWheel(unittest.TestCase):
+    """
+    Test suite for TimingWheel.
+    """
+
+    def test_fires_in_order(self):
+        """
+        Tests that timers across all levels and the overflow fire at their tick, in order.
+        """
+        rng = random.Random(7)
+        wheel = TimingWheel(tick=1, slots=(8, 8, 4), now=1000)
+        deadlines = {key: 1000 + rng.randrange(1, 600) for key in range(500)}
+        for key, deadline in deadlines.items():
+            wheel.add(key, deadline)
+
+        fired = {}
+        for now in range(1001, 1610, 7):
+            for key in wheel.advance(now):
+                fired[key] = now
+        self.assertEqual(set(fired), set(deadlines))
+        for key, deadline in deadlines.items():
+            self.assertTrue(deadline <= fired[key] < deadline + 7)
+        self.assertEqual(len(wheel), 0)
+
+    def test_remove_and_move(self):
+        """
+        Tests that removed timers do not fire and re-added ones fire at their new deadline only.
+        """
+        wheel = TimingWheel(tick=1, now=0)
+        wheel.add("a", 10)
+        wheel.add("b", 20)
+        wheel.add("b", 100)
+        wheel.remove("a")
+        self.assertEqual(wheel.advance(50), [])
+        self.assertEqual(wheel.advance(100), ["b"])
+
+    def test_overdue_fires_next(self):
+        """
+        Tests that a timer added past its deadline fires at the next advance.
+        """
+        wheel = TimingWheel(tick=1, now=100)
+        wheel.add("late", 50)
+        self.assertEqual(wheel.advance(101), ["late"])
+
+
+class TestReminderDispatcher(unittest.TestCase):
+    """
+    Test suite for ReminderDispatcher.
+    """
+
+    def setUp(self):
+        self.database = {"reminders": MagicMock(), "events": MagicMock(), "users": MagicMock()}
+        self.sink = MagicMock()
+        self.dispatcher = ReminderDispatcher(lambda: self.database, sink=self.sink, horizon=3600)
+        self.user_id = ObjectId()
+        self.event_id = ObjectId()
+        self.start = (utc_now() + timedelta(hours=2)).replace(microsecond=0)
+        self.event_data = {"name": "Dentist", "start": self.start, "end": None, "location": "Main St",
+                           "timezone": "America/New_York", "reminders": [30, 1440]}
+
+    def test_schedule(self):
+        """
+        Tests that the reminders still ahead replace the event's pending ones in one bulk write,
+        and that those within the loaded horizon go to the wheel.
+        """
+        self.dispatcher.refill()
+        docs = self.dispatcher.schedule(self.user_id, [(self.event_id, self.event_data, None)])
+
+        self.assertEqual(len(docs), 1)
+        self.assertEqual(docs[0]["fire_at"], self.start - timedelta(minutes=30))
+        self.assertEqual(docs[0]["status"], PENDING)
+        delete, insert = self.database["reminders"].bulk_write.call_args[0][0]
+        self.assertEqual(delete._filter, {"event_id": {"$in": [self.event_id]}, "status": PENDING})
+        self.assertEqual(insert._doc, docs[0])
+        self.assertNotIn(docs[0]["_id"], self.dispatcher._wheel)
+
+        self.event_data["reminders"] = [110]
+        docs = self.dispatcher.schedule(self.user_id, [(self.event_id, self.event_data, None)])
+        self.assertIn(docs[0]["_id"], self.dispatcher._wheel)
+
+    def reminder(self, **changes):
+        """
+        Returns a claimed reminder of the test event, 30 minutes before it.
+        """
+        reminder = self.dispatcher.reminder_doc(self.event_id, self.user_id, self.event_data, None, 30,
+                                                utc_now())
+        reminder.update(attempts=1, **changes)
+        return reminder
+
+    def test_fire(self):
+        """
+        Tests that a claimed reminder is sent and marked sent.
+        """
+        reminder = self.reminder()
+        self.database["reminders"].find_one_and_update.return_value = reminder
+        self.database["events"].find_one.return_value = {"_id": self.event_id, "event_data": self.event_data}
+        self.database["users"].find_one.return_value = {"username": "sam@example.com"}
+
+        self.assertEqual(self.dispatcher.fire(reminder["_id"]), SENT)
+        self.sink.send.assert_called_once_with(reminder, {"username": "sam@example.com"})
+        update = self.database["reminders"].update_one.call_args[0][1]["$set"]
+        self.assertEqual(update["status"], SENT)
+
+    def test_fire_claimed_elsewhere(self):
+        """
+        Tests that a reminder another process claimed is not sent.
+        """
+        self.database["reminders"].find_one_and_update.return_value = None
+        self.assertIsNone(self.dispatcher.fire(ObjectId()))
+        self.sink.send.assert_not_called()
+
+    def test_fire_changed_or_late(self):
+        """
+        Tests that reminders of deleted or changed events are cancelled and late ones missed.
+        """
+        reminder = self.reminder()
+        self.database["reminders"].find_one_and_update.return_value = reminder
+        self.database["events"].find_one.return_value = None
+        self.assertEqual(self.dispatcher.fire(reminder["_id"]), CANCELLED)
+
+        self.database["events"].find_one.return_value = {"event_data": {**self.event_data, "reminders": [15]}}
+        self.assertEqual(self.dispatcher.fire(reminder["_id"]), CANCELLED)
+
+        self.database["events"].find_one.return_value = {"event_data": self.event_data}
+        reminder["occurrence_start"] = utc_now() - timedelta(minutes=1)
+        self.assertEqual(self.dispatcher.fire(reminder["_id"]), MISSED)
+        self.sink.send.assert_not_called()
+
+    def test_fire_retries(self):
+        """
+        Tests that a failed send is put back with a later fire_at, held in the wheel.
+        """
+        self.dispatcher.refill()
+        reminder = self.reminder()
+        self.database["reminders"].find_one_and_update.return_value = reminder
+        self.database["events"].find_one.return_value = {"event_data": self.event_data}
+        self.sink.send.side_effect = OSError("connection refused")
+
+        self.assertEqual(self.dispatcher.fire(reminder["_id"]), PENDING)
+        update = self.database["reminders"].update_one.call_args[0][1]["$set"]
+        self.assertGreater(update["fire_at"], utc_now())
+        self.assertIn(reminder["_id"], self.dispatcher._wheel)
+
+    def test_recovers_from_database(self):
+        """
+        Tests that a new dispatcher returns expired claims to pending and loads
+        the reminders due within the horizon, overdue ones included, then fires them.
+        """
+        overdue = {"_id": ObjectId(), "fire_at": utc_now() - timedelta(minutes=5)}
+        self.database["reminders"].find.return_value.sort.return_value = [overdue]
+
+        self.assertEqual(self.dispatcher.refill(), 1)
+        self.assertEqual(self.database["reminders"].update_many.call_args[0][0]["status"], "sending")
+        query = self.database["reminders"].find.call_args[0][0]
+        self.assertEqual(query["status"], PENDING)
+        self.assertIn(overdue["_id"], self.dispatcher._wheel)
+
+        self.database["reminders"].find_one_and_update.return_value = None
+        fired = self.dispatcher.run_once(to_timestamp(utc_now()) + 2)
+        self.assertEqual(fired, [overdue["_id"]])
+
+
+class TestReminderHelpers(unittest.TestCase):
+    """
+    Test suite for the reminder helpers.
+    """
+
+    def test_next_occurrence_of_series(self):
+        """
+        Tests that the reminder of a weekly series goes to the first occurrence still ahead.
+        """
+        series = {
+            "rule": {"freq": "WEEKLY", "interval": 1, "byday": ["MO"], "count": None, "until": None},
+            "dtstart": datetime(2025, 5, 5, 13),
+            "until": None,
+            "duration": 3600,
+            "all_day": False,
+            "timezone": "America/New_York",
+        }
+        now = datetime(2025, 5, 12, 12, 45)
+        self.assertEqual(next_occurrence({}, series, 10, now), datetime(2025, 5, 12, 13))
+        self.assertEqual(next_occurrence({}, series, 30, now), datetime(2025, 5, 19, 13))
+        self.assertIsNone(next_occurrence({"start": datetime(2025, 5, 12, 13)}, None, 30, now))
+
+    @patch("reminders.smtplib.SMTP")
+    def test_smtp_sink(self, mock_smtp):
+        """
+        Tests that the SMTP sink emails users whose username is an address.
+        """
+        reminder = {"_id": ObjectId(), "name": "Dentist", "occurrence_start": datetime(2025, 5, 12, 13),
+                    "timezone": "America/New_York", "location": None}
+        sink = SmtpSink("localhost", 1025, "reminders@example.com")
+
+        sink.send(reminder, {"username": "sam"})
+        mock_smtp.assert_not_called()
+
+        sink.send(reminder, {"username": "sam@example.com"})
+        message = mock_smtp.return_value.__enter__.return_value.send_message.call_args[0][0]
+        self.assertEqual(message["To"], "sam@example.com")
+        self.assertEqual(message["Subject"], "Reminder: Dentist")
+        self.assertEqual(reminder_text(reminder), "Dentist starts May 12, 2025  9:00AM")
@@ -0,0 +1,56 @@
+"""
+Module is responsible for testing that the modules copied from the web app still match it.
+"""
+
+import ast
+import unittest
+from pathlib import Path
+
+CLIENT_DIR = Path(__file__).resolve().parent.parent
+WEB_APP_DIR = CLIENT_DIR.parent / "web-app"
+
+# Modules copied whole, and recurrence.py, of which only some definitions are copied
+WHOLE_COPIES = ("breaker.py", "profiling.py")
+PARTIAL_COPIES = ("recurrence.py",)
+
+
+def definitions(path):
+    """
+    Returns the ast dump of each top-level function, class and constant of a module, by name.
+    The module docstring and imports are left out, they may differ between copies.
+    """
+    tree = ast.parse(path.read_text(encoding="utf-8"))
+    found = {}
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            found[node.name] = ast.dump(node)
+        elif isinstance(node, ast.Assign):
+            for target in node.targets:
+                if isinstance(target, ast.Name):
+                    found[target.id] = ast.dump(node)
+    return found
+
+
+@unittest.skipUnless(WEB_APP_DIR.is_dir(), "needs the web app's sources next to the ics-client")
+class TestSharedModules(unittest.TestCase):
+    """
+    Test suite comparing the copied modules with the web app's.
+    """
+
+    def test_whole_copies_match(self):
+        """
+        Tests that modules copied whole define the same things as the web app's.
+        """
+        for name in WHOLE_COPIES:
+            with self.subTest(module=name):
+                self.assertEqual(definitions(CLIENT_DIR / name), definitions(WEB_APP_DIR / name))
+
+    def test_partial_copies_match(self):
+        """
+        Tests that each definition of a partly copied module matches the web app's.
+        """
+        for name in PARTIAL_COPIES:
+            web_app = definitions(WEB_APP_DIR / name)
+            for definition, dump in definitions(CLIENT_DIR / name).items():
+                with self.subTest(module=name, definition=definition):
+                    self.assertEqual(dump, web_app.get(definition))
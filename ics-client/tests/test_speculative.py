@@ -0,0 +1,75 @@
+"""
+Module is responsible for testing speculative extraction.
+"""
+
+import threading
+import unittest
+
+from speculative import SpeculativeExtractor
+
+
+class TestSpeculativeExtractor(unittest.TestCase):
+    """
+    Test suite for SpeculativeExtractor.
+    """
+
+    def test_result_reused_for_same_text(self):
+        """
+        Tests that a submitted extraction is returned for the same user and text, once.
+        """
+        calls = []
+        extractor = SpeculativeExtractor(lambda text, user_id: calls.append(text) or [{"name": text}])
+
+        self.assertEqual(extractor.submit("user", "Lunch  tomorrow "), "started")
+        self.assertEqual(extractor.submit("user", "Lunch tomorrow"), "cached")
+        self.assertEqual(extractor.take("user", "Lunch tomorrow", timeout=5), [{"name": "Lunch  tomorrow "}])
+        self.assertIsNone(extractor.take("user", "Lunch tomorrow", timeout=5))
+        self.assertIsNone(extractor.take("other user", "Lunch  tomorrow ", timeout=5))
+        self.assertEqual(len(calls), 1)
+
+    def test_superseded_speculation_is_cancelled(self):
+        """
+        Tests that a new speculation cancels the queued one and drops the running one.
+        """
+        release = threading.Event()
+        started = []
+
+        def extract(text, user_id):
+            started.append(text)
+            release.wait(5)
+            return [{"name": text}]
+
+        extractor = SpeculativeExtractor(extract, max_workers=1, burst=10)
+        extractor.submit("user", "Lunch")
+        extractor.submit("user", "Lunch tomorrow")
+        extractor.submit("user", "Lunch tomorrow at noon")
+        release.set()
+
+        self.assertIsNone(extractor.take("user", "Lunch", timeout=5))
+        self.assertIsNone(extractor.take("user", "Lunch tomorrow", timeout=5))
+        self.assertEqual(extractor.take("user", "Lunch tomorrow at noon", timeout=5),
+                         [{"name": "Lunch tomorrow at noon"}])
+        self.assertNotIn("Lunch tomorrow", started)
+
+    def test_rate_limited_per_user(self):
+        """
+        Tests that each user can only start `burst` speculations at once.
+        """
+        extractor = SpeculativeExtractor(lambda text, user_id: [], rate=0.001, burst=2)
+
+        self.assertEqual(extractor.submit("user", "one"), "started")
+        self.assertEqual(extractor.submit("user", "two"), "started")
+        self.assertEqual(extractor.submit("user", "three"), "rate_limited")
+        self.assertEqual(extractor.submit("other user", "three"), "started")
+
+    def test_errors_are_not_reused(self):
+        """
+        Tests that an extraction error is not returned as a speculative result.
+        """
+        extractor = SpeculativeExtractor(lambda text, user_id: {"error": "No valid event extracted", "error_code": 401})
+        extractor.submit("user", "???")
+        self.assertIsNone(extractor.take("user", "???", timeout=5))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,159 @@
+"""
+Module is responsible for testing the .ics file storage and reconciler.
+"""
+
+import os
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from unittest.mock import MagicMock
+
+from bson import ObjectId
+from bson.errors import InvalidId
+
+from storage import EventFileStore, FileReconciler
+
+
+class TestEventFileStore(unittest.TestCase):
+    """
+    Test suite for EventFileStore.
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.store = EventFileStore(self.tmp_dir.name)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_path_for_is_sharded(self):
+        """
+        Tests that files are placed two shard directories below the root.
+        """
+        entry_id = "67f6d1236aaf92738f8f8855"
+        path = self.store.path_for(entry_id)
+        self.assertEqual(path.name, f"{entry_id}.ics")
+        self.assertEqual(path.parent.parent.parent, Path(self.tmp_dir.name))
+        self.assertEqual(path, self.store.path_for(entry_id))
+
+    def test_write_and_remove(self):
+        """
+        Tests writing a file into its shard and removing it again.
+        """
+        entry_id = str(ObjectId())
+        path = self.store.write(entry_id, b"BEGIN:VCALENDAR\nEND:VCALENDAR")
+        self.assertTrue(path.exists())
+        self.assertEqual([item[0] for item in self.store.iter_files()], [entry_id])
+
+        self.assertTrue(self.store.remove(entry_id))
+        self.assertFalse(path.exists())
+        self.assertFalse(self.store.remove(entry_id))
+
+    def test_remove_rejects_paths(self):
+        """
+        Tests that an id that is not an ObjectId cannot remove a file outside the store.
+        """
+        victim = Path(self.tmp_dir.name) / "victim.ics"
+        victim.write_bytes(b"BEGIN:VCALENDAR\nEND:VCALENDAR")
+        store = EventFileStore(Path(self.tmp_dir.name) / "events")
+
+        with self.assertRaises(InvalidId):
+            store.remove("../victim")
+        self.assertTrue(victim.exists())
+
+
+class TestFileReconciler(unittest.TestCase):
+    """
+    Test suite for FileReconciler.
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.store = EventFileStore(self.tmp_dir.name)
+        self.collection = MagicMock()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def make_file(self, entry_id, age=3600, size=10):
+        """
+        Write a file for entry_id with a modification time `age` seconds ago.
+        """
+        path = self.store.write(entry_id, b"x" * size)
+        mtime = time.time() - age
+        os.utime(path, (mtime, mtime))
+        return path
+
+    def test_removes_orphaned_files_in_batches(self):
+        """
+        Tests that files without a MongoDB document are removed, checking ids in batches.
+        """
+        kept_id, orphan_id, other_orphan_id = str(ObjectId()), str(ObjectId()), str(ObjectId())
+        kept = self.make_file(kept_id)
+        orphan = self.make_file(orphan_id)
+        other_orphan = self.make_file(other_orphan_id)
+        self.collection.find.side_effect = lambda query, projection: [
+            {"_id": object_id} for object_id in query["_id"]["$in"] if str(object_id) == kept_id
+        ]
+
+        reconciler = FileReconciler(self.store, lambda: self.collection, batch_size=2)
+        stats = reconciler.run_once()
+
+        self.assertEqual(stats["orphaned"], 2)
+        self.assertEqual(self.collection.find.call_count, 2)
+        self.assertTrue(kept.exists())
+        self.assertFalse(orphan.exists())
+        self.assertFalse(other_orphan.exists())
+
+    def test_skips_files_in_grace_period(self):
+        """
+        Tests that recently written files are not treated as orphans.
+        """
+        path = self.make_file(str(ObjectId()), age=5)
+        reconciler = FileReconciler(self.store, lambda: self.collection)
+        reconciler.run_once()
+        self.assertTrue(path.exists())
+        self.collection.find.assert_not_called()
+
+    def test_retention_and_size_cap(self):
+        """
+        Tests that expired files and the oldest files beyond the size cap are removed.
+        """
+        ids = [str(ObjectId()) for _ in range(4)]
+        expired = self.make_file(ids[0], age=10 * 24 * 3600)
+        oldest = self.make_file(ids[1], age=3 * 3600)
+        middle = self.make_file(ids[2], age=2 * 3600)
+        newest = self.make_file(ids[3], age=3600)
+        self.collection.find.side_effect = lambda query, projection: [
+            {"_id": object_id} for object_id in query["_id"]["$in"]
+        ]
+
+        reconciler = FileReconciler(self.store, lambda: self.collection,
+                                    max_age=7 * 24 * 3600, max_bytes=20)
+        stats = reconciler.run_once()
+
+        self.assertEqual(stats["expired"], 1)
+        self.assertEqual(stats["evicted"], 1)
+        self.assertFalse(expired.exists())
+        self.assertFalse(oldest.exists())
+        self.assertTrue(middle.exists())
+        self.assertTrue(newest.exists())
+
+    def test_migrates_flat_files(self):
+        """
+        Tests that files in the legacy flat layout are moved into their shard.
+        """
+        entry_id = str(ObjectId())
+        flat_path = Path(self.tmp_dir.name) / f"{entry_id}.ics"
+        flat_path.write_bytes(b"BEGIN:VCALENDAR\nEND:VCALENDAR")
+
+        stats = FileReconciler(self.store, lambda: self.collection).run_once()
+
+        self.assertEqual(stats["migrated"], 1)
+        self.assertFalse(flat_path.exists())
+        self.assertTrue(self.store.path_for(entry_id).exists())
+
+
+if __name__ == "__main__":
+    unittest.main()
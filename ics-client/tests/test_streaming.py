@@ -0,0 +1,64 @@
+"""
+Module is responsible for testing the incremental parsing of streamed answers.
+"""
+
+import unittest
+
+from streaming import EventStreamParser, format_sse
+
+ANSWER = (
+    '```json\n{"events": [{"name": "Lunch \\"on\\" me", "date": "2025-05-01", "start_time": "12:00", '
+    '"end_time": null, "location": "Cafe {1}", "description": null, '
+    '"recurrence": {"frequency": "WEEKLY", "by_day": ["FR"], "until": "2025-06-01"}}, '
+    '{"name": "Dinner", "date": "2025-05-02", "start_time": null, "end_time": null, '
+    '"location": null, "description": null, "recurrence": null}]}\n```'
+)
+
+
+class TestEventStreamParser(unittest.TestCase):
+    """
+    Test suite for EventStreamParser.
+    """
+
+    def feed_in_chunks(self, size):
+        parser = EventStreamParser()
+        updates = []
+        for start in range(0, len(ANSWER), size):
+            updates.extend(parser.feed(ANSWER[start:start + size]))
+        return parser, updates
+
+    def test_fields_and_events(self):
+        """
+        Tests that every field and event is reported once, whatever the chunk size.
+        """
+        for size in (1, 7, 64, len(ANSWER)):
+            parser, updates = self.feed_in_chunks(size)
+            fields = [update for update in updates if update[0] == "field"]
+            events = [update for update in updates if update[0] == "event"]
+
+            self.assertEqual(parser.buffer, ANSWER)
+            self.assertEqual(len(fields), 12)
+            self.assertIn(("field", 0, "name", 'Lunch "on" me'), fields)
+            self.assertIn(("field", 0, "location", "Cafe {1}"), fields)
+            self.assertIn(("field", 1, "start_time", None), fields)
+            self.assertEqual([event[1] for event in events], [0, 1])
+            self.assertEqual(events[0][2]["recurrence"]["until"], "2025-06-01")
+            self.assertEqual(events[1][2]["name"], "Dinner")
+
+    def test_field_reported_before_event_completes(self):
+        """
+        Tests that a field is reported as soon as its value is complete.
+        """
+        parser = EventStreamParser()
+        self.assertEqual(parser.feed('{"events": [{"name": "Lun'), [])
+        self.assertEqual(parser.feed('ch", "da'), [("field", 0, "name", "Lunch")])
+
+    def test_format_sse(self):
+        """
+        Tests the Server-Sent Events message format.
+        """
+        self.assertEqual(format_sse("done", {"entry_ids": ["a"]}), 'event: done\ndata: {"entry_ids": ["a"]}\n\n')
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+"""
+Module is responsible for testing LLM usage accounting.
+"""
+
+import unittest
+from unittest.mock import MagicMock
+
+from bson import ObjectId
+
+from usage import UsageRecorder, usage_day
+
+
+class TestUsageRecorder(unittest.TestCase):
+    """
+    Test suite for UsageRecorder.
+    """
+
+    def test_flush_batches_counters(self):
+        """
+        Tests that calls are aggregated per user and model and flushed as one bulk write of upserts.
+        """
+        collection = MagicMock()
+        recorder = UsageRecorder(lambda: collection)
+        user_id = ObjectId()
+        recorder.record(user_id, "gemini-2.0-flash", 100, 20, 300.0)
+        recorder.record(str(user_id), "gemini-2.0-flash", 50, 10, 500.0)
+        recorder.record(None, "gemini-2.0-flash", 10, 1, 100.0)
+
+        self.assertEqual(recorder.flush(), 2)
+
+        operations = collection.bulk_write.call_args[0][0]
+        self.assertEqual(len(operations), 2)
+        update = operations[0]
+        self.assertEqual(update._filter, {"user_id": user_id, "model": "gemini-2.0-flash", "day": usage_day()})
+        self.assertEqual(update._doc["$inc"], {"calls": 2, "prompt_tokens": 150, "response_tokens": 30,
+                                               "latency_ms": 800.0})
+        self.assertEqual(update._doc["$max"], {"latency_ms_max": 500.0})
+        self.assertTrue(update._upsert)
+        self.assertEqual(recorder.flush(), 0)
+        collection.bulk_write.assert_called_once()
+
+    def test_failed_flush_keeps_counters(self):
+        """
+        Tests that counters are kept for the next flush when writing them fails.
+        """
+        collection = MagicMock()
+        collection.bulk_write.side_effect = [Exception("not primary"), None]
+        recorder = UsageRecorder(lambda: collection)
+        recorder.record("user", "gemini-2.0-flash", 100, 20, 300.0)
+
+        self.assertEqual(recorder.flush(), 0)
+        recorder.record("user", "gemini-2.0-flash", 1, 1, 100.0)
+        self.assertEqual(recorder.flush(), 1)
+
+        update = collection.bulk_write.call_args[0][0][0]
+        self.assertEqual(update._doc["$inc"]["calls"], 2)
+        self.assertEqual(update._doc["$inc"]["prompt_tokens"], 101)
+
+    def test_quotas(self):
+        """
+        Tests that daily quotas count flushed and buffered usage, and are off by default.
+        """
+        user_id = ObjectId()
+        collection = MagicMock()
+        collection.find.return_value = [{"calls": 3, "prompt_tokens": 800, "response_tokens": 100}]
+
+        self.assertTrue(UsageRecorder(lambda: collection).allow(user_id))
+        collection.find.assert_not_called()
+
+        recorder = UsageRecorder(lambda: collection, daily_token_quota=1000)
+        self.assertTrue(recorder.allow(user_id))
+        recorder.record(user_id, "gemini-2.0-flash", 90, 10, 100.0)
+        self.assertFalse(recorder.allow(str(user_id)))
+        self.assertTrue(recorder.allow(ObjectId()))
+        self.assertEqual(collection.find.call_count, 2)
+
+        recorder = UsageRecorder(lambda: collection, daily_call_quota=3)
+        self.assertFalse(recorder.allow(user_id))
+
+
+if __name__ == "__main__":
+    unittest.main()
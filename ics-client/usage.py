@@ -0,0 +1,180 @@
+"""
+LLM usage accounting.
+Token counts and latency of every Gemini call are added to in-process
+counters per user, model and day, and flushed to the llm_usage collection
+periodically as one batch of $inc upserts. Daily per-user quotas are checked
+against those counters before a call is made.
+"""
+
+import logging
+import threading
+from datetime import datetime, timezone
+
+from bson.errors import InvalidId
+from bson.objectid import ObjectId
+from pymongo import ASCENDING, UpdateOne
+
+logger = logging.getLogger(__name__)
+
+COUNTERS = ("calls", "prompt_tokens", "response_tokens", "latency_ms")
+
+
+def usage_day(now=None):
+    """
+    Returns the UTC day usage is counted under, as YYYY-MM-DD.
+    """
+    return (now or datetime.now(timezone.utc)).strftime("%Y-%m-%d")
+
+
+def normalize_user_id(user_id):
+    """
+    Returns the user id as an ObjectId where possible, so string and ObjectId ids count together.
+    """
+    if user_id is None or isinstance(user_id, ObjectId):
+        return user_id
+    try:
+        return ObjectId(str(user_id))
+    except (InvalidId, TypeError):
+        return str(user_id)
+
+
+class UsageRecorder:
+    """
+    Class buffering LLM usage counters and flushing them to MongoDB in batches.
+    Quotas of 0 are unlimited. Each process flushes its own counters, so
+    across processes a quota can be overrun by up to one flush interval of calls.
+    """
+
+    def __init__(self, get_collection, flush_interval=10, daily_token_quota=0, daily_call_quota=0,
+                 quota_cache_seconds=30):
+        self.get_collection = get_collection
+        self.flush_interval = flush_interval
+        self.daily_token_quota = daily_token_quota
+        self.daily_call_quota = daily_call_quota
+        self.quota_cache_seconds = quota_cache_seconds
+        self._lock = threading.Lock()
+        self._counters = {}  # (user_id, model, day) -> {counter: value, "latency_ms_max": value}
+        self._persisted = {}  # (user_id, day) -> (totals, fetched_at)
+        self._indexed = False
+        self._stop = threading.Event()
+        self._thread = None
+
+    def record(self, user_id, model, prompt_tokens, response_tokens, latency_ms):
+        """
+        Add one call to the counters.
+        """
+        key = (normalize_user_id(user_id), model, usage_day())
+        with self._lock:
+            counters = self._counters.setdefault(key, dict.fromkeys(COUNTERS + ("latency_ms_max",), 0))
+            counters["calls"] += 1
+            counters["prompt_tokens"] += prompt_tokens or 0
+            counters["response_tokens"] += response_tokens or 0
+            counters["latency_ms"] += latency_ms
+            counters["latency_ms_max"] = max(counters["latency_ms_max"], latency_ms)
+
+    def flush(self):
+        """
+        Write the buffered counters with one bulk write of upserts.
+        On failure the counters are put back and retried at the next flush.
+        Returns the number of counter documents written.
+        """
+        with self._lock:
+            counters, self._counters = self._counters, {}
+        if not counters:
+            return 0
+
+        operations = [
+            UpdateOne(
+                {"user_id": user_id, "model": model, "day": day},
+                {
+                    "$inc": {counter: values[counter] for counter in COUNTERS},
+                    "$max": {"latency_ms_max": values["latency_ms_max"]},
+                    "$set": {"updated_at": datetime.now(timezone.utc)},
+                },
+                upsert=True,
+            )
+            for (user_id, model, day), values in counters.items()
+        ]
+        try:
+            collection = self.get_collection()
+            if not self._indexed:
+                collection.create_index(
+                    [("user_id", ASCENDING), ("day", ASCENDING), ("model", ASCENDING)], unique=True
+                )
+                self._indexed = True
+            collection.bulk_write(operations, ordered=False)
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            logger.warning("Could not flush LLM usage, retrying later: %s", e)
+            with self._lock:
+                for key, values in counters.items():
+                    merged = self._counters.setdefault(key, dict.fromkeys(COUNTERS + ("latency_ms_max",), 0))
+                    for counter in COUNTERS:
+                        merged[counter] += values[counter]
+                    merged["latency_ms_max"] = max(merged["latency_ms_max"], values["latency_ms_max"])
+            return 0
+
+        with self._lock:
+            # Flushed counts are now in MongoDB, cached totals would count them twice
+            for user_id, _, day in counters:
+                self._persisted.pop((user_id, day), None)
+        return len(operations)
+
+    def _usage_today(self, user_id, day):
+        """
+        Returns (calls, tokens) of a user today: flushed totals (cached briefly) plus buffered counters.
+        """
+        now = datetime.now(timezone.utc).timestamp()
+        with self._lock:
+            cached = self._persisted.get((user_id, day))
+        if cached is None or now - cached[1] > self.quota_cache_seconds:
+            calls = tokens = 0
+            for doc in self.get_collection().find({"user_id": user_id, "day": day}):
+                calls += doc.get("calls", 0)
+                tokens += doc.get("prompt_tokens", 0) + doc.get("response_tokens", 0)
+            cached = ((calls, tokens), now)
+            with self._lock:
+                self._persisted[(user_id, day)] = cached
+
+        calls, tokens = cached[0]
+        with self._lock:
+            for (buffered_user, _, buffered_day), values in self._counters.items():
+                if buffered_user == user_id and buffered_day == day:
+                    calls += values["calls"]
+                    tokens += values["prompt_tokens"] + values["response_tokens"]
+        return calls, tokens
+
+    def allow(self, user_id):
+        """
+        Returns True if the user is within their daily quotas. Checked before each LLM call.
+        """
+        if not (self.daily_token_quota or self.daily_call_quota) or user_id is None:
+            return True
+        calls, tokens = self._usage_today(normalize_user_id(user_id), usage_day())
+        if self.daily_call_quota and calls >= self.daily_call_quota:
+            return False
+        if self.daily_token_quota and tokens >= self.daily_token_quota:
+            return False
+        return True
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def start(self):
+        """
+        Start flushing in a daemon thread every `flush_interval` seconds.
+        """
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="usage-flusher", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        """
+        Stop the flusher thread and flush what is left.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
@@ -1,15 +1,21 @@
 """This is a Flask Web App"""
 
 import os
+import json
 import logging
+import time
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 import requests
 from flask import (
     Flask,
     Response,
+    jsonify,
     render_template,
     request,
     url_for,
-    redirect
+    redirect,
+    session as flask_session
 )
 from flask_login import (
     LoginManager,
@@ -19,15 +25,141 @@ from flask_login import (
     logout_user,
     current_user
 )
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 from bson.objectid import ObjectId
+from bson.errors import InvalidId
 from dotenv import load_dotenv, dotenv_values
 import pymongo
-
+from breaker import CircuitBreaker, render_metrics
+from http_cache import conditional_response, init_http_cache, matching_etag
+from profiling import init_profiling, profile_headers
+from mongo import LazyDatabase, advance_session, causal_token, init_database_once
+from recurrence import describe_rule, expand_many, parse_window
+from feed import FeedCache, bump_feed_version, feed_etag, new_feed_token
+from search import search_events
+from schedule import event_json, find_events_between, forget_conflicts, format_event_time
 
 
 load_dotenv()  # load environment variables from .env file
 
+ICS_CLIENT_URL = os.getenv("ICS_CLIENT_URL", "http://ics-client:5001")
+# Upper bound on ids accepted by one bulk request, and on concurrent regenerations
+BULK_MAX_IDS = int(os.getenv("BULK_MAX_IDS", "1000"))
+BULK_REGENERATE_WORKERS = int(os.getenv("BULK_REGENERATE_WORKERS", "4"))
+# Descriptions shorter than this are not worth extracting speculatively
+PREFETCH_MIN_LENGTH = int(os.getenv("PREFETCH_MIN_LENGTH", "10"))
+# Seconds to wait for the ics-client to generate an entry. The ics-client's Gemini timeout
+# is derived from the same ICS_CLIENT_TIMEOUT, so Gemini fails fast inside this budget
+ICS_CLIENT_TIMEOUT = float(os.getenv("ICS_CLIENT_TIMEOUT", "30"))
+# Longest wait for the next message of a streamed generation
+GENERATE_STREAM_TIMEOUT = int(os.getenv("GENERATE_STREAM_TIMEOUT", "60"))
+# Seconds routed reads keep checking the primary for an entry the ics-client is generating
+PENDING_ENTRY_SECONDS = int(os.getenv("PENDING_ENTRY_SECONDS", "300"))
+
+# Runs fire-and-forget calls to the ics-client off the request thread
+background_executor = ThreadPoolExecutor(max_workers=1)
+
+ics_client_breaker = CircuitBreaker(
+    "ics_client",
+    failure_threshold=int(os.getenv("ICS_CLIENT_BREAKER_THRESHOLD", "5")),
+    reset_timeout=float(os.getenv("ICS_CLIENT_BREAKER_RESET", "30")),
+)
+
+
+class ICSClientUnavailable(requests.exceptions.ConnectionError):
+    """
+    Raised instead of calling the ics-client while its circuit is open,
+    so callers handle it like any other failed request.
+    """
+
+
+def post_to_ics_client(path, **kwargs):
+    """
+    POST to the ics-client through its circuit breaker.
+    Connection errors, timeouts and 5xx responses count as failures.
+    Returns the requests response object.
+    Raises ICSClientUnavailable if the circuit is open.
+    """
+    if not ics_client_breaker.allow():
+        raise ICSClientUnavailable(f"ics-client circuit is {ics_client_breaker.state}")
+    # A profiled request profiles the ics-client's side of it too
+    headers = profile_headers()
+    if headers:
+        kwargs["headers"] = {**kwargs.get("headers", {}), **headers}
+    try:
+        response = requests.post(f"{ICS_CLIENT_URL}{path}", **kwargs)
+    except Exception:
+        ics_client_breaker.record_failure()
+        raise
+    if response.status_code >= 500:
+        ics_client_breaker.record_failure()
+    else:
+        ics_client_breaker.record_success()
+    return response
+
+
+def remove_ics_files(entry_ids):
+    """
+    Ask the ics-client to delete the .ics files of deleted events.
+    Best effort: the ics-client's reconciler removes anything missed here.
+    """
+    try:
+        post_to_ics_client(
+            "/remove-files",
+            json={"entry_ids": [str(entry_id) for entry_id in entry_ids]},
+            timeout=2,
+        )
+    except Exception as e:  # pylint: disable=broad-exception-caught
+        logging.warning("Could not remove ics files %s: %s", entry_ids, e)
+
+
+def start_generation(payload):
+    """
+    Ask the ics-client to start generating an entry in the background, so it is
+    saved whether or not the browser follows its stream.
+    Best effort: opening the stream starts the generation if this did not.
+    """
+    try:
+        post_to_ics_client("/run-client/start", json=payload, timeout=2)
+    except Exception as e:  # pylint: disable=broad-exception-caught
+        logging.warning("Could not start generating entry %s: %s", payload["entry_id"], e)
+
+
+def ics_client_payload(entry_id, text=None, user_id=None):
+    """
+    Returns the JSON body asking the ics-client to generate an entry,
+    with the entry's text and owner when the caller has them.
+    """
+    payload = {"entry_id": str(entry_id)}
+    if text:
+        payload["text"] = text
+        payload["user_id"] = str(user_id) if user_id else None
+    return payload
+
+
+def sse_message(event, data):
+    """
+    Returns one Server-Sent Events message.
+    """
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def parse_object_ids(ids):
+    """
+    Split a list of id strings into ObjectIds and a result dict for the invalid ones.
+    Returns:
+        tuple: (dict of id string -> ObjectId, dict of id string -> "invalid_id")
+    """
+    object_ids = {}
+    invalid = {}
+    for id_str in ids:
+        try:
+            object_ids[str(id_str)] = ObjectId(id_str)
+        except (InvalidId, TypeError):
+            invalid[str(id_str)] = "invalid_id"
+    return object_ids, invalid
+
+
 def create_app():
     """
     Create and configure the Flask application.
@@ -44,30 +176,30 @@ def create_app():
     login_manager = LoginManager()
     login_manager.init_app(flask_app)
     login_manager.login_view = "login"
+
+    # ETags, compression and static asset fingerprinting
+    init_http_cache(flask_app)
+    # Sampling profiles of requests, only if PROFILE_TOKEN or PROFILE_SAMPLE_RATE is set
+    init_profiling(flask_app)
+    flask_app.add_template_filter(describe_rule, "describe_recurrence")
+    flask_app.add_template_filter(format_event_time, "event_time")
     
     # Set up logging in Docker container's output
     logging.basicConfig(level=logging.DEBUG)
 
-    # Create MongoDB connections
-    cxn = pymongo.MongoClient(os.getenv("MONGO_URI"))
-    db = cxn[os.getenv("MONGO_DBNAME")]
+    # MongoDB connections are opened lazily, once per worker process
+    db = LazyDatabase(os.getenv("MONGO_URI"), os.getenv("MONGO_DBNAME"))
+    flask_app.extensions["mongo"] = db
+    init_database_once(db)
 
-    try:
-        cxn.admin.command("ping")
-        print(" *", "Connected to MongoDB!")
-    except Exception as e:  # pylint: disable=broad-exception-caught
-        print(" * MongoDB connection error:", e)
-
-    # Drop all collections to prevent duplicated data getting
-    # inserted into the database whenever the app is restarted
-    collections = db.list_collection_names()
-    for collection in collections:
-        db[collection].drop()
+    # Assembled subscription feeds of recently polled users, for this worker
+    feed_cache = FeedCache(int(os.getenv("FEED_CACHE_USERS", "1000")))
 
     class User(UserMixin):
-        def __init__(self, id, username):
+        def __init__(self, id, username, feed_token=None):
             self.id = str(id)
             self.username = username
+            self.feed_token = feed_token
 
         def get_id(self):
             return str(self.id)
@@ -78,7 +210,7 @@ def create_app():
         app.logger.debug("* load_user(): user: %s", user_info)
         if not user_info:
             return None
-        current_user = User(user_info["_id"], user_info["username"])
+        current_user = User(user_info["_id"], user_info["username"], user_info.get("feed_token"))
         return current_user
 
     @flask_app.route("/login", methods=["GET", "POST"])
@@ -123,12 +255,13 @@ def create_app():
             password = request.form.get("password")
 
             if username and password:
-                if db.users.find_one({"username": username}):
+                # The unique username index rejects taken names, see mongo.ensure_indexes
+                try:
+                    new_user = db.users.insert_one({"username": username, "password": password})
+                except pymongo.errors.DuplicateKeyError:
                     return render_template("create_user.html", error="Please choose a different username")
-                new_user = db.users.insert_one({"username": username, "password": password})
                 app.logger.debug("* create_user(): Inserting User: %s", new_user.inserted_id)
-                user_info = db.users.find_one({"_id": ObjectId(new_user.inserted_id)})
-                current_user = User(id=user_info["_id"], username=user_info["username"])
+                current_user = User(id=new_user.inserted_id, username=username)
                 app.logger.debug("* create_user(): user created: %s", current_user.username)
                 login = login_user(current_user)
                 app.logger.debug("* create_user(): login success: %s", login)
@@ -153,6 +286,33 @@ def create_app():
         """
         return redirect(url_for("index"))
 
+    @contextmanager
+    def causal_session():
+        """
+        Causally consistent session for the current user's reads and writes,
+        or None while reads stay on the primary.
+        The session starts from the position saved by the user's previous request,
+        so reads routed to a secondary wait for the user's earlier writes, and
+        the position is saved again at the end.
+        """
+        if not db.routes_reads:
+            yield None
+            return
+        with db.client.start_session(causal_consistency=True) as session:
+            advance_session(session, flask_session.get("causal_token"))
+            pending = flask_session.get("pending_entry")
+            if pending:
+                # The ics-client stores the generated event, once it has, a primary
+                # read moves the session past that write
+                entry_id, submitted_at = pending
+                generated = db.events.find_one(
+                    {"_id": ObjectId(entry_id), "ics_file_path": {"$exists": True}}, {"_id": 1}, session=session
+                )
+                if generated or time.time() - submitted_at > PENDING_ENTRY_SECONDS:
+                    flask_session.pop("pending_entry")
+            yield session
+            flask_session["causal_token"] = causal_token(session)
+
     @flask_app.route("/")
     @login_required
     def index():
@@ -164,10 +324,187 @@ def create_app():
 
         #find user with user id then fetch the events of that user
         user_id = current_user.get_id()
-        events = db.events.find({"user_id": ObjectId(user_id), "event_data": {"$exists": True}}).sort("created_at", pymongo.DESCENDING)
-        event_list = list(events)
-        return render_template("index.html", events = event_list)
+        with causal_session() as session:
+            events = db.reads.events.find(
+                {"user_id": ObjectId(user_id), "event_data": {"$exists": True}}, session=session
+            ).sort("created_at", pymongo.DESCENDING)
+            event_list = list(events)
+        return render_template("index.html", events = event_list, feed_url = user_feed_url())
+
+    @flask_app.route("/search")
+    @login_required
+    def search():
+        """
+        Route searching the user's events by name, description and location.
+        Query parameters:
+            q: the search text, each word is matched as a prefix
+            page: the page of results, starting at 1
+
+        Returns:
+            rendered template (str), or JSON if the client asks for it.
+        """
+        query = request.args.get("q", "").strip()
+        try:
+            page = max(int(request.args.get("page", 1)), 1)
+        except ValueError:
+            page = 1
+
+        user_id = ObjectId(current_user.get_id())
+        with causal_session() as session:
+            events, has_more = search_events(db.reads, user_id, query, page, session=session)
+
+        if request.accept_mimetypes.best == "application/json":
+            return jsonify({
+                "query": query,
+                "page": page,
+                "has_more": has_more,
+                "events": [event_json(event) for event in events],
+            })
+        return render_template("index.html", events = events, feed_url = user_feed_url(),
+                               query = query, page = page, has_more = has_more)
+
+    def render_schedule(window_start, window_end, title):
+        """
+        Render (or return as JSON) the user's events starting inside a window, soonest first.
+        """
+        with causal_session() as session:
+            events = find_events_between(
+                db.reads, ObjectId(current_user.get_id()), window_start, window_end, session=session
+            )
+
+        if request.accept_mimetypes.best == "application/json":
+            return jsonify({
+                "start": window_start.isoformat() + "Z",
+                "end": window_end.isoformat() + "Z",
+                "events": [event_json(event) for event in events],
+            })
+        return render_template("index.html", events = events, feed_url = user_feed_url(), view_title = title)
+
+    @flask_app.route("/upcoming")
+    @login_required
+    def upcoming():
+        """
+        Route listing the user's events from now on, soonest first.
+        Query parameters:
+            days: how many days ahead to look (default 7, at most 366)
+
+        Returns:
+            rendered template (str), or JSON if the client asks for it.
+        """
+        try:
+            days = min(max(int(request.args.get("days", 7)), 1), 366)
+        except ValueError:
+            return jsonify({"error": "days must be a number"}), 400
+        window_start = datetime.now(timezone.utc).replace(tzinfo=None)
+        title = "This week" if days == 7 else f"Next {days} days"
+        return render_schedule(window_start, window_start + timedelta(days=days), title)
+
+    @flask_app.route("/range")
+    @login_required
+    def date_range():
+        """
+        Route listing the user's events starting inside a date range, in start order.
+        Query parameters:
+            start, end: range bounds as YYYY-MM-DD (defaults to the next 31 days)
+
+        Returns:
+            rendered template (str), or JSON if the client asks for it.
+        """
+        try:
+            window_start, window_end = parse_window(request.args.get("start"), request.args.get("end"))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        title = f"{window_start:%b %d, %Y} to {window_end:%b %d, %Y}"
+        return render_schedule(window_start, window_end, title)
+
+    def user_feed_url():
+        """
+        Returns the webcal:// subscription URL of the current user's feed,
+        creating their secret feed token on first use.
+        """
+        feed_token = current_user.feed_token
+        if not feed_token:
+            user_id = ObjectId(current_user.get_id())
+            result = db.users.update_one(
+                {"_id": user_id, "feed_token": {"$exists": False}},
+                {"$set": {"feed_token": new_feed_token()}},
+            )
+            app.logger.debug("* user_feed_url(): token created: %s", bool(result.modified_count))
+            feed_token = db.users.find_one({"_id": user_id}, {"feed_token": 1})["feed_token"]
+            current_user.feed_token = feed_token
+        url = url_for("feed", token=feed_token, _external=True)
+        return "webcal://" + url.split("://", 1)[1]
+
+    @flask_app.route("/feed/<token>.ics")
+    def feed(token):
+        """
+        Route serving a user's whole calendar for calendar app subscriptions.
+        The feed is only rebuilt (incrementally) after the user's events change,
+        and polls with a matching If-None-Match get a 304.
+
+        Args:
+            token: The user's secret feed token
+
+        Returns:
+            The calendar feed response.
+        """
+        user_info = db.users.find_one({"feed_token": token}, {"feed_version": 1})
+        if not user_info:
+            return "Feed not found", 404
+
+        version = user_info.get("feed_version", 0)
+        etag = feed_etag(user_info["_id"], version)
+        not_modified = matching_etag(etag)
+        if not_modified:
+            response = Response(status=304)
+        else:
+            body = feed_cache.get(db, user_info["_id"], version)
+            response = Response(body, mimetype="text/calendar")
+        response.set_etag(not_modified or etag)
+        response.cache_control.no_cache = True
+        return response
     
+    @flask_app.route("/occurrences")
+    @login_required
+    def occurrences():
+        """
+        Route listing the occurrences of the user's recurring events inside a window.
+        Query parameters:
+            start, end: window bounds as YYYY-MM-DD (defaults to the next 31 days)
+            limit: maximum number of occurrences returned (default 500)
+
+        Returns:
+            JSON response with the occurrences in start order.
+        """
+        try:
+            window_start, window_end = parse_window(request.args.get("start"), request.args.get("end"))
+            limit = min(int(request.args.get("limit", 500)), 5000)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        # Only series that started before the window ends and were not over before it began
+        with causal_session() as session:
+            series = db.reads.events.find({
+                "user_id": ObjectId(current_user.get_id()),
+                "series.dtstart": {"$lt": window_end},
+                "$or": [{"series.until": None}, {"series.until": {"$gte": window_start}}],
+            }, {"series": 1, "event_data.name": 1, "event_data.location": 1}, session=session)
+
+            results = [
+                {
+                    "id": str(event["_id"]),
+                    "name": event.get("event_data", {}).get("name"),
+                    "location": event.get("event_data", {}).get("location"),
+                    "start": start.isoformat() + "Z",
+                    "end": end.isoformat() + "Z",
+                    "all_day": event["series"].get("all_day", False),
+                }
+                for start, end, event in expand_many(series, window_start, window_end, limit)
+            ]
+        return jsonify({"start": window_start.isoformat() + "Z",
+                        "end": window_end.isoformat() + "Z",
+                        "occurrences": results})
+
     @flask_app.route("/download/<id>")
     def download(id):
         """
@@ -184,10 +521,12 @@ def create_app():
             object_id = ObjectId(id)
 
             # Get the data from MongoDB
-            event_doc = db.events.find_one({'_id': object_id})
+            with causal_session() as session:
+                event_doc = db.reads.events.find_one({'_id': object_id}, session=session)
 
-            # Return the image as a response
-            return Response(event_doc['ics_file'], mimetype='text/calendar')
+            # Return the ics file with validators so clients can revalidate with a 304
+            last_modified = event_doc.get("updated_at") or event_doc.get("created_at")
+            return conditional_response(event_doc['ics_file'], 'text/calendar', last_modified)
 
         except Exception as e:
             flask_app.logger.error("Error streaming ics: %s", str(e))
@@ -209,7 +548,13 @@ def create_app():
             object_id = ObjectId(id)
 
             # Get the data from MongoDB
-            event_doc = db.events.delete_one({'_id': object_id})
+            with causal_session() as session:
+                event_doc = db.events.find_one_and_delete({'_id': object_id}, {"user_id": 1}, session=session)
+                if event_doc:
+                    forget_conflicts(db, event_doc.get("user_id"), [object_id], session=session)
+            if event_doc:
+                background_executor.submit(remove_ics_files, [object_id])
+                bump_feed_version(db, event_doc.get("user_id"))
 
             # Return the image as a response
             return redirect(url_for("index"))
@@ -218,6 +563,136 @@ def create_app():
             flask_app.logger.error("Error deleting event: %s", str(e))
             return handle_error(e)
 
+    def run_ics_client(entry_id, text=None, user_id=None):
+        """
+        Ask the ics-client service to (re)generate the event for an entry.
+        Passing the entry's text and user_id saves the ics-client reading the entry back.
+        Returns the requests response object.
+        """
+        return post_to_ics_client(
+            "/run-client",
+            json=ics_client_payload(entry_id, text, user_id),
+            timeout=ICS_CLIENT_TIMEOUT,
+        )
+
+    def bulk_request_ids():
+        """
+        Read the list of event ids from a bulk request's JSON body or form.
+        Returns the list, or None if it is missing or too long.
+        """
+        payload = request.get_json(silent=True)
+        ids = payload.get("ids") if isinstance(payload, dict) else request.form.getlist("ids")
+        if not isinstance(ids, list) or not ids or len(ids) > BULK_MAX_IDS:
+            return None
+        return ids
+
+    def find_owned_event_ids(object_ids):
+        """
+        Returns the subset of object_ids that belong to the current user.
+        """
+        owned = db.events.find(
+            {"_id": {"$in": list(object_ids)}, "user_id": ObjectId(current_user.get_id())},
+            {"_id": 1},
+        )
+        return {doc["_id"] for doc in owned}
+
+    def find_owned_source_ids(object_ids):
+        """
+        Returns the source entry id of each of object_ids that belongs to the current user,
+        by id. An event split off an entry has that entry as its source, any other is its own.
+        """
+        owned = db.events.find(
+            {"_id": {"$in": list(object_ids)}, "user_id": ObjectId(current_user.get_id())},
+            {"_id": 1, "source_entry_id": 1},
+        )
+        return {doc["_id"]: doc.get("source_entry_id") or doc["_id"] for doc in owned}
+
+    @flask_app.route("/events/bulk-delete", methods=["POST"])
+    @login_required
+    def bulk_delete():
+        """
+        Delete a list of the current user's events with a single delete_many.
+
+        Returns:
+            JSON response with a result per id: deleted, not_found or invalid_id.
+        """
+        ids = bulk_request_ids()
+        if ids is None:
+            return jsonify({"error": f"ids must be a list of 1 to {BULK_MAX_IDS} event ids"}), 400
+
+        object_ids, results = parse_object_ids(ids)
+        owned = find_owned_event_ids(object_ids.values())
+        deleted = 0
+        if owned:
+            with causal_session() as session:
+                deleted = db.events.delete_many(
+                    {"_id": {"$in": list(owned)}, "user_id": ObjectId(current_user.get_id())}, session=session
+                ).deleted_count
+                forget_conflicts(db, ObjectId(current_user.get_id()), owned, session=session)
+            background_executor.submit(remove_ics_files, owned)
+            bump_feed_version(db, ObjectId(current_user.get_id()))
+
+        for id_str, object_id in object_ids.items():
+            results[id_str] = "deleted" if object_id in owned else "not_found"
+
+        app.logger.debug("* bulk_delete(): deleted %s of %s events", deleted, len(ids))
+        return jsonify({"deleted": deleted, "results": results})
+
+    @flask_app.route("/events/bulk-regenerate", methods=["POST"])
+    @login_required
+    def bulk_regenerate():
+        """
+        Regenerate a list of the current user's events through the ics-client,
+        with at most BULK_REGENERATE_WORKERS requests in flight. Events split off
+        the same entry are regenerated together, with a single request for that entry.
+
+        Returns:
+            JSON response with a result per id.
+        """
+        ids = bulk_request_ids()
+        if ids is None:
+            return jsonify({"error": f"ids must be a list of 1 to {BULK_MAX_IDS} event ids"}), 400
+
+        object_ids, results = parse_object_ids(ids)
+        results = {id_str: {"status": status} for id_str, status in results.items()}
+        source_ids = find_owned_source_ids(object_ids.values())
+
+        def regenerate(entry_id):
+            try:
+                response = run_ics_client(entry_id)
+            except requests.exceptions.RequestException as e:
+                app.logger.error("*** bulk_regenerate(): Request failed: %s", e)
+                return {"status": "error", "error_code": 500}
+            if response.status_code == 200:
+                return {"status": "updated"}
+            return {"status": "error", "error_code": response.json().get("error_code")}
+
+        # Requested ids by source entry. The ics-client regenerates an event's source entry,
+        # so any id of a group regenerates the whole group, and reports its deleted source.
+        groups = {}
+        for id_str, object_id in object_ids.items():
+            if object_id in source_ids:
+                groups.setdefault(source_ids[object_id], []).append(id_str)
+        group_ids = list(groups.values())
+        with ThreadPoolExecutor(max_workers=BULK_REGENERATE_WORKERS) as executor:
+            for id_strs, result in zip(group_ids, executor.map(regenerate, [ids[0] for ids in group_ids])):
+                for id_str in id_strs:
+                    results[id_str] = result
+
+        for id_str in object_ids:
+            results.setdefault(id_str, {"status": "not_found"})
+
+        return jsonify({"results": results})
+
+    @flask_app.route("/metrics")
+    def metrics():
+        """
+        Route exposing the circuit breaker of the ics-client hop in the Prometheus
+        text format. Each worker process reports its own breaker.
+        """
+        return Response(render_metrics([ics_client_breaker]),
+                        content_type="text/plain; version=0.0.4; charset=utf-8")
+
     @flask_app.errorhandler(Exception)
     def handle_error(e):
         """
@@ -229,6 +704,83 @@ def create_app():
         """
         return render_template("error.html", error=e)
     
+    @flask_app.route("/prefetch-event", methods=["POST"])
+    @login_required
+    def prefetch_event():
+        """
+        Route called by the index page once the description input settles.
+        Starts extraction in the ics-client so the result is ready when the
+        form is submitted with the same text.
+
+        Returns:
+            JSON response with the ics-client's status.
+        """
+        payload = request.get_json(silent=True) or {}
+        text = str(payload.get("text") or "").strip()
+        if len(text) < PREFETCH_MIN_LENGTH:
+            return jsonify({"status": "skipped"}), 200
+
+        try:
+            response = post_to_ics_client(
+                "/prefetch",
+                json={"user_id": current_user.get_id(), "text": text},
+                timeout=2,
+            )
+        except requests.exceptions.RequestException as e:
+            app.logger.debug("* prefetch_event(): Request failed: %s", e)
+            return jsonify({"status": "unavailable"}), 200
+        return jsonify(response.json()), response.status_code
+
+    @flask_app.route("/generate-event/<id>/stream")
+    @login_required
+    def generate_event_stream(id):
+        """
+        Route streaming the generation of a submitted entry as Server-Sent Events.
+        Relays the ics-client's status, field and event messages, so the index
+        page can fill in the event while the model is still answering. The
+        generation itself runs in the ics-client, leaving the stream does not stop it.
+        If the entry was already generated, only a done message is sent.
+        """
+        try:
+            object_id = ObjectId(id)
+        except InvalidId:
+            return jsonify({"error": "Invalid id"}), 400
+        entry = db.events.find_one(
+            {"_id": object_id, "user_id": ObjectId(current_user.get_id())},
+            {"ics_file_path": 1, "text": 1, "user_id": 1},
+        )
+        if entry is None:
+            return jsonify({"error": "Event not found"}), 404
+
+        def generate():
+            if entry.get("ics_file_path"):
+                derived = db.events.find({"source_entry_id": entry["_id"]}, {"_id": 1})
+                entry_ids = [str(entry["_id"])] + [str(doc["_id"]) for doc in derived]
+                yield sse_message("done", {"entry_ids": entry_ids})
+                return
+            try:
+                response = post_to_ics_client(
+                    "/run-client/stream",
+                    json=ics_client_payload(id, entry.get("text"), entry.get("user_id")),
+                    stream=True,
+                    timeout=(5, GENERATE_STREAM_TIMEOUT),
+                )
+            except requests.exceptions.RequestException as e:
+                app.logger.error("*** generate_event_stream(): Request failed: %s", e)
+                yield sse_message("error", {"error": "Error creating ICS file", "error_code": 500})
+                return
+            try:
+                for chunk in response.iter_content(chunk_size=None):
+                    yield chunk
+            except requests.exceptions.RequestException as e:
+                app.logger.error("*** generate_event_stream(): Stream failed: %s", e)
+                yield sse_message("error", {"error": "Error creating ICS file", "error_code": 500})
+            finally:
+                response.close()
+
+        return Response(generate(), mimetype="text/event-stream",
+                        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
     @flask_app.route("/generate-event", methods=["POST"])
     @login_required
     def generate_event():
@@ -248,17 +800,23 @@ def create_app():
             "created_at": datetime.now()
         }
 
-        new_entry_id = db.events.insert_one(doc).inserted_id
+        with causal_session() as session:
+            new_entry_id = db.events.insert_one(doc, session=session).inserted_id
         app.logger.debug("* generate_event(): Inserted 1 entry: %s", new_entry_id)
+        if db.routes_reads:
+            flask_session["pending_entry"] = [str(new_entry_id), time.time()]
+
+        # The index page follows the generation as a stream, see generate_event_stream
+        if request.accept_mimetypes.best == "application/json":
+            start_generation(ics_client_payload(new_entry_id, text, user_id))
+            return jsonify({
+                "entry_id": str(new_entry_id),
+                "stream_url": url_for("generate_event_stream", id=new_entry_id),
+            }), 202
 
         # Trigger the /run-client endpoint in the ml_client service
-        run_client_url = "http://ics-client:5001/run-client"
         try:
-            response = requests.post(
-                run_client_url,
-                json={"entry_id": str(new_entry_id)},
-                timeout=5,
-            )
+            response = run_ics_client(new_entry_id, text, user_id)
         except requests.exceptions.RequestException as e:
             app.logger.error("*** generate_event(): Request failed: %s", e)
             return "Error creating ICS file", 500
@@ -284,6 +842,8 @@ def create_app():
                                 *Note* The event date should not span multiple days.
                                 Example: Birthday party next Friday from 5pm to 8pm at Lisa's house. 
                             """
+        elif error_code == 429:
+            error_message = "You have reached today's limit for generating events. Please try again tomorrow."
         else:
             error_message = "Error generating event and ICS file. Please return to the homepage and try again."
         return render_template("error.html", error=error_message)  
@@ -0,0 +1,154 @@
+"""
+Per-user calendar subscription feeds.
+Each user document carries a secret feed_token and a feed_version that is
+bumped whenever one of their events is stored or deleted. Feeds are cached
+per process and patched incrementally when the version moves on.
+"""
+
+import secrets
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+FEED_HEADER = (
+    b"BEGIN:VCALENDAR\r\n"
+    b"VERSION:2.0\r\n"
+    b"PRODID:-//dot-ics//ICS File Generator//EN\r\n"
+    b"CALSCALE:GREGORIAN\r\n"
+    b"X-WR-CALNAME:ICS File Generator\r\n"
+)
+FEED_FOOTER = b"END:VCALENDAR\r\n"
+
+# Events written by the ics-client are matched on updated_at, allow for clock skew between the services
+CLOCK_SKEW = timedelta(seconds=30)
+
+
+def new_feed_token():
+    """
+    Returns a new secret token for a user's feed URL.
+    """
+    return secrets.token_urlsafe(24)
+
+
+def feed_etag(user_id, version):
+    """
+    Returns the ETag of a user's feed, which only changes with its version.
+    """
+    return f"feed-{user_id}-{version or 0}"
+
+
+def bump_feed_version(db, user_id):
+    """
+    Mark a user's feed as changed.
+    """
+    if user_id is None:
+        return
+    db.users.update_one({"_id": user_id}, {"$inc": {"feed_version": 1}})
+
+
+def extract_components(ics_file):
+    """
+    Returns the VEVENT components (with any nested VALARMs) of a calendar file, as bytes.
+    """
+    if isinstance(ics_file, str):
+        ics_file = ics_file.encode("utf-8")
+    if not ics_file:
+        return b""
+    start = ics_file.find(b"BEGIN:VEVENT")
+    end = ics_file.rfind(b"END:VEVENT")
+    if start == -1 or end == -1:
+        return b""
+    components = ics_file[start:end + len(b"END:VEVENT")]
+    return components.replace(b"\r\n", b"\n").replace(b"\n", b"\r\n") + b"\r\n"
+
+
+class _Feed:
+    """
+    Cached feed of one user: VEVENT bytes per event id and the assembled body.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.version = None
+        self.synced_at = None
+        self.components = OrderedDict()
+        self.body = None
+
+    def assemble(self):
+        self.body = FEED_HEADER + b"".join(self.components.values()) + FEED_FOOTER
+
+
+class FeedCache:
+    """
+    Class caching assembled feeds for the most recently polled users.
+    """
+
+    def __init__(self, max_users=1000):
+        self.max_users = max_users
+        self._feeds = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _query(self, user_id):
+        return {"user_id": user_id, "ics_file": {"$exists": True}}
+
+    def _rebuild(self, db, user_id, feed):
+        feed.components.clear()
+        for doc in db.events.find(self._query(user_id), {"ics_file": 1}).sort("_id", 1):
+            feed.components[doc["_id"]] = extract_components(doc["ics_file"])
+
+    def _patch(self, db, user_id, feed):
+        """
+        Bring a cached feed up to date: drop deleted events, then fetch only
+        new events and those stored again since the last sync.
+        """
+        ids = {doc["_id"] for doc in db.events.find(self._query(user_id), {"_id": 1})}
+        for event_id in [event_id for event_id in feed.components if event_id not in ids]:
+            del feed.components[event_id]
+
+        new_ids = [event_id for event_id in ids if event_id not in feed.components]
+        changed = db.events.find(
+            {
+                **self._query(user_id),
+                "$or": [
+                    {"_id": {"$in": new_ids}},
+                    {"updated_at": {"$gt": feed.synced_at - CLOCK_SKEW}},
+                ],
+            },
+            {"ics_file": 1},
+        )
+        for doc in changed:
+            feed.components[doc["_id"]] = extract_components(doc["ics_file"])
+
+        if new_ids:
+            feed.components = OrderedDict(sorted(feed.components.items()))
+
+    def get(self, db, user_id, version):
+        """
+        Returns the feed body for a user at the given feed version.
+        """
+        with self._lock:
+            feed = self._feeds.pop(user_id, None) or _Feed()
+            self._feeds[user_id] = feed
+            while len(self._feeds) > self.max_users:
+                self._feeds.popitem(last=False)
+
+        with feed.lock:
+            if feed.version == version and feed.body is not None:
+                return feed.body
+
+            synced_at = datetime.now(timezone.utc).replace(tzinfo=None)
+            if feed.synced_at is None:
+                self._rebuild(db, user_id, feed)
+            else:
+                self._patch(db, user_id, feed)
+            feed.assemble()
+            feed.version = version
+            feed.synced_at = synced_at
+            return feed.body
+
+    def invalidate(self, user_id):
+        """
+        Forget the cached feed of a user.
+        """
+        with self._lock:
+            self._feeds.pop(user_id, None)
@@ -0,0 +1,38 @@
+"""
+Gunicorn configuration for running the web app in production.
+Usage: gunicorn -c gunicorn.conf.py app:app
+"""
+
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.getenv('FLASK_PORT', '5000')}"
+
+# Workers scale with cores, threads cover the time spent waiting on MongoDB and the ics-client
+workers = int(os.getenv("WEB_CONCURRENCY", str(multiprocessing.cpu_count() * 2 + 1)))
+threads = int(os.getenv("GUNICORN_THREADS", "4"))
+worker_class = "gthread"
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "30"))
+graceful_timeout = 30
+keepalive = 5
+
+# Import the app once in the master: the database is initialized a single time
+# and the master's MongoClient is closed before workers are forked
+preload_app = True
+
+# Recycle workers now and then to keep memory in check
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "1000"))
+max_requests_jitter = 100
+
+accesslog = "-"
+errorlog = "-"
+loglevel = os.getenv("GUNICORN_LOG_LEVEL", "info")
+
+
+def post_fork(server, worker):  # pylint: disable=unused-argument
+    """
+    Drop any MongoClient inherited from the master, the worker opens its own lazily.
+    """
+    from app import app  # pylint: disable=import-outside-toplevel
+
+    app.extensions["mongo"].close()
@@ -0,0 +1,187 @@
+"""
+HTTP caching helpers for the Flask web app.
+Adds validators to downloads, compresses large responses,
+and fingerprints static asset URLs so they can be cached for a long time.
+"""
+
+import gzip
+import hashlib
+import os
+from flask import Response, current_app, request
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip is always available
+    brotli = None
+
+# Responses smaller than this are sent as-is, compressing them costs more than it saves
+COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", "500"))
+COMPRESS_LEVEL = int(os.getenv("COMPRESS_LEVEL", "6"))
+STATIC_MAX_AGE = int(os.getenv("STATIC_MAX_AGE", str(365 * 24 * 60 * 60)))
+
+COMPRESSIBLE_MIMETYPES = {
+    "text/html",
+    "text/css",
+    "text/plain",
+    "text/calendar",
+    "application/javascript",
+    "text/javascript",
+    "application/json",
+}
+
+
+def content_etag(content):
+    """
+    Returns a strong ETag value (sha256 of the content).
+    """
+    if isinstance(content, str):
+        content = content.encode("utf-8")
+    return hashlib.sha256(content).hexdigest()
+
+
+def matching_etag(etag):
+    """
+    Returns the ETag the request's If-None-Match matches: etag itself, or the one
+    compress_response gives its encoding for this request. Returns None otherwise.
+    Checked before building a body, so a poll that gets a 304 is not compressed first.
+    """
+    if request.if_none_match.contains_weak(etag):
+        return etag
+    encoding = _choose_encoding()
+    if encoding is not None and request.if_none_match.contains_weak(f"{etag}-{encoding}"):
+        return f"{etag}-{encoding}"
+    return None
+
+
+def conditional_response(content, mimetype, last_modified=None):
+    """
+    Build a response carrying an ETag and Last-Modified header.
+    Returns a 304 with an empty body when the request's
+    If-None-Match / If-Modified-Since validators still match.
+    """
+    etag = content_etag(content)
+    not_modified = matching_etag(etag)
+    response = Response(status=304) if not_modified else Response(content, mimetype=mimetype)
+    response.set_etag(not_modified or etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.cache_control.no_cache = True  # always revalidate, but allow 304s
+    if not_modified:
+        return response
+    return response.make_conditional(request)
+
+
+def _choose_encoding():
+    """
+    Pick the best encoding the client accepts, brotli first when installed.
+    """
+    accepted = request.accept_encodings
+    if brotli is not None and accepted["br"]:
+        return "br"
+    if accepted["gzip"]:
+        return "gzip"
+    return None
+
+
+def _compress(data, encoding):
+    """
+    Returns data compressed with the given encoding.
+    """
+    if encoding == "br":
+        return brotli.compress(data, quality=min(COMPRESS_LEVEL, 11))
+    return gzip.compress(data, compresslevel=COMPRESS_LEVEL)
+
+
+def compress_response(response):
+    """
+    after_request hook compressing responses above COMPRESS_MIN_SIZE.
+    Static files are sent straight from disk otherwise, so their compressed
+    bodies are cached per ETag and encoding.
+    """
+    response.vary.add("Accept-Encoding")
+    static = response.direct_passthrough and request.endpoint == "static"
+    if (
+        response.status_code != 200
+        or ((response.direct_passthrough or response.is_streamed) and not static)
+        or "Content-Encoding" in response.headers
+        or response.mimetype not in COMPRESSIBLE_MIMETYPES
+    ):
+        return response
+
+    encoding = _choose_encoding()
+    if encoding is None:
+        return response
+
+    response.direct_passthrough = False
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_SIZE:
+        return response
+
+    etag, weak = response.get_etag()
+    if static and etag:
+        cache = current_app.extensions.setdefault("static_compressed", {})
+        if (etag, encoding) not in cache:
+            cache[(etag, encoding)] = _compress(data, encoding)
+        compressed = cache[(etag, encoding)]
+    else:
+        compressed = _compress(data, encoding)
+
+    response.set_data(compressed)
+    response.headers["Content-Encoding"] = encoding
+    # Byte ranges of the encoded body would not match those of the file
+    response.headers.pop("Accept-Ranges", None)
+
+    # The encoded body is a different representation, so it gets its own strong ETag.
+    # The validators were checked against the plain one, so they are checked again.
+    if etag:
+        response.set_etag(f"{etag}-{encoding}", weak=weak)
+        response.make_conditional(request)
+    return response
+
+
+def _static_fingerprint(filename):
+    """
+    Returns a short content hash for a file in the static folder, cached per file.
+    """
+    cache = current_app.extensions.setdefault("static_fingerprints", {})
+    if filename not in cache:
+        path = os.path.join(current_app.static_folder, filename)
+        try:
+            with open(path, "rb") as static_file:
+                cache[filename] = hashlib.md5(static_file.read()).hexdigest()[:12]
+        except OSError:
+            cache[filename] = None
+    return cache[filename]
+
+
+def add_static_fingerprint(endpoint, values):
+    """
+    url_defaults hook appending ?v=<hash> to static asset URLs.
+    """
+    if endpoint != "static" or "v" in values or "filename" not in values:
+        return
+    fingerprint = _static_fingerprint(values["filename"])
+    if fingerprint:
+        values["v"] = fingerprint
+
+
+def cache_static_assets(response):
+    """
+    after_request hook giving fingerprinted static assets a long-lived Cache-Control.
+    """
+    if request.endpoint == "static" and request.args.get("v") and response.status_code in (200, 304):
+        # send_file marks static files no-cache, which would make browsers revalidate anyway
+        response.cache_control.no_cache = None
+        response.cache_control.public = True
+        response.cache_control.max_age = STATIC_MAX_AGE
+        response.cache_control.immutable = True
+    return response
+
+
+def init_http_cache(flask_app):
+    """
+    Register the caching and compression hooks on the Flask app.
+    """
+    flask_app.url_defaults(add_static_fingerprint)
+    flask_app.after_request(cache_static_assets)
+    flask_app.after_request(compress_response)
@@ -0,0 +1,190 @@
+"""
+MongoDB connection handling for the web app.
+Clients are created lazily and per process, so the app can be
+imported by a preforking server without sharing a MongoClient across fork.
+Read-heavy routes can be routed to secondaries with MONGO_READ_PREFERENCE;
+causal_token and advance_session carry a user's position in the oplog from
+one request to the next so they still read their own writes.
+"""
+
+import base64
+import os
+import threading
+import bson
+from bson.errors import BSONError
+import pymongo
+from bson.timestamp import Timestamp
+from pymongo import ReadPreference
+from pymongo.read_concern import ReadConcern
+
+# Set once the database has been initialized, inherited by forked workers
+INITIALIZED_ENV = "DOT_ICS_DB_INITIALIZED"
+
+READ_PREFERENCES = {
+    "primary": ReadPreference.PRIMARY,
+    "primaryPreferred": ReadPreference.PRIMARY_PREFERRED,
+    "secondary": ReadPreference.SECONDARY,
+    "secondaryPreferred": ReadPreference.SECONDARY_PREFERRED,
+    "nearest": ReadPreference.NEAREST,
+}
+
+
+class LazyDatabase:
+    """
+    Proxy to a MongoDB database.
+    A MongoClient is only created on first use, and again in any
+    process forked after that, so each worker gets its own connection pool.
+    """
+
+    def __init__(self, uri=None, dbname=None, read_preference=None):
+        self._uri = uri
+        self._dbname = dbname
+        self._read_preference = read_preference
+        self._client = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        """
+        Returns the MongoClient owned by the current process.
+        """
+        if self._client is None or self._pid != os.getpid():
+            with self._lock:
+                if self._client is None or self._pid != os.getpid():
+                    # Never close a client inherited from the parent, it belongs to that process
+                    self._client = pymongo.MongoClient(self._uri or os.getenv("MONGO_URI"))
+                    self._pid = os.getpid()
+        return self._client
+
+    @property
+    def database(self):
+        """
+        Returns the pymongo Database object for the current process.
+        """
+        return self.client[self._dbname or os.getenv("MONGO_DBNAME")]
+
+    @property
+    def read_preference(self):
+        """
+        Returns the name of the read preference for routed reads (MONGO_READ_PREFERENCE, default primary).
+        """
+        name = self._read_preference or os.getenv("MONGO_READ_PREFERENCE") or "primary"
+        if name not in READ_PREFERENCES:
+            raise ValueError(f"Unknown read preference {name!r}, expected one of {', '.join(READ_PREFERENCES)}")
+        return name
+
+    @property
+    def routes_reads(self):
+        """
+        Returns True if routed reads may go to secondaries.
+        """
+        return self.read_preference != "primary"
+
+    @property
+    def reads(self):
+        """
+        Returns the database for list and download reads.
+        Unless reads stay on the primary, they use the configured read preference
+        and majority read concern, which causally consistent sessions need to
+        guarantee reading your own (majority) writes.
+        """
+        if not self.routes_reads:
+            return self.database
+        return self.client.get_database(
+            self._dbname or os.getenv("MONGO_DBNAME"),
+            read_preference=READ_PREFERENCES[self.read_preference],
+            read_concern=ReadConcern("majority"),
+        )
+
+    def close(self):
+        """
+        Close this process's client. The next access opens a new one.
+        """
+        with self._lock:
+            if self._client is not None and self._pid == os.getpid():
+                self._client.close()
+            self._client = None
+            self._pid = None
+
+    def __getattr__(self, name):
+        return getattr(self.database, name)
+
+    def __getitem__(self, name):
+        return self.database[name]
+
+
+def causal_token(session):
+    """
+    Returns the operation and cluster time a causally consistent session has seen,
+    in a form that fits in the Flask session, or None if it has not seen any yet.
+    """
+    if session is None or session.operation_time is None:
+        return None
+    token = {"operation_time": [session.operation_time.time, session.operation_time.inc]}
+    if session.cluster_time is not None:
+        token["cluster_time"] = base64.b64encode(bson.encode(session.cluster_time)).decode("ascii")
+    return token
+
+
+def advance_session(session, token):
+    """
+    Move a session forward to a token from causal_token, so its reads wait
+    until the server has caught up with it. Malformed tokens are ignored.
+    """
+    if session is None or not token:
+        return
+    try:
+        if token.get("cluster_time"):
+            session.advance_cluster_time(bson.decode(base64.b64decode(token["cluster_time"])))
+        session.advance_operation_time(Timestamp(*token["operation_time"]))
+    except (KeyError, TypeError, ValueError, BSONError):
+        pass
+
+
+def ensure_indexes(db):
+    """
+    Create the indexes the app's queries rely on.
+    """
+    # Recurring series of a user, range-scanned by first occurrence
+    db.events.create_index(
+        [("user_id", pymongo.ASCENDING), ("series.dtstart", pymongo.ASCENDING)],
+        partialFilterExpression={"series": {"$exists": True}},
+    )
+    # A user's events by when they happen, range-scanned by the upcoming and range views, see schedule.py
+    db.events.create_index([("user_id", pymongo.ASCENDING), ("event_data.start", pymongo.ASCENDING)])
+    # Prefix search over the words of a user's events, see search.py
+    db.events.create_index([("user_id", pymongo.ASCENDING), ("search_terms", pymongo.ASCENDING)])
+    # Logins by name; also what keeps two sign-ups from taking the same name
+    db.users.create_index("username", unique=True)
+    # Feed lookups by secret token
+    db.users.create_index("feed_token", unique=True, sparse=True)
+
+
+def init_database_once(db):
+    """
+    Ping MongoDB and drop all collections, once per server.
+    The first process to get here marks the environment, so workers
+    forked from it (or started by the same master) skip the drop.
+    Closes the client afterwards so nothing is shared across fork.
+    """
+    if os.environ.get(INITIALIZED_ENV):
+        return False
+
+    try:
+        db.client.admin.command("ping")
+        print(" *", "Connected to MongoDB!")
+    except Exception as e:  # pylint: disable=broad-exception-caught
+        print(" * MongoDB connection error:", e)
+
+    # Drop all collections to prevent duplicated data getting
+    # inserted into the database whenever the app is restarted
+    collections = db.list_collection_names()
+    for collection in collections:
+        db[collection].drop()
+
+    ensure_indexes(db)
+
+    os.environ[INITIALIZED_ENV] = "1"
+    db.close()
+    return True
@@ -0,0 +1,235 @@
+"""
+On-demand request profiling.
+A profiled request is sampled from a side thread: every few milliseconds the
+stack of the thread serving it is read with sys._current_frames(), and the
+counts per stack are written in the collapsed format flamegraph.pl and
+speedscope read. Requests are profiled when they carry the X-Profile header
+with PROFILE_TOKEN, or at random at PROFILE_SAMPLE_RATE. Profiles go to
+PROFILE_DIR, of which only the newest PROFILE_MAX_FILES are kept, and are
+listed and fetched from /profiles with the same header. With neither setting
+no hooks are registered, so requests are not slowed down at all.
+The ics-client keeps a copy of this module.
+"""
+
+import hmac
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+
+from flask import abort, g, has_request_context, jsonify, request, send_from_directory
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = "X-Profile"
+PROFILE_SUFFIX = ".folded"
+
+
+def frame_name(code):
+    """
+    Returns how a function shows in a collapsed stack.
+    """
+    name = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+    return name.replace(";", ":")
+
+
+class SamplingProfiler:
+    """
+    Class sampling the stack of one thread from a daemon thread until stopped.
+    """
+
+    def __init__(self, thread_id, interval=0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)  # pylint: disable=protected-access
+            names = []
+            while frame is not None:
+                names.append(frame_name(frame.f_code))
+                frame = frame.f_back
+            if names:
+                self.stacks[";".join(reversed(names))] += 1
+
+    def start(self):
+        """
+        Start sampling.
+        """
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """
+        Stop sampling. Returns the sample count of each collapsed stack.
+        """
+        self._stop.set()
+        self._thread.join()
+        return self.stacks
+
+
+class ProfileStore:
+    """
+    Class keeping the newest profiles in a directory.
+    """
+
+    def __init__(self, directory, max_files=50):
+        self.directory = directory
+        self.max_files = max_files
+
+    def new_name(self, label):
+        """
+        Returns a file name for a profile, sorting by when it started.
+        """
+        started = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%f")
+        safe_label = "".join(c if c.isalnum() or c in "-_." else "_" for c in label)
+        return f"{started}-{safe_label}-{uuid.uuid4().hex[:8]}{PROFILE_SUFFIX}"
+
+    def write(self, name, stacks):
+        """
+        Write a profile in the collapsed stack format, then drop the oldest beyond max_files.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, name)
+        with open(path + ".tmp", "w", encoding="utf-8") as profile_file:
+            for stack, count in stacks.most_common():
+                profile_file.write(f"{stack} {count}\n")
+        os.replace(path + ".tmp", path)
+        for old in self.names()[self.max_files:]:
+            try:
+                os.remove(os.path.join(self.directory, old))
+            except FileNotFoundError:  # another worker pruned it first
+                pass
+
+    def names(self):
+        """
+        Returns the stored profile names, newest first.
+        """
+        try:
+            names = [name for name in os.listdir(self.directory) if name.endswith(PROFILE_SUFFIX)]
+        except FileNotFoundError:
+            return []
+        return sorted(names, reverse=True)
+
+    def describe(self):
+        """
+        Returns the stored profiles with their size and time, newest first.
+        """
+        profiles = []
+        for name in self.names():
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                continue
+            profiles.append({
+                "name": name,
+                "size": stat.st_size,
+                "written_at": datetime.fromtimestamp(stat.st_mtime, timezone.utc).isoformat(),
+            })
+        return profiles
+
+
+def profile_headers():
+    """
+    Returns the headers that profile the request's calls to another service too,
+    or {} if the current request is not profiled with a token.
+    """
+    if not has_request_context():
+        return {}
+    token = g.get("profile_token")
+    return {PROFILE_HEADER: token} if token else {}
+
+
+def init_profiling(flask_app, token=None, sample_rate=None, directory=None, max_files=None, interval=None):
+    """
+    Register the profiling hooks and the /profiles routes on the Flask app,
+    if a token or a sample rate is configured. Arguments default to the
+    PROFILE_* environment variables. Returns the ProfileStore, or None if profiling is off.
+    """
+    token = token if token is not None else os.getenv("PROFILE_TOKEN", "")
+    sample_rate = sample_rate if sample_rate is not None else float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+    if not token and sample_rate <= 0:
+        return None
+    interval = interval if interval is not None else float(os.getenv("PROFILE_INTERVAL_MS", "5")) / 1000
+    store = ProfileStore(
+        directory or os.getenv("PROFILE_DIR", "./profiles"),
+        max_files if max_files is not None else int(os.getenv("PROFILE_MAX_FILES", "50")),
+    )
+
+    def authorized():
+        sent = request.headers.get(PROFILE_HEADER, "")
+        return bool(token) and hmac.compare_digest(sent.encode(), token.encode())
+
+    def finish_profile(name, path, started, profiler):
+        # Runs when the response is closed, after the request context is gone
+        stacks = profiler.stop()
+        try:
+            store.write(name, stacks)
+        except OSError as e:
+            logger.warning("Could not write profile %s: %s", name, e)
+            return
+        logger.info("Profiled %s in %.0f ms: %s", path, (time.monotonic() - started) * 1000, name)
+
+    def start_profile():
+        if request.endpoint in ("list_profiles", "get_profile"):
+            return
+        by_header = authorized()
+        if not by_header and not (sample_rate > 0 and random.random() < sample_rate):
+            return
+        if token:
+            g.profile_token = token
+        g.profile = (
+            store.new_name(f"{request.method}-{request.endpoint or 'unknown'}"),
+            request.path,
+            time.monotonic(),
+            SamplingProfiler(threading.get_ident(), interval).start(),
+        )
+
+    def attach_profile(response):
+        profile = g.pop("profile", None)
+        if profile is not None:
+            response.headers["X-Profile-Id"] = profile[0]
+            # Streamed bodies are generated after this, so sampling ends once the response is closed
+            response.call_on_close(lambda: finish_profile(*profile))
+        return response
+
+    def abandon_profile(error):
+        # Requests that raised never reach after_request
+        profile = g.pop("profile", None)
+        if profile is not None:
+            finish_profile(*profile)
+
+    flask_app.before_request(start_profile)
+    flask_app.after_request(attach_profile)
+    flask_app.teardown_request(abandon_profile)
+
+    @flask_app.route("/profiles")
+    def list_profiles():
+        """
+        Returns the stored profiles, newest first. Needs the X-Profile header.
+        """
+        if not authorized():
+            abort(403)
+        return jsonify({"profiles": store.describe()})
+
+    @flask_app.route("/profiles/<name>")
+    def get_profile(name):
+        """
+        Returns one stored profile in the collapsed stack format. Needs the X-Profile header.
+        """
+        if not authorized():
+            abort(403)
+        if not name.endswith(PROFILE_SUFFIX):
+            abort(404)
+        return send_from_directory(os.path.abspath(store.directory), name, mimetype="text/plain")
+
+    flask_app.extensions["profiling"] = store
+    return store
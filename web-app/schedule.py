@@ -0,0 +1,99 @@
+"""
+When events happen.
+The ics-client stores event_data.start and event_data.end as naive UTC
+datetimes (all-day events at their local midnight, with all_day set) along with the
+event's timezone, so a user's events can be range-scanned on the
+(user_id, event_data.start) index. Formatting for display happens here, at
+render time.
+"""
+
+import heapq
+from datetime import datetime, timezone
+from itertools import islice
+from zoneinfo import ZoneInfo
+
+import pymongo
+
+from recurrence import expand_many
+
+DEFAULT_TIMEZONE = "America/New_York"
+DATETIME_FORMAT = "%b %d, %Y %l:%M%p"
+DATE_FORMAT = "%b %d, %Y"
+MAX_EVENTS = 500
+
+
+def format_event_time(event_data, field="start"):
+    """
+    Returns the start or end of an event for display in the event's timezone,
+    or "" if it has none. Values stored as strings are shown as they are.
+    """
+    value = (event_data or {}).get(field)
+    if value is None:
+        return ""
+    if not isinstance(value, datetime):
+        return str(value)
+    tz = ZoneInfo(event_data.get("timezone") or DEFAULT_TIMEZONE)
+    local = value.replace(tzinfo=timezone.utc).astimezone(tz)
+    return local.strftime(DATE_FORMAT if event_data.get("all_day") else DATETIME_FORMAT)
+
+
+def event_json(event):
+    """
+    Returns an event document as a JSON-friendly dict, with times in ISO 8601 UTC.
+    """
+    data = {"id": str(event["_id"])}
+    for key, value in (event.get("event_data") or {}).items():
+        data[key] = value.isoformat() + "Z" if isinstance(value, datetime) else value
+    return data
+
+
+def forget_conflicts(db, user_id, event_ids, session=None):
+    """
+    Removes deleted events from the conflicts the ics-client stored on the user's other events.
+    """
+    db.events.update_many(
+        {"user_id": user_id, "conflicts.id": {"$in": list(event_ids)}},
+        {"$pull": {"conflicts": {"id": {"$in": list(event_ids)}}}},
+        session=session,
+    )
+
+
+def _occurrence(event, start, end):
+    """
+    Returns a copy of a recurring event moved to one of its occurrences.
+    """
+    event_data = dict(event.get("event_data") or {})
+    event_data["start"] = start
+    event_data["end"] = end if end > start else None
+    return {**event, "event_data": event_data}
+
+
+def find_events_between(db, user_id, window_start, window_end, limit=MAX_EVENTS, session=None):
+    """
+    Returns a user's events starting in [window_start, window_end) in start order,
+    at most `limit` of them. Single events come from a range scan on
+    (user_id, event_data.start); recurring events contribute each occurrence
+    in the window.
+    """
+    single = db.events.find(
+        {
+            "user_id": user_id,
+            "event_data.start": {"$gte": window_start, "$lt": window_end},
+            "series": {"$exists": False},
+        },
+        session=session,
+    ).sort("event_data.start", pymongo.ASCENDING).limit(limit)
+
+    series = db.events.find({
+        "user_id": user_id,
+        "series.dtstart": {"$lt": window_end},
+        "$or": [{"series.until": None}, {"series.until": {"$gte": window_start}}],
+    }, session=session)
+    occurrences = (
+        _occurrence(event, start, end)
+        for start, end, event in expand_many(series, window_start, window_end, limit)
+        if start >= window_start
+    )
+
+    merged = heapq.merge(single, occurrences, key=lambda event: event["event_data"]["start"])
+    return list(islice(merged, limit))
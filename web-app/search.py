@@ -0,0 +1,88 @@
+"""
+Search over a user's events.
+The ics-client stores the lowercased words of each event's name, description
+and location in `search_terms` (and the name's words in `name_terms`).
+Queries match every query word as a prefix of some term, which is an index
+range scan on (user_id, search_terms), then the candidates are ranked here.
+Every match is ranked, read in index order without a sort, and only the best
+ones up to the requested page are kept in a heap. So a query costs time linear
+in the number of the user's events it matches, and memory for page * page_size
+events.
+"""
+
+import heapq
+import re
+from datetime import datetime
+
+PAGE_SIZE = 20
+MAX_QUERY_TERMS = 8
+# Candidates read from MongoDB per round trip
+CANDIDATE_BATCH_SIZE = 1000
+
+TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text):
+    """
+    Split text into lowercased words. Must match the ics-client's tokenizer.
+    """
+    if not text:
+        return []
+    return TOKEN_PATTERN.findall(str(text).lower())
+
+
+def build_query(user_id, query_terms):
+    """
+    Returns the MongoDB filter matching events where every query term
+    is a prefix of one of the event's search terms.
+    """
+    return {
+        "user_id": user_id,
+        "$and": [{"search_terms": {"$regex": "^" + re.escape(term)}} for term in query_terms],
+    }
+
+
+def score(doc, query_terms):
+    """
+    Rank a candidate: exact word matches beat prefix matches,
+    and matches in the event name count three times.
+    """
+    name_terms = set(doc.get("name_terms") or [])
+    terms = set(doc.get("search_terms") or [])
+    total = 0
+    for term in query_terms:
+        weight = 3 if any(name_term.startswith(term) for name_term in name_terms) else 1
+        total += weight * (2 if term in terms else 1)
+    return total
+
+
+def search_events(db, user_id, query, page=1, page_size=PAGE_SIZE, session=None):
+    """
+    Search a user's events, optionally within a causally consistent session.
+    Returns:
+        tuple: (list of event documents for the page, bool whether more results exist)
+    """
+    query_terms = list(dict.fromkeys(tokenize(query)))[:MAX_QUERY_TERMS]
+    if not query_terms:
+        return [], False
+
+    candidates = db.events.find(
+        build_query(user_id, query_terms),
+        {"search_terms": 1, "name_terms": 1, "created_at": 1},
+        session=session,
+    ).batch_size(CANDIDATE_BATCH_SIZE)
+
+    # Newer events first among equal scores
+    offset = (page - 1) * page_size
+    ranked = heapq.nlargest(
+        offset + page_size + 1,
+        candidates,
+        key=lambda doc: (score(doc, query_terms), doc.get("created_at") or datetime.min, doc["_id"]),
+    )
+    page_ids = [doc["_id"] for doc in ranked[offset:offset + page_size]]
+    if not page_ids:
+        return [], False
+
+    docs = {doc["_id"]: doc for doc in db.events.find({"_id": {"$in": page_ids}}, session=session)}
+    events = [docs[event_id] for event_id in page_ids if event_id in docs]
+    return events, len(ranked) > offset + page_size
@@ -1,10 +1,21 @@
 import pytest
 from flask import Flask
 from bson import ObjectId
+from bson.timestamp import Timestamp
 import pymongo
+from pymongo import ReadPreference
 import os
-
-from app import create_app
+import gzip
+import json
+import requests
+from datetime import datetime, timedelta
+from flask import url_for
+
+from app import ICS_CLIENT_URL, create_app
+from breaker import CircuitBreaker
+from mongo import INITIALIZED_ENV, LazyDatabase, advance_session, causal_token, init_database_once
+import http_cache
+import search
 
 @pytest.fixture(scope="session")
 def flask_app():
@@ -45,12 +56,28 @@ def test_create_user(client, mongodb):
     assert user is not None
     assert user["username"] ==  "testuser"
 
+def test_create_user_taken_username(client, mongodb):
+    """
+    test_create_user_taken_username tests that a second sign-up with a taken username is refused.
+    """
+    users = mongodb["dot-ics"].users
+    users.delete_many({"username": "takenuser"})
+    users.insert_one({"username": "takenuser", "password": "password"})
+
+    response = client.post('/create_user', data=dict(
+        username='takenuser',
+        password='other'
+    ))
+
+    assert b"Please choose a different username" in response.data
+    assert users.count_documents({"username": "takenuser"}) == 1
+
 def test_login(client, mongodb):
     """
     test_login tests logging in with the created user.
     """
 
-    mongodb["dot-ics"].users.delete_one({"username": "testuser", "password": "password"})
+    mongodb["dot-ics"].users.delete_many({"username": "testuser"})
     mongodb["dot-ics"].users.insert_one({"username": "testuser", "password": "password"})
 
     response = client.post('/login', data=dict(
@@ -67,7 +94,7 @@ def test_logout(client, mongodb):
     test_logout tests logging out the user.
     """
 
-    mongodb["dot-ics"].users.delete_one({"username": "testuser", "password": "password"})
+    mongodb["dot-ics"].users.delete_many({"username": "testuser"})
     mongodb["dot-ics"].users.insert_one({"username": "testuser", "password": "password"})
 
     client.post('/login', data=dict(
@@ -86,7 +113,7 @@ def test_index_page(client, mongodb):
     test_index_page tests the index page when a user is logged in.
     """
 
-    mongodb["dot-ics"].users.delete_one({"username": "testuser1", "password": "password1"})
+    mongodb["dot-ics"].users.delete_many({"username": "testuser1"})
     user =  mongodb["dot-ics"].users.insert_one({"username": "testuser1", "password": "password1"})
 
     event = mongodb["dot-ics"].events.insert_one({
@@ -113,7 +140,7 @@ def test_generate_event(client, mongodb, monkeypatch):
     test_generate_event tests the route to take a prompt and generate an event in the database
     and mock the ML client's /run-client response.
     """
-    mongodb["dot-ics"].users.delete_one({"username": "testuser", "password": "password"})
+    mongodb["dot-ics"].users.delete_many({"username": "testuser"})
     user = mongodb["dot-ics"].users.insert_one({"username": "testuser", "password": "password"})
 
     # Monkeypatch the ML client call to /run-client
@@ -160,7 +187,38 @@ def test_generate_event(client, mongodb, monkeypatch):
     assert event is not None
 
 
+def test_generate_event_sends_text(client, mongodb, monkeypatch):
+    """
+    test_generate_event_sends_text tests that the entry's text and owner are sent
+    to the ics-client, so it does not have to read the entry back.
+    """
+    mongodb["dot-ics"].users.delete_many({"username": "textuser"})
+    user = mongodb["dot-ics"].users.insert_one({"username": "textuser", "password": "password"})
+    sent = []
+
+    def mock_post(url, json, timeout):
+        sent.append(json)
+
+        class MockResponse:
+            status_code = 200
+            def json(self):
+                return {"status": "updated", "entry_id": sent[0]["entry_id"]}
+        return MockResponse()
+
+    monkeypatch.setattr("requests.post", mock_post)
+    client.post('/login', data=dict(username='textuser', password='password'))
+
+    client.post('/generate-event', data={"event-description-input": "Lunch with Sam on Friday at noon"})
+
+    assert sent == [{
+        "entry_id": sent[0]["entry_id"],
+        "text": "Lunch with Sam on Friday at noon",
+        "user_id": str(user.inserted_id),
+    }]
+
+
 def test_download(client,mongodb):
+    mongodb["dot-ics"].users.delete_many({"username": "testuser"})
     user =  mongodb["dot-ics"].users.insert_one({"username": "testuser", "password": "password"})
 
     event = mongodb["dot-ics"].events.insert_one({
@@ -181,6 +239,7 @@ def test_download(client,mongodb):
 
 
 def test_delete(client, mongodb):
+    mongodb["dot-ics"].users.delete_many({"username": "testuser"})
     user =  mongodb["dot-ics"].users.insert_one({"username": "testuser", "password": "password"})
 
     event = mongodb["dot-ics"].events.insert_one({
@@ -199,9 +258,707 @@ def test_delete(client, mongodb):
     assert check is None
 
 
+def test_conflicts(client, mongodb):
+    """
+    test_conflicts tests that the conflicts stored by the ics-client show on the index page,
+    and go away once the conflicting event is deleted.
+    """
+    mongodb["dot-ics"].users.delete_many({"username": "conflictuser"})
+    user = mongodb["dot-ics"].users.insert_one({"username": "conflictuser", "password": "password"})
+    lunch = mongodb["dot-ics"].events.insert_one({
+        "user_id": user.inserted_id,
+        "event_data": {"name": "Lunch", "start": datetime(2025, 5, 1, 16), "end": datetime(2025, 5, 1, 17)},
+    })
+    call = mongodb["dot-ics"].events.insert_one({
+        "user_id": user.inserted_id,
+        "event_data": {"name": "Call", "start": datetime(2025, 5, 1, 16, 30), "end": None},
+        "conflicts": [{"id": lunch.inserted_id, "name": "Lunch", "start": datetime(2025, 5, 1, 16),
+                       "all_day": False, "timezone": "America/New_York"}],
+    })
+    client.post('/login', data=dict(username='conflictuser', password='password'))
+
+    response = client.get('/')
+    assert b'<div class="event-conflict">' in response.data
+    assert b"Lunch (May 01, 2025 12:00PM)" in response.data
+
+    client.get(f"/delete/{lunch.inserted_id}")
+
+    assert mongodb["dot-ics"].events.find_one({"_id": call.inserted_id})["conflicts"] == []
+    assert b'<div class="event-conflict">' not in client.get('/').data
+
+
 def test_error_handling(client):
     """
     test_error_handling tests error handling route for the application.
     """
     response = client.get('/nonexistent_route')
-    assert  b"error" in response.data
\ No newline at end of file
+    assert  b"error" in response.data
+
+def test_download_conditional(client, mongodb):
+    """
+    test_download_conditional tests that downloads carry validators and answer 304.
+    """
+    mongodb["dot-ics"].users.delete_many({"username": "testuser"})
+    user = mongodb["dot-ics"].users.insert_one({"username": "testuser", "password": "password"})
+
+    event = mongodb["dot-ics"].events.insert_one({
+        "user_id": user.inserted_id,
+        "event_data": {"name": "Cached Event"},
+        "ics_file": "BEGIN:VCALENDAR\nEND:VCALENDAR",
+        "created_at": datetime(2025, 4, 21, 10, 0, 0)
+    })
+
+    response = client.get(f"/download/{str(event.inserted_id)}")
+    etag = response.headers["ETag"]
+
+    assert response.status_code == 200
+    assert response.headers["Last-Modified"]
+
+    response = client.get(f"/download/{str(event.inserted_id)}", headers={"If-None-Match": etag})
+
+    assert response.status_code == 304
+    assert response.data == b""
+
+
+def test_index_compressed(client, mongodb):
+    """
+    test_index_compressed tests that the index page is gzip compressed when accepted.
+    """
+    mongodb["dot-ics"].users.delete_many({"username": "testuser1"})
+    mongodb["dot-ics"].users.insert_one({"username": "testuser1", "password": "password1"})
+
+    client.post('/login', data=dict(
+        username='testuser1',
+        password='password1'
+    ), follow_redirects=True)
+
+    response = client.get('/', headers={"Accept-Encoding": "gzip"})
+
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert b"ICS File Generator" in gzip.decompress(response.data)
+
+
+def test_static_fingerprint(client):
+    """
+    test_static_fingerprint tests that fingerprinted static assets are cached long term.
+    """
+    with client.application.test_request_context():
+        url = url_for("static", filename="styles.css")
+
+    assert "?v=" in url
+
+    response = client.get(url)
+
+    assert response.status_code == 200
+    assert "immutable" in response.headers["Cache-Control"]
+    assert "no-cache" not in response.headers["Cache-Control"]
+
+
+def test_static_compressed(client):
+    """
+    test_static_compressed tests that static assets are compressed with a strong ETag of their own,
+    which answers 304.
+    """
+    with client.application.test_request_context():
+        url = url_for("static", filename="styles.css")
+    plain = client.get(url)
+
+    response = client.get(url, headers={"Accept-Encoding": "gzip"})
+
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert gzip.decompress(response.data) == plain.data
+    assert response.headers["ETag"] == plain.headers["ETag"][:-1] + '-gzip"'
+    assert "immutable" in response.headers["Cache-Control"]
+
+    response = client.get(url, headers={"Accept-Encoding": "gzip", "If-None-Match": response.headers["ETag"]})
+
+    assert response.status_code == 304
+    assert response.data == b""
+
+
+def test_database_initialized_once(flask_app):
+    """
+    test_database_initialized_once tests that collections are only dropped by the first app created.
+    """
+    assert os.environ[INITIALIZED_ENV] == "1"
+    assert init_database_once(flask_app.extensions["mongo"]) is False
+
+
+def test_lazy_database_client_per_process(flask_app, monkeypatch):
+    """
+    test_lazy_database_client_per_process tests that a forked process gets its own MongoClient.
+    """
+    db = flask_app.extensions["mongo"]
+    parent_client = db.client
+
+    assert db.client is parent_client
+
+    monkeypatch.setattr(os, "getpid", lambda: -1)
+
+    assert db.client is not parent_client
+
+
+def test_bulk_delete(client, mongodb):
+    """
+    test_bulk_delete tests deleting several events owned by the user in one request.
+    """
+    mongodb["dot-ics"].users.delete_many({"username": "bulkuser"})
+    user = mongodb["dot-ics"].users.insert_one({"username": "bulkuser", "password": "password"})
+    other = mongodb["dot-ics"].users.insert_one({"username": "otheruser", "password": "password"})
+
+    owned = mongodb["dot-ics"].events.insert_many([
+        {"user_id": user.inserted_id, "text": "one"},
+        {"user_id": user.inserted_id, "text": "two"},
+    ]).inserted_ids
+    not_owned = mongodb["dot-ics"].events.insert_one({"user_id": other.inserted_id, "text": "three"})
+
+    client.post('/login', data=dict(
+        username='bulkuser',
+        password='password'
+    ), follow_redirects=True)
+
+    ids = [str(owned[0]), str(owned[1]), str(not_owned.inserted_id), "not-an-id"]
+    response = client.post('/events/bulk-delete', json={"ids": ids})
+    data = response.get_json()
+
+    assert response.status_code == 200
+    assert data["deleted"] == 2
+    assert data["results"][str(owned[0])] == "deleted"
+    assert data["results"][str(not_owned.inserted_id)] == "not_found"
+    assert data["results"]["not-an-id"] == "invalid_id"
+    assert mongodb["dot-ics"].events.count_documents({"_id": {"$in": owned}}) == 0
+    assert mongodb["dot-ics"].events.find_one({"_id": not_owned.inserted_id}) is not None
+
+
+def test_bulk_regenerate(client, mongodb, monkeypatch):
+    """
+    test_bulk_regenerate tests regenerating several events and reporting a result per id,
+    with one request for the events split off the same entry.
+    """
+    mongodb["dot-ics"].users.delete_many({"username": "bulkuser"})
+    user = mongodb["dot-ics"].users.insert_one({"username": "bulkuser", "password": "password"})
+
+    good, bad = mongodb["dot-ics"].events.insert_many([
+        {"user_id": user.inserted_id, "text": "Lunch tomorrow at noon"},
+        {"user_id": user.inserted_id, "text": "???"},
+    ]).inserted_ids
+    split_off = mongodb["dot-ics"].events.insert_many([
+        {"user_id": user.inserted_id, "text": "Lunch tomorrow at noon", "source_entry_id": good},
+        {"user_id": user.inserted_id, "text": "Lunch tomorrow at noon", "source_entry_id": good},
+    ]).inserted_ids
+    calls = []
+
+    class MockResponse:
+        def __init__(self, status_code, data):
+            self.status_code = status_code
+            self.data = data
+        def json(self):
+            return self.data
+
+    def mock_post(url, json, timeout):
+        assert "/run-client" in url
+        calls.append(json["entry_id"])
+        if json["entry_id"] in (str(good), *map(str, split_off)):
+            return MockResponse(200, {"status": "updated", "entry_id": json["entry_id"]})
+        return MockResponse(401, {"status": "error", "error_code": 401})
+
+    monkeypatch.setattr("requests.post", mock_post)
+
+    client.post('/login', data=dict(
+        username='bulkuser',
+        password='password'
+    ), follow_redirects=True)
+
+    ids = [str(split_off[0]), str(good), str(bad), str(split_off[1]), str(ObjectId())]
+    response = client.post('/events/bulk-regenerate', json={"ids": ids})
+    results = response.get_json()["results"]
+
+    assert results[str(good)] == {"status": "updated"}
+    assert results[str(split_off[0])] == results[str(split_off[1])] == {"status": "updated"}
+    assert results[str(bad)] == {"status": "error", "error_code": 401}
+    assert results[ids[-1]] == {"status": "not_found"}
+    assert sorted(calls) == sorted([str(split_off[0]), str(bad)])
+
+
+def test_bulk_request_requires_ids(client, mongodb):
+    """
+    test_bulk_request_requires_ids tests that bulk requests without ids are rejected.
+    """
+    mongodb["dot-ics"].users.delete_many({"username": "bulkuser"})
+    mongodb["dot-ics"].users.insert_one({"username": "bulkuser", "password": "password"})
+
+    client.post('/login', data=dict(
+        username='bulkuser',
+        password='password'
+    ), follow_redirects=True)
+
+    response = client.post('/events/bulk-delete', json={"ids": []})
+
+    assert response.status_code == 400
+
+
+def test_occurrences(client, mongodb):
+    """
+    test_occurrences tests listing the occurrences of the user's recurring events in a window.
+    """
+    mongodb["dot-ics"].users.delete_many({"username": "seriesuser"})
+    user = mongodb["dot-ics"].users.insert_one({"username": "seriesuser", "password": "password"})
+
+    mongodb["dot-ics"].events.insert_one({
+        "user_id": user.inserted_id,
+        "event_data": {"name": "Standup"},
+        "series": {
+            "rule": {"freq": "WEEKLY", "interval": 1, "byday": ["MO", "TU", "WE", "TH", "FR"],
+                     "count": None, "until": None},
+            "dtstart": datetime(2025, 3, 3, 14, 0),
+            "until": None,
+            "duration": 900,
+            "all_day": False,
+            "timezone": "America/New_York",
+        },
+    })
+
+    client.post('/login', data=dict(
+        username='seriesuser',
+        password='password'
+    ), follow_redirects=True)
+
+    response = client.get('/occurrences?start=2025-03-10&end=2025-03-17')
+    occurrences = response.get_json()["occurrences"]
+
+    assert response.status_code == 200
+    assert len(occurrences) == 5
+    assert occurrences[0]["name"] == "Standup"
+    assert occurrences[0]["start"] == "2025-03-10T13:00:00Z"
+
+    response = client.get('/occurrences?start=2025-03-17&end=2025-03-10')
+
+    assert response.status_code == 400
+
+
+def test_feed(client, mongodb):
+    """
+    test_feed tests the subscription feed: the token link, the calendar body,
+    304s for unchanged feeds, and updates after a delete.
+    """
+    mongodb["dot-ics"].users.delete_many({"username": "feeduser"})
+    user = mongodb["dot-ics"].users.insert_one({"username": "feeduser", "password": "password"})
+
+    events = mongodb["dot-ics"].events.insert_many([
+        {
+            "user_id": user.inserted_id,
+            "event_data": {"name": name},
+            "ics_file": f"BEGIN:VCALENDAR\r\nBEGIN:VEVENT\r\nSUMMARY:{name}\r\nEND:VEVENT\r\nEND:VCALENDAR\r\n".encode(),
+        }
+        for name in ("Feed Event 1", "Feed Event 2")
+    ]).inserted_ids
+
+    client.post('/login', data=dict(
+        username='feeduser',
+        password='password'
+    ), follow_redirects=True)
+
+    response = client.get('/')
+    token = mongodb["dot-ics"].users.find_one({"_id": user.inserted_id})["feed_token"]
+
+    assert f"/feed/{token}.ics".encode() in response.data
+
+    response = client.get(f"/feed/{token}.ics")
+    etag = response.headers["ETag"]
+
+    assert response.status_code == 200
+    assert 'text/calendar' in response.content_type
+    assert response.data.count(b"BEGIN:VEVENT") == 2
+    assert b"SUMMARY:Feed Event 1" in response.data
+
+    response = client.get(f"/feed/{token}.ics", headers={"If-None-Match": etag})
+
+    assert response.status_code == 304
+
+    client.get(f"/delete/{str(events[0])}")
+    response = client.get(f"/feed/{token}.ics", headers={"If-None-Match": etag})
+
+    assert response.status_code == 200
+    assert response.data.count(b"BEGIN:VEVENT") == 1
+    assert b"SUMMARY:Feed Event 2" in response.data
+
+    assert client.get("/feed/not-a-token.ics").status_code == 404
+
+
+def test_feed_compressed_not_modified(client, mongodb, monkeypatch):
+    """
+    test_feed_compressed_not_modified tests that a poll with the ETag of a compressed feed
+    or download gets a 304 without compressing the body again.
+    """
+    mongodb["dot-ics"].users.delete_many({"username": "gzipfeeduser"})
+    user = mongodb["dot-ics"].users.insert_one({"username": "gzipfeeduser", "password": "password"})
+    event = mongodb["dot-ics"].events.insert_one({
+        "user_id": user.inserted_id,
+        "event_data": {"name": "Gzip Event"},
+        "ics_file": b"BEGIN:VCALENDAR\r\nBEGIN:VEVENT\r\nSUMMARY:Gzip Event\r\nEND:VEVENT\r\nEND:VCALENDAR\r\n",
+    }).inserted_id
+    monkeypatch.setattr("http_cache.COMPRESS_MIN_SIZE", 0)
+    compressed = []
+    compress = http_cache._compress
+
+    def counting_compress(data, encoding):
+        compressed.append(encoding)
+        return compress(data, encoding)
+
+    monkeypatch.setattr("http_cache._compress", counting_compress)
+
+    client.post('/login', data=dict(
+        username='gzipfeeduser',
+        password='password'
+    ), follow_redirects=True)
+    client.get('/')
+    token = mongodb["dot-ics"].users.find_one({"_id": user.inserted_id})["feed_token"]
+
+    for url in (f"/feed/{token}.ics", f"/download/{event}"):
+        response = client.get(url, headers={"Accept-Encoding": "gzip"})
+        etag = response.headers["ETag"]
+
+        assert response.headers["Content-Encoding"] == "gzip"
+        assert etag.endswith('-gzip"')
+
+        compressed.clear()
+        response = client.get(url, headers={"Accept-Encoding": "gzip", "If-None-Match": etag})
+
+        assert response.status_code == 304
+        assert response.headers["ETag"] == etag
+        assert compressed == []
+
+
+def test_search(client, mongodb):
+    """
+    test_search tests searching the user's events by word prefixes, ranked and scoped to the user.
+    """
+    mongodb["dot-ics"].users.delete_many({"username": "searchuser"})
+    user = mongodb["dot-ics"].users.insert_one({"username": "searchuser", "password": "password"})
+    other = mongodb["dot-ics"].users.insert_one({"username": "othersearchuser", "password": "password"})
+
+    def event(user_id, name, location, created_at):
+        terms = search.tokenize(name) + search.tokenize(location)
+        return {
+            "user_id": user_id,
+            "event_data": {"name": name, "location": location},
+            "search_terms": sorted(set(terms)),
+            "name_terms": sorted(set(search.tokenize(name))),
+            "created_at": created_at,
+        }
+
+    mongodb["dot-ics"].events.insert_many([
+        event(user.inserted_id, "Team lunch", "Joe's Pizza", datetime(2025, 4, 1)),
+        event(user.inserted_id, "Dentist", "Lunchtime clinic", datetime(2025, 4, 2)),
+        event(user.inserted_id, "Gym", "Downtown", datetime(2025, 4, 3)),
+        event(other.inserted_id, "Lunch with Sam", "Cafe", datetime(2025, 4, 4)),
+    ])
+
+    client.post('/login', data=dict(
+        username='searchuser',
+        password='password'
+    ), follow_redirects=True)
+
+    response = client.get('/search?q=lunc', headers={"Accept": "application/json"})
+    names = [event["name"] for event in response.get_json()["events"]]
+
+    assert names == ["Team lunch", "Dentist"]
+
+    response = client.get('/search?q=lunch+joe', headers={"Accept": "application/json"})
+
+    assert [event["name"] for event in response.get_json()["events"]] == ["Team lunch"]
+
+    response = client.get('/search?q=gym')
+
+    assert b"Gym" in response.data
+    assert b"Team lunch" not in response.data
+
+
+def test_search_ranks_all_matches(mongodb):
+    """
+    test_search_ranks_all_matches tests that an old exact name match outranks many newer
+    prefix matches, and that paging reaches every match.
+    """
+    user_id = ObjectId()
+    events = [{
+        "user_id": user_id,
+        "search_terms": ["lunchtime", "yoga"],
+        "name_terms": ["yoga"],
+        "created_at": datetime(2025, 4, 1) + timedelta(minutes=minute),
+    } for minute in range(1100)]
+    events.append({"user_id": user_id, "search_terms": ["lunch"], "name_terms": ["lunch"],
+                   "created_at": datetime(2024, 1, 1)})
+    mongodb["dot-ics"].events.insert_many(events)
+
+    found, has_more = search.search_events(mongodb["dot-ics"], user_id, "lunch")
+
+    assert found[0]["created_at"] == datetime(2024, 1, 1)
+    assert found[1]["created_at"] == datetime(2025, 4, 1) + timedelta(minutes=1099)
+    assert has_more
+    found, has_more = search.search_events(mongodb["dot-ics"], user_id, "lunch", page=56)
+    assert len(found) == 1
+    assert not has_more
+
+
+def test_prefetch_event(client, mongodb, monkeypatch):
+    """
+    test_prefetch_event tests forwarding a settled description to the ics-client.
+    """
+    mongodb["dot-ics"].users.delete_many({"username": "prefetchuser"})
+    user = mongodb["dot-ics"].users.insert_one({"username": "prefetchuser", "password": "password"})
+    calls = []
+
+    def mock_post(url, json, timeout):
+        calls.append((url, json))
+        class MockResponse:
+            status_code = 202
+            def json(self):
+                return {"status": "started"}
+        return MockResponse()
+
+    monkeypatch.setattr("requests.post", mock_post)
+
+    client.post('/login', data=dict(
+        username='prefetchuser',
+        password='password'
+    ), follow_redirects=True)
+
+    response = client.post('/prefetch-event', json={"text": "Lunch with Sam tomorrow at noon"})
+
+    assert response.status_code == 202
+    assert response.get_json() == {"status": "started"}
+    assert calls[0][0].endswith("/prefetch")
+    assert calls[0][1] == {"user_id": str(user.inserted_id), "text": "Lunch with Sam tomorrow at noon"}
+
+    response = client.post('/prefetch-event', json={"text": "Lunch"})
+
+    assert response.get_json() == {"status": "skipped"}
+    assert len(calls) == 1
+
+
+def test_generate_event_stream(client, mongodb, monkeypatch):
+    """
+    test_generate_event_stream tests submitting an entry for streaming, which starts
+    its generation, then relaying the ics-client's Server-Sent Events.
+    """
+    mongodb["dot-ics"].users.delete_many({"username": "streamuser"})
+    user = mongodb["dot-ics"].users.insert_one({"username": "streamuser", "password": "password"})
+    calls = []
+
+    def mock_post(url, json, timeout, stream=False):
+        calls.append((url, json))
+        class MockResponse:
+            status_code = 200
+            def iter_content(self, chunk_size):
+                yield b'event: field\ndata: {"index": 0, "field": "name", "value": "Lunch"}\n\n'
+                yield b'event: done\ndata: {"entry_ids": ["' + json["entry_id"].encode() + b'"]}\n\n'
+            def close(self):
+                pass
+        return MockResponse()
+
+    monkeypatch.setattr("requests.post", mock_post)
+
+    client.post('/login', data=dict(
+        username='streamuser',
+        password='password'
+    ), follow_redirects=True)
+
+    response = client.post('/generate-event', data={"event-description-input": "Lunch tomorrow at noon"},
+                           headers={"Accept": "application/json"})
+
+    assert response.status_code == 202
+    entry_id = response.get_json()["entry_id"]
+    assert response.get_json()["stream_url"] == f"/generate-event/{entry_id}/stream"
+    payload = {"entry_id": entry_id, "text": "Lunch tomorrow at noon", "user_id": str(user.inserted_id)}
+    # Generation starts without waiting for the browser to open the stream
+    assert calls == [(f"{ICS_CLIENT_URL}/run-client/start", payload)]
+
+    response = client.get(f"/generate-event/{entry_id}/stream")
+    body = response.get_data(as_text=True)
+
+    assert response.mimetype == "text/event-stream"
+    assert "Content-Encoding" not in response.headers
+    assert calls[1:] == [(f"{ICS_CLIENT_URL}/run-client/stream", payload)]
+    assert 'event: field\ndata: {"index": 0, "field": "name", "value": "Lunch"}' in body
+    assert f'event: done\ndata: {{"entry_ids": ["{entry_id}"]}}' in body
+
+    # Once generated, reconnecting does not generate again
+    mongodb["dot-ics"].events.update_one({"_id": ObjectId(entry_id)}, {"$set": {"ics_file_path": "events/x.ics"}})
+    response = client.get(f"/generate-event/{entry_id}/stream")
+
+    assert response.get_data(as_text=True) == f'event: done\ndata: {{"entry_ids": ["{entry_id}"]}}\n\n'
+    assert len(calls) == 2
+    assert client.get(f"/generate-event/{ObjectId()}/stream").status_code == 404
+
+
+def test_generate_event_fails_fast_when_ics_client_is_down(client, mongodb, monkeypatch):
+    """
+    test_generate_event_fails_fast_when_ics_client_is_down tests that the ics-client
+    circuit opens after repeated failures and is reported in the metrics.
+    """
+    mongodb["dot-ics"].users.delete_many({"username": "breakeruser"})
+    mongodb["dot-ics"].users.insert_one({"username": "breakeruser", "password": "password"})
+    monkeypatch.setattr("app.ics_client_breaker", CircuitBreaker("ics_client", failure_threshold=2))
+    calls = []
+
+    def mock_post(url, json, timeout):
+        calls.append(url)
+        raise requests.exceptions.ConnectTimeout("timed out")
+
+    monkeypatch.setattr("requests.post", mock_post)
+
+    client.post('/login', data=dict(
+        username='breakeruser',
+        password='password'
+    ), follow_redirects=True)
+
+    for _ in range(3):
+        response = client.post('/generate-event', data={"event-description-input": "Lunch tomorrow"})
+        assert response.status_code == 500
+
+    assert len(calls) == 2
+    metrics = client.get('/metrics').get_data(as_text=True)
+    assert 'circuit_breaker_state{breaker="ics_client",state="open"} 1' in metrics
+    assert 'circuit_breaker_rejected_total{breaker="ics_client"} 1' in metrics
+
+
+def test_read_preference_routing(monkeypatch):
+    """
+    test_read_preference_routing tests that routed reads use the configured read preference
+    with majority read concern, and stay on the primary by default.
+    """
+    monkeypatch.delenv("MONGO_READ_PREFERENCE", raising=False)
+    db = LazyDatabase(os.environ["MONGO_URI"], "dot-ics")
+    assert not db.routes_reads
+    assert db.reads.read_preference == ReadPreference.PRIMARY
+
+    db = LazyDatabase(os.environ["MONGO_URI"], "dot-ics", read_preference="secondaryPreferred")
+    assert db.routes_reads
+    assert db.reads.read_preference == ReadPreference.SECONDARY_PREFERRED
+    assert db.reads.read_concern.level == "majority"
+
+    with pytest.raises(ValueError):
+        LazyDatabase(os.environ["MONGO_URI"], "dot-ics", read_preference="secondaries").reads
+
+
+def test_causal_token_round_trip():
+    """
+    test_causal_token_round_trip tests carrying a session's position to a later session.
+    """
+    class FakeSession:
+        def __init__(self, operation_time=None, cluster_time=None):
+            self.operation_time = operation_time
+            self.cluster_time = cluster_time
+        def advance_operation_time(self, operation_time):
+            self.operation_time = operation_time
+        def advance_cluster_time(self, cluster_time):
+            self.cluster_time = cluster_time
+
+    cluster_time = {"clusterTime": Timestamp(1700000000, 7), "signature": {"hash": b"\0" * 20, "keyId": 0}}
+    token = causal_token(FakeSession(Timestamp(1700000000, 5), cluster_time))
+    assert json.loads(json.dumps(token)) == token
+
+    later = FakeSession()
+    advance_session(later, token)
+    assert later.operation_time == Timestamp(1700000000, 5)
+    assert later.cluster_time["clusterTime"] == Timestamp(1700000000, 7)
+
+    assert causal_token(FakeSession()) is None
+    advance_session(later, {"operation_time": "garbage"})
+    assert later.operation_time == Timestamp(1700000000, 5)
+
+
+@pytest.mark.skipif(not os.getenv("MONGO_REPLICA_SET_URI"), reason="needs a replica set in MONGO_REPLICA_SET_URI")
+def test_causal_reads_from_secondaries():
+    """
+    test_causal_reads_from_secondaries tests that a read routed to a secondary in a later
+    session sees a write made in an earlier one, against a real replica set.
+    """
+    db = LazyDatabase(os.environ["MONGO_REPLICA_SET_URI"], "test_read_routing", read_preference="secondaryPreferred")
+    db.events.drop()
+
+    with db.client.start_session(causal_consistency=True) as session:
+        entry_id = db.events.insert_one({"text": "written on the primary"}, session=session).inserted_id
+        token = json.loads(json.dumps(causal_token(session)))
+
+    with db.client.start_session(causal_consistency=True) as session:
+        advance_session(session, token)
+        assert db.reads.events.find_one({"_id": entry_id}, session=session) is not None
+
+    db.events.drop()
+    db.close()
+
+
+def test_upcoming_and_range(client, mongodb):
+    """
+    test_upcoming_and_range tests listing events by when they happen, with
+    occurrences of recurring events merged in start order.
+    """
+    mongodb["dot-ics"].users.delete_many({"username": "scheduleuser"})
+    user = mongodb["dot-ics"].users.insert_one({"username": "scheduleuser", "password": "password"})
+    user_id = user.inserted_id
+    now = datetime.utcnow().replace(microsecond=0)
+    mongodb["dot-ics"].events.insert_many([
+        {"user_id": user_id, "created_at": now,
+         "event_data": {"name": "Past", "start": now - timedelta(days=1), "end": None}},
+        {"user_id": user_id, "created_at": now,
+         "event_data": {"name": "Tomorrow", "start": now + timedelta(days=1), "end": None,
+                        "timezone": "America/New_York"}},
+        {"user_id": user_id, "created_at": now,
+         "event_data": {"name": "Next month", "start": now + timedelta(days=40), "end": None}},
+        {"user_id": user_id, "created_at": now,
+         "event_data": {"name": "Standup", "start": now + timedelta(hours=1), "end": None,
+                        "recurrence": {"freq": "DAILY", "interval": 2, "byday": [], "count": None, "until": None}},
+         "series": {"rule": {"freq": "DAILY", "interval": 2, "byday": [], "count": None, "until": None},
+                    "dtstart": now + timedelta(hours=1), "until": None, "duration": 0,
+                    "all_day": False, "timezone": "UTC"}},
+    ])
+
+    client.post('/login', data=dict(
+        username='scheduleuser',
+        password='password'
+    ), follow_redirects=True)
+
+    response = client.get('/upcoming', headers={"Accept": "application/json"})
+    names = [event["name"] for event in response.get_json()["events"]]
+    assert names == ["Standup", "Tomorrow", "Standup", "Standup", "Standup"]
+    assert response.get_json()["events"][1]["start"] == (now + timedelta(days=1)).isoformat() + "Z"
+
+    response = client.get('/upcoming?days=60')
+    assert b"Next month" in response.data
+    assert b"Past" not in response.data
+
+    start = (now + timedelta(days=39)).strftime("%Y-%m-%d")
+    end = (now + timedelta(days=42)).strftime("%Y-%m-%d")
+    response = client.get(f'/range?start={start}&end={end}', headers={"Accept": "application/json"})
+    names = [event["name"] for event in response.get_json()["events"]]
+    assert "Next month" in names
+    assert "Tomorrow" not in names
+
+    assert client.get('/range?start=2025-02-01&end=2025-01-01').status_code == 400
+
+
+def test_generate_event_over_quota(client, mongodb, monkeypatch):
+    """
+    test_generate_event_over_quota tests the message shown when the user's daily quota is used up.
+    """
+    mongodb["dot-ics"].users.delete_many({"username": "quotauser"})
+    mongodb["dot-ics"].users.insert_one({"username": "quotauser", "password": "password"})
+
+    def mock_post(url, json, timeout):
+        class MockResponse:
+            status_code = 429
+            def json(self):
+                return {"status": "error", "error_msg": "Daily event generation limit reached.", "error_code": 429}
+        return MockResponse()
+
+    monkeypatch.setattr("requests.post", mock_post)
+
+    client.post('/login', data=dict(
+        username='quotauser',
+        password='password'
+    ), follow_redirects=True)
+
+    response = client.post('/generate-event', data={"event-description-input": "Lunch tomorrow"})
+
+    assert b"reached today&#39;s limit" in response.data
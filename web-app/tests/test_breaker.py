@@ -0,0 +1,80 @@
+import breaker
+from breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, render_metrics
+
+
+def test_opens_after_consecutive_failures():
+    """
+    test_opens_after_consecutive_failures tests that only consecutive failures open the circuit.
+    """
+    circuit = CircuitBreaker("dep", failure_threshold=3, reset_timeout=30)
+
+    circuit.record_failure()
+    circuit.record_failure()
+    circuit.record_success()
+    circuit.record_failure()
+    circuit.record_failure()
+    assert circuit.state == CLOSED
+
+    circuit.record_failure()
+    assert circuit.state == OPEN
+    assert not circuit.allow()
+    assert circuit.rejected_total == 1
+    assert circuit.opened_total == 1
+
+
+def test_half_open_trial(monkeypatch):
+    """
+    test_half_open_trial tests that a trial call after the reset timeout closes or reopens the circuit.
+    """
+    now = [1000.0]
+    monkeypatch.setattr(breaker.time, "monotonic", lambda: now[0])
+    circuit = CircuitBreaker("dep", failure_threshold=1, reset_timeout=30)
+
+    circuit.record_failure()
+    now[0] += 30
+    assert circuit.state == HALF_OPEN
+    assert circuit.allow()
+    assert not circuit.allow()
+
+    # A failed trial reopens the circuit
+    circuit.record_failure()
+    assert circuit.state == OPEN
+    assert circuit.opened_total == 2
+
+    now[0] += 30
+    assert circuit.allow()
+    circuit.record_success()
+    assert circuit.state == CLOSED
+    assert circuit.allow()
+
+
+def test_lost_trial_is_retried(monkeypatch):
+    """
+    test_lost_trial_is_retried tests that a trial call without an outcome does not keep the circuit half-open forever.
+    """
+    now = [1000.0]
+    monkeypatch.setattr(breaker.time, "monotonic", lambda: now[0])
+    circuit = CircuitBreaker("dep", failure_threshold=1, reset_timeout=30)
+
+    circuit.record_failure()
+    now[0] += 30
+    assert circuit.allow()
+    now[0] += 30
+    assert circuit.allow()
+
+
+def test_render_metrics():
+    """
+    test_render_metrics tests the Prometheus text output.
+    """
+    circuit = CircuitBreaker("dep", failure_threshold=1)
+    circuit.record_failure()
+    circuit.allow()
+
+    text = render_metrics([circuit])
+
+    assert 'circuit_breaker_state{breaker="dep",state="open"} 1' in text
+    assert 'circuit_breaker_state{breaker="dep",state="closed"} 0' in text
+    assert 'circuit_breaker_failures_total{breaker="dep"} 1' in text
+    assert 'circuit_breaker_rejected_total{breaker="dep"} 1' in text
+    assert "# TYPE circuit_breaker_opened_total counter" in text
@@ -0,0 +1,51 @@
+from datetime import datetime, timedelta, timezone
+from unittest.mock import MagicMock
+
+from bson import ObjectId
+
+from feed import FeedCache, extract_components
+
+
+def ics(summary):
+    return f"BEGIN:VCALENDAR\nVERSION:2.0\nBEGIN:VEVENT\nSUMMARY:{summary}\nEND:VEVENT\nEND:VCALENDAR\n".encode()
+
+
+def test_extract_components():
+    """
+    test_extract_components tests extracting the VEVENT of a calendar file with CRLF line endings.
+    """
+    assert extract_components(ics("Lunch")) == b"BEGIN:VEVENT\r\nSUMMARY:Lunch\r\nEND:VEVENT\r\n"
+    assert extract_components(None) == b""
+
+
+def test_feed_cache_patches_incrementally():
+    """
+    test_feed_cache_patches_incrementally tests that a version change only fetches
+    new and updated events, and drops deleted ones.
+    """
+    user_id = ObjectId()
+    first, second, third = ObjectId(), ObjectId(), ObjectId()
+    db = MagicMock()
+    cache = FeedCache()
+
+    db.events.find.return_value.sort.return_value = [
+        {"_id": first, "ics_file": ics("First")},
+        {"_id": second, "ics_file": ics("Second")},
+    ]
+    body = cache.get(db, user_id, 1)
+
+    assert body.count(b"BEGIN:VEVENT") == 2
+    assert cache.get(db, user_id, 1) is body
+
+    db.events.find.reset_mock()
+    db.events.find.side_effect = [
+        [{"_id": second}, {"_id": third}],
+        [{"_id": third, "ics_file": ics("Third")}],
+    ]
+    body = cache.get(db, user_id, 2)
+
+    assert b"First" not in body
+    assert b"Second" in body and b"Third" in body
+    changed_query = db.events.find.call_args_list[1][0][0]
+    assert changed_query["$or"][0] == {"_id": {"$in": [third]}}
+    assert changed_query["$or"][1]["updated_at"]["$gt"] > datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(minutes=5)
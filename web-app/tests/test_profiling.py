@@ -0,0 +1,90 @@
+import time
+from collections import Counter
+
+from flask import Flask
+
+from profiling import ProfileStore, init_profiling, profile_headers
+
+
+def make_app(tmp_path, **kwargs):
+    """
+    Returns a small app with a slow route, profiled into tmp_path.
+    """
+    flask_app = Flask(__name__)
+
+    @flask_app.route("/slow")
+    def slow_route():
+        deadline = time.monotonic() + 0.05
+        while time.monotonic() < deadline:
+            pass
+        return {"forwarded": profile_headers()}
+
+    store = init_profiling(flask_app, directory=str(tmp_path), interval=0.001, **kwargs)
+    return flask_app, store
+
+
+def test_disabled_registers_nothing(tmp_path):
+    """
+    test_disabled_registers_nothing tests that without a token or sample rate no hooks or routes are added.
+    """
+    flask_app, store = make_app(tmp_path, token="", sample_rate=0)
+
+    assert store is None
+    assert not flask_app.before_request_funcs
+    assert flask_app.test_client().get("/profiles").status_code == 404
+
+
+def test_profile_by_header(tmp_path):
+    """
+    test_profile_by_header tests that a request with the token is profiled, and the profile
+    can be listed and fetched with the token only.
+    """
+    flask_app, _ = make_app(tmp_path, token="secret", sample_rate=0)
+    client = flask_app.test_client()
+
+    response = client.get("/slow")
+    response.close()
+    assert "X-Profile-Id" not in response.headers
+    assert response.get_json() == {"forwarded": {}}
+
+    response = client.get("/slow", headers={"X-Profile": "secret"})
+    response.close()
+    name = response.headers["X-Profile-Id"]
+    assert response.get_json() == {"forwarded": {"X-Profile": "secret"}}
+
+    assert client.get("/profiles").status_code == 403
+    listed = client.get("/profiles", headers={"X-Profile": "secret"}).get_json()
+    assert [profile["name"] for profile in listed["profiles"]] == [name]
+
+    assert client.get(f"/profiles/{name}", headers={"X-Profile": "wrong"}).status_code == 403
+    profile = client.get(f"/profiles/{name}", headers={"X-Profile": "secret"}).get_data(as_text=True)
+    stack, count = profile.splitlines()[0].rsplit(" ", 1)
+    assert "slow_route (test_profiling.py:" in stack
+    assert int(count) > 0
+
+
+def test_profile_by_sample_rate(tmp_path):
+    """
+    test_profile_by_sample_rate tests that sampled requests are profiled without a token,
+    and that nothing is forwarded then.
+    """
+    flask_app, store = make_app(tmp_path, token="", sample_rate=1)
+
+    response = flask_app.test_client().get("/slow")
+    response.close()
+
+    assert response.get_json() == {"forwarded": {}}
+    assert store.names() == [response.headers["X-Profile-Id"]]
+
+
+def test_store_keeps_newest(tmp_path):
+    """
+    test_store_keeps_newest tests that only the newest max_files profiles are kept.
+    """
+    store = ProfileStore(str(tmp_path), max_files=2)
+    names = [f"20250501T00000{second}000000-GET-index-0.folded" for second in range(3)]
+    for name in names:
+        store.write(name, Counter({"index (app.py:1)": 1}))
+
+    assert store.names() == [names[2], names[1]]
+    assert (tmp_path / names[2]).read_text() == "index (app.py:1) 1\n"
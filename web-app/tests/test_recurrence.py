@@ -0,0 +1,121 @@
+from datetime import datetime, timedelta
+
+from recurrence import describe_rule, expand, expand_many, parse_window
+
+
+def weekday_standup(**rule):
+    """Every weekday at 9:00 New York time, 15 minutes long, starting Monday 2025-03-03."""
+    return {
+        "rule": {"freq": "WEEKLY", "interval": 1, "byday": ["MO", "TU", "WE", "TH", "FR"],
+                 "count": None, "until": None, **rule},
+        "dtstart": datetime(2025, 3, 3, 14, 0),  # 9:00 EST
+        "until": None,
+        "duration": 15 * 60,
+        "all_day": False,
+        "timezone": "America/New_York",
+    }
+
+
+def test_expand_weekly_window():
+    """
+    test_expand_weekly_window tests that only the occurrences inside the window are generated.
+    """
+    series = weekday_standup()
+    occurrences = list(expand(series, datetime(2025, 3, 5), datetime(2025, 3, 8)))
+
+    assert [start.day for start, _ in occurrences] == [5, 6, 7]
+    assert occurrences[0][1] - occurrences[0][0] == timedelta(minutes=15)
+
+
+def test_expand_keeps_local_time_across_dst():
+    """
+    test_expand_keeps_local_time_across_dst tests that occurrences stay at 9:00 local time.
+    """
+    series = weekday_standup()
+    before = next(iter(expand(series, datetime(2025, 3, 7), datetime(2025, 3, 8))))[0]
+    after = next(iter(expand(series, datetime(2025, 3, 10), datetime(2025, 3, 11))))[0]
+
+    assert before.hour == 14  # EST, UTC-5
+    assert after.hour == 13  # EDT, UTC-4
+
+
+def test_expand_far_window_matches_full_walk():
+    """
+    test_expand_far_window_matches_full_walk tests that jumping to a window far into a series
+    gives the same occurrences as expanding from the first instance.
+    """
+    series = weekday_standup(count=2000)
+    window = (datetime(2030, 6, 1), datetime(2030, 7, 1))
+    full = [occurrence for occurrence in expand(series, series["dtstart"], datetime(2040, 1, 1))
+            if window[0] <= occurrence[0] < window[1]]
+
+    assert list(expand(series, *window)) == full
+    assert len(full) == 20
+
+
+def test_expand_count_and_until():
+    """
+    test_expand_count_and_until tests that series stop after COUNT occurrences or at UNTIL.
+    """
+    counted = weekday_standup(count=3)
+    ended = weekday_standup()
+    ended["until"] = datetime(2025, 3, 4, 23, 59)
+
+    assert len(list(expand(counted, datetime(2025, 3, 1), datetime(2025, 4, 1)))) == 3
+    assert len(list(expand(ended, datetime(2025, 3, 1), datetime(2025, 4, 1)))) == 2
+
+
+def test_expand_monthly_skips_missing_days():
+    """
+    test_expand_monthly_skips_missing_days tests that a monthly series on the 31st skips shorter months.
+    """
+    series = {
+        "rule": {"freq": "MONTHLY", "interval": 1, "byday": [], "count": None, "until": None},
+        "dtstart": datetime(2025, 1, 31, 5),
+        "until": None,
+        "duration": 24 * 60 * 60,
+        "all_day": True,
+        "timezone": "America/New_York",
+    }
+    starts = [start for start, _ in expand(series, datetime(2025, 1, 1), datetime(2025, 6, 1))]
+
+    assert [(start.month, start.day) for start in starts] == [(1, 31), (3, 31), (5, 31)]
+    # Still local midnight once daylight saving time started
+    assert [start.hour for start in starts] == [5, 4, 4]
+
+
+def test_expand_many_merges_in_order():
+    """
+    test_expand_many_merges_in_order tests merging several series in start order with a limit.
+    """
+    daily = {
+        "rule": {"freq": "DAILY", "interval": 2, "byday": [], "count": None, "until": None},
+        "dtstart": datetime(2025, 3, 3, 12, 0),
+        "until": None,
+        "duration": 0,
+        "all_day": False,
+        "timezone": "UTC",
+    }
+    events = [{"_id": 1, "series": weekday_standup()}, {"_id": 2, "series": daily}]
+    merged = list(expand_many(events, datetime(2025, 3, 3), datetime(2025, 3, 10), limit=5))
+
+    assert len(merged) == 5
+    assert [start for start, _, _ in merged] == sorted(start for start, _, _ in merged)
+    assert [event["_id"] for _, _, event in merged] == [2, 1, 1, 2, 1]
+
+
+def test_describe_rule():
+    """
+    test_describe_rule tests the summary shown on the index page.
+    """
+    assert describe_rule({"freq": "WEEKLY", "interval": 2, "byday": ["MO", "WE"]}) == "Every 2 weeks on Mon, Wed"
+    assert describe_rule({"freq": "DAILY", "interval": 1, "count": 5}) == "Every day, 5 times"
+    assert describe_rule(None) == ""
+
+
+def test_parse_window():
+    """
+    test_parse_window tests parsing the window query parameters.
+    """
+    assert parse_window("2025-03-01", "2025-03-08") == (datetime(2025, 3, 1), datetime(2025, 3, 8))
+    assert parse_window("2025-03-01", None)[1] == datetime(2025, 4, 1)
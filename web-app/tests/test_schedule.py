@@ -0,0 +1,33 @@
+from datetime import datetime
+
+from bson import ObjectId
+
+from schedule import event_json, format_event_time
+
+
+def test_format_event_time_in_event_timezone():
+    """
+    test_format_event_time_in_event_timezone tests that UTC times are shown in the event's timezone.
+    """
+    event_data = {"start": datetime(2025, 4, 23, 22, 0), "end": None, "timezone": "America/New_York"}
+    assert format_event_time(event_data) == "Apr 23, 2025  6:00PM"
+    assert format_event_time(event_data, "end") == ""
+    assert format_event_time({"start": datetime(2025, 1, 10, 17, 30)}) == "Jan 10, 2025 12:30PM"
+
+
+def test_format_event_time_all_day_and_legacy():
+    """
+    test_format_event_time_all_day_and_legacy tests all-day events and values stored as strings.
+    """
+    assert format_event_time({"start": datetime(2025, 12, 25, 5), "all_day": True}) == "Dec 25, 2025"
+    assert format_event_time({"start": "Apr 23, 2025  6:00PM"}) == "Apr 23, 2025  6:00PM"
+    assert format_event_time(None) == ""
+
+
+def test_event_json():
+    """
+    test_event_json tests serializing event times as ISO 8601 UTC.
+    """
+    event_id = ObjectId()
+    event = {"_id": event_id, "event_data": {"name": "Lunch", "start": datetime(2025, 4, 23, 16, 0), "end": None}}
+    assert event_json(event) == {"id": str(event_id), "name": "Lunch", "start": "2025-04-23T16:00:00Z", "end": None}
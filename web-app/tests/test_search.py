@@ -0,0 +1,33 @@
+from search import build_query, score, tokenize
+
+
+def test_tokenize():
+    """
+    test_tokenize tests splitting text into lowercased words.
+    """
+    assert tokenize("Dinner at Joe's, 7PM") == ["dinner", "at", "joe", "s", "7pm"]
+    assert tokenize(None) == []
+
+
+def test_build_query_escapes_terms():
+    """
+    test_build_query_escapes_terms tests that each term becomes an anchored, escaped prefix match.
+    """
+    query = build_query("user", ["c++", "lunch"])
+
+    assert query["user_id"] == "user"
+    assert query["$and"] == [
+        {"search_terms": {"$regex": "^c\\+\\+"}},
+        {"search_terms": {"$regex": "^lunch"}},
+    ]
+
+
+def test_score_prefers_exact_and_name_matches():
+    """
+    test_score_prefers_exact_and_name_matches tests the ranking of candidates.
+    """
+    in_name = {"name_terms": ["lunch"], "search_terms": ["lunch", "pizza"]}
+    in_location = {"name_terms": ["dentist"], "search_terms": ["dentist", "lunch"]}
+    prefix_only = {"name_terms": ["lunchtime"], "search_terms": ["lunchtime"]}
+
+    assert score(in_name, ["lunch"]) > score(prefix_only, ["lunch"]) > score(in_location, ["lunch"])